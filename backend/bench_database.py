@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+数据库连接池基准测试脚本
+
+1. 对比“每次调用新建连接”（改造前）与连接池两种方式下
+   /message 和 /conversations 的吞吐量（requests/sec）
+2. 对比同步提交与后写队列两种方式下保存对话的p50/p99延迟和提交次数
+3. 大量并发客户端下，对比在事件循环中直接执行查询与使用数据库线程的吞吐量，
+   以及事件循环延迟（其它请求需要等待多久才能被处理）的p99；可通过io_latency模拟慢速存储（如机械硬盘、网络盘）
+
+用法：python bench_database.py [请求数]
+"""
+
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+_tmp_dir = tempfile.mkdtemp(prefix="pet_db_bench_")
+os.environ.setdefault("PET_DB_PATH", os.path.join(_tmp_dir, "pet.db"))
+
+import httpx
+from fastapi.testclient import TestClient
+
+import main
+from main import DatabaseManager
+from conversation_writer import ConversationWriter
+from db_pool import ConnectionPool
+
+class PerCallPool:
+    """基线：每次调用都新建并关闭连接（与ConnectionPool接口一致）"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    @contextmanager
+    def transaction(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def fetchone(self, sql, params=()):
+        with self.transaction() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def fetchall(self, sql, params=()):
+        with self.transaction() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def execute(self, sql, params=()):
+        with self.transaction() as conn:
+            return conn.execute(sql, params).lastrowid
+
+    def executemany(self, sql, seq_of_params):
+        with self.transaction() as conn:
+            return conn.executemany(sql, seq_of_params).rowcount
+
+    def close_all(self):
+        pass
+
+class BlockingDatabaseManager(DatabaseManager):
+    """基线：异步接口直接在事件循环线程中执行查询"""
+
+    async def run_in_executor(self, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+class SlowStoragePool(ConnectionPool):
+    """在每次查询前加入固定延迟，模拟慢速存储"""
+
+    def __init__(self, db_path: str, io_latency: float):
+        super().__init__(db_path)
+        self.io_latency = io_latency
+
+    def fetchall(self, sql, params=()):
+        time.sleep(self.io_latency)
+        return super().fetchall(sql, params)
+
+def _measure(client: TestClient, method: str, path: str, requests: int, **kwargs) -> float:
+    """返回每秒请求数"""
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.request(method, path, **kwargs)
+        response.raise_for_status()
+    return requests / (time.perf_counter() - start)
+
+def _percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def run_save_latency(rows: int = 2000):
+    """保存对话的延迟：同步INSERT+提交 vs 后写队列"""
+    results = {}
+    for label in ("sync", "write-behind"):
+        db = DatabaseManager(os.path.join(_tmp_dir, f"save-{label}.db"))
+        pet = db.get_or_create_pet()
+        save = (
+            (lambda *args: db.pool.execute(ConversationWriter.INSERT_SQL, args + ("2024-01-01 00:00:00",)))
+            if label == "sync" else db.save_conversation
+        )
+
+        samples = []
+        for i in range(rows):
+            start = time.perf_counter()
+            save(pet.id, f"消息{i}", "回复")
+            samples.append((time.perf_counter() - start) * 1000)
+        db.close()
+
+        commits = rows if label == "sync" else db.conversation_writer.flush_count
+        results[label] = (_percentile(samples, 50), _percentile(samples, 99), commits)
+
+    print(f"{'save_conversation':<18}{'p50(ms)':>10}{'p99(ms)':>10}{'commits':>10}")
+    for label, (p50, p99, commits) in results.items():
+        print(f"{label:<18}{p50:>10.3f}{p99:>10.3f}{commits:>10}")
+
+def run(requests: int = 500):
+    results = {}
+    for label in ("per-call", "pool"):
+        db_path = os.path.join(_tmp_dir, f"{label}.db")
+        pool = PerCallPool(db_path) if label == "per-call" else None
+        main.db_manager = DatabaseManager(db_path, pool=pool)
+
+        with TestClient(main.app) as client:
+            results[label] = {
+                "/message": _measure(client, "POST", "/message", requests, json={"message": "你好"}),
+                "/conversations": _measure(client, "GET", "/conversations", requests),
+            }
+        main.db_manager.close()
+
+    print(f"{'endpoint':<16}{'per-call':>12}{'pool':>12}{'speedup':>10}")
+    for endpoint in ("/message", "/conversations"):
+        before = results["per-call"][endpoint]
+        after = results["pool"][endpoint]
+        print(f"{endpoint:<16}{before:>10.0f}/s{after:>10.0f}/s{after / before:>9.2f}x")
+
+def run_concurrency(
+    clients: int = 64,
+    requests_per_client: int = 20,
+    history_rows: int = 50000,
+    io_latency: float = 0.0
+):
+    """并发客户端下 /conversations 的吞吐量，以及事件循环的p99延迟"""
+    results = {}
+    for label, manager_cls in (("blocking", BlockingDatabaseManager), ("executor", DatabaseManager)):
+        db_path = os.path.join(_tmp_dir, f"concurrency-{label}-{io_latency}.db")
+        pool = SlowStoragePool(db_path, io_latency) if io_latency else None
+        db = manager_cls(db_path, pool=pool)
+        pet = db.get_or_create_pet()
+        db.pool.executemany(
+            ConversationWriter.INSERT_SQL,
+            [(pet.id, f"消息{i}", "回复", f"2024-01-01 00:{i // 60 % 60:02d}:{i % 60:02d}") for i in range(history_rows)]
+        )
+        main.db_manager = db
+
+        async def client_loop(client: httpx.AsyncClient):
+            for _ in range(requests_per_client):
+                # 深翻页：从中间的游标开始取一页
+                response = await client.get("/conversations", params={"limit": 50, "before": "2024-01-01 00:30:00|25000"})
+                response.raise_for_status()
+
+        async def probe_loop(done: asyncio.Event, samples: list):
+            # 事件循环延迟：定时器实际唤醒时间比预期晚了多少
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.005)
+                samples.append((time.perf_counter() - start - 0.005) * 1000)
+
+        async def run_clients():
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+                done, samples = asyncio.Event(), []
+                probe = asyncio.create_task(probe_loop(done, samples))
+                start = time.perf_counter()
+                await asyncio.gather(*[client_loop(client) for _ in range(clients)])
+                rate = clients * requests_per_client / (time.perf_counter() - start)
+                done.set()
+                await probe
+                return rate, _percentile(samples, 99)
+
+        results[label] = asyncio.run(run_clients())
+        db.close()
+
+    print(f"{clients} concurrent clients on GET /conversations, "
+          f"simulated storage latency {io_latency * 1000:.0f}ms")
+    print(f"{'':<18}{'req/s':>10}{'loop lag p99(ms)':>18}")
+    for label, (rate, probe_p99) in results.items():
+        print(f"{label:<18}{rate:>10.0f}{probe_p99:>18.2f}")
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
+    print()
+    run_save_latency()
+    print()
+    run_concurrency()
+    print()
+    run_concurrency(io_latency=0.002)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+对冲请求基准测试脚本
+
+本地模拟LLM服务（mock_llm_server.py）：大部分请求约20ms返回，少量请求出现1秒的延迟尖峰。
+对比关闭/开启对冲请求时 agenerate_response 的p50/p95/p99延迟，以及额外的上游请求数。
+
+用法：python bench_hedging.py [请求数]
+"""
+
+import asyncio
+import logging
+import sys
+import time
+
+from llm_client import LLMClient, PersonalityType
+from mock_llm_server import MockLLMServer
+from provider_router import ProviderRouter
+from response_cache import ResponseCache
+from retry_budget import RetryBudget
+from semantic_cache import SemanticCache
+
+def start_server(base_latency: float, spike_rate: float, spike_latency: float) -> MockLLMServer:
+    """模拟LLM服务：基础延迟±20%抖动，按概率注入延迟尖峰"""
+    def latency(rng):
+        return spike_latency if rng.random() < spike_rate else rng.uniform(0.8, 1.2) * base_latency
+    return MockLLMServer(latency=latency, reply="回复", seed=42).start()
+
+def _percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def _client(server: MockLLMServer, hedge: bool) -> LLMClient:
+    client = LLMClient()
+    client.response_cache = ResponseCache(max_entries=0)
+    client.semantic_cache = SemanticCache(max_entries_per_personality=0)
+    client.router = ProviderRouter([
+        client._create_endpoint("mock", "bench-key", "mock-model", server.url)
+    ])
+    client.hedge_enabled = hedge
+    client.retry_budget = RetryBudget(ratio=0.1, max_tokens=10)
+    return client
+
+async def _run_requests(client: LLMClient, requests: int, concurrency: int):
+    samples = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            await client.agenerate_response(f"消息{i}", PersonalityType.PLAYFUL)
+            samples.append((time.perf_counter() - start) * 1000)
+
+    # 预热：积累延迟样本，对冲延迟才有p95可用
+    for i in range(20):
+        await client.agenerate_response(f"预热{i}", PersonalityType.PLAYFUL)
+
+    await asyncio.gather(*[one(i) for i in range(requests)])
+    await client.aclose()
+    return samples
+
+def run(
+    requests: int = 500,
+    concurrency: int = 8,
+    base_latency: float = 0.02,
+    spike_rate: float = 0.03,
+    spike_latency: float = 1.0
+):
+    print(f"{requests} requests, concurrency {concurrency}, "
+          f"base latency {base_latency * 1000:.0f}ms, {spike_rate:.0%} spikes of {spike_latency * 1000:.0f}ms")
+    print(f"{'':<10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}{'upstream':>10}{'hedges':>8}")
+
+    for label, hedge in (("no-hedge", False), ("hedge", True)):
+        server = start_server(base_latency, spike_rate, spike_latency)
+        client = _client(server, hedge)
+        samples = asyncio.run(_run_requests(client, requests, concurrency))
+        server.stop()
+
+        print(f"{label:<10}{_percentile(samples, 50):>10.1f}{_percentile(samples, 95):>10.1f}"
+              f"{_percentile(samples, 99):>10.1f}{max(samples):>10.1f}{server.calls - 20:>10}"
+              f"{client.retry_budget.hedges:>8}")
+
+if __name__ == "__main__":
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+关键词匹配基准测试脚本
+
+对比改造前各节点分别用 any(word in content ...) 多次扫描输入的方式，
+与 KeywordMatcher 单遍扫描后共用匹配结果的方式，在大量随机输入上的每条耗时。
+
+用法：python bench_keyword_matcher.py [输入条数]
+"""
+
+import random
+import sys
+import time
+
+from keyword_matcher import KEYWORD_RULES, KeywordMatcher
+
+FILLERS = [
+    "今天", "我们", "一起", "主人", "小猫", "外面", "有点", "真的", "吗", "呢", "啊", "呀",
+    "上班", "回家", "电脑", "写代码", "周末", "what", "are", "you", "doing", "the", "cat"
+]
+
+def legacy_scan(text: str) -> tuple:
+    """改造前的做法：分类、意图、六个工具和心情各扫描一遍输入"""
+    content = text.lower()
+
+    if any(word in content for word in ["你好", "hello", "hi", "嗨"]):
+        input_type = "greeting"
+    elif any(word in content for word in ["摸摸", "抱抱", "摸摸头"]):
+        input_type = "physical_interaction"
+    elif any(word in content for word in ["开心", "高兴", "喜欢", "爱"]):
+        input_type = "emotional"
+    elif any(word in content for word in ["再见", "拜拜", "走了"]):
+        input_type = "farewell"
+    else:
+        input_type = "general"
+
+    if "摸摸" in content:
+        user_intent = "want_physical_contact"
+    elif "抱抱" in content:
+        user_intent = "want_hug"
+    elif "开心" in content or "高兴" in content:
+        user_intent = "check_mood"
+    elif "再见" in content or "拜拜" in content:
+        user_intent = "saying_goodbye"
+    else:
+        user_intent = "general_chat"
+
+    tools = []
+    if any(word in content for word in ["时间", "几点", "现在"]):
+        tools.append("get_time")
+    if any(word in content for word in ["天气", "温度", "下雨"]):
+        tools.append("get_weather")
+    if any(word in content for word in ["健康", "状态", "怎么样"]):
+        tools.append("get_health")
+    if any(word in content for word in ["提醒", "待办", "任务"]):
+        tools.append("get_reminders")
+    if any(word in content for word in ["喂食", "吃饭", "饿了"]):
+        tools.append("feed_pet")
+    if any(word in content for word in ["玩耍", "玩", "游戏"]):
+        tools.append("play_with_pet")
+
+    positive = any(word in content for word in ["摸摸", "抱抱", "喜欢", "爱", "好"])
+    return input_type, user_intent, tuple(tools), positive
+
+def make_corpus(size: int, seed: int = 0) -> list:
+    """随机拼接关键词和普通词，约三成输入不含任何关键词"""
+    rng = random.Random(seed)
+    keywords = [rule.keyword for rule in KEYWORD_RULES] + ["HELLO", "Hi"]
+    corpus = []
+    for _ in range(size):
+        words = [rng.choice(FILLERS) for _ in range(rng.randint(1, 8))]
+        if rng.random() < 0.7:
+            for _ in range(rng.randint(1, 3)):
+                words.insert(rng.randint(0, len(words)), rng.choice(keywords))
+        corpus.append("".join(words) if rng.random() < 0.8 else " ".join(words))
+    return corpus
+
+def _time_per_input(func, corpus: list, repeat: int = 3) -> float:
+    """多次运行取最快一次，返回每条输入的微秒数"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in corpus:
+            func(text)
+        best = min(best, time.perf_counter() - start)
+    return best / len(corpus) * 1e6
+
+def run(size: int = 100000):
+    corpus = make_corpus(size)
+    matcher = KeywordMatcher()
+
+    # 结果一致性
+    for text in corpus:
+        match = matcher.match(text)
+        assert (match.input_type, match.user_intent, match.tools, match.positive) == legacy_scan(text), text
+
+    start = time.perf_counter()
+    KeywordMatcher()
+    build_ms = (time.perf_counter() - start) * 1000
+
+    avg_len = sum(len(text) for text in corpus) / len(corpus)
+    legacy = _time_per_input(legacy_scan, corpus)
+    single_pass = _time_per_input(matcher.match, corpus)
+    print(f"{size} inputs, avg {avg_len:.1f} chars, {len(KEYWORD_RULES)} keywords, "
+          f"automaton build {build_ms:.2f}ms")
+    print(f"{'method':<28}{'us/input':>10}")
+    print(f"{'any(word in content) x10':<28}{legacy:>10.2f}")
+    print(f"{'KeywordMatcher.match':<28}{single_pass:>10.2f}")
+    print(f"speedup: {legacy / single_pass:.2f}x")
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
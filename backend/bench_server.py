@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+后端吞吐量基准测试脚本（LLM使用本地模拟服务）
+
+启动 mock_llm_server.py 的模拟LLM服务，通过 DEEPSEEK_BASE_URL 让 LLMClient 指向它，
+然后用大量并发客户端请求 POST /message，统计吞吐量和端到端延迟。
+默认关闭响应缓存和语义缓存，每条消息都真正请求一次LLM。
+
+用法：python bench_server.py [并发数] [每个客户端的请求数] [延迟分布]
+例如：python bench_server.py 32 10 lognormal:0.8,0.5
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from mock_llm_server import MockLLMServer
+
+def _percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def run(clients: int = 32, requests_per_client: int = 10, latency: str = "lognormal:0.3,0.5"):
+    mock = MockLLMServer(latency=latency, tokens_per_second=200, seed=42).start()
+
+    # 必须在导入main之前设置，LLMClient在导入时读取配置
+    os.environ.setdefault("PET_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="pet_server_bench_"), "pet.db"))
+    os.environ["DEEPSEEK_API_KEY"] = "mock"
+    os.environ["DEEPSEEK_BASE_URL"] = mock.url
+    os.environ.setdefault("LLM_CACHE_SIZE", "0")
+    os.environ.setdefault("LLM_SEMANTIC_CACHE_SIZE", "0")
+
+    import httpx
+    import main
+
+    messages = ["你好", "摸摸头", "今天开心吗", "陪我聊聊天", "你在干什么"]
+
+    async def client_loop(client: httpx.AsyncClient, index: int, samples: list):
+        for i in range(requests_per_client):
+            start = time.perf_counter()
+            response = await client.post("/message", json={"message": f"{messages[i % len(messages)]}{index}-{i}"})
+            response.raise_for_status()
+            samples.append((time.perf_counter() - start) * 1000)
+
+    async def run_clients():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver", timeout=60) as client:
+            samples = []
+            start = time.perf_counter()
+            await asyncio.gather(*[client_loop(client, index, samples) for index in range(clients)])
+            elapsed = time.perf_counter() - start
+            status = (await client.get("/llm/status")).json()
+        await main.llm_client.aclose()
+        return samples, elapsed, status
+
+    samples, elapsed, status = asyncio.run(run_clients())
+    main.db_manager.close()
+    mock.stop()
+
+    total = clients * requests_per_client
+    scheduler = status["scheduler"]
+    print(f"{clients} concurrent clients x {requests_per_client} POST /message, mock LLM latency {latency}, "
+          f"LLM_MAX_IN_FLIGHT={scheduler['max_in_flight']}")
+    print(f"{'req/s':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'llm calls':>11}{'llm errors':>12}"
+          f"{'queue p95(ms)':>15}")
+    print(f"{total / elapsed:>10.1f}{_percentile(samples, 50):>10.1f}{_percentile(samples, 95):>10.1f}"
+          f"{_percentile(samples, 99):>10.1f}{mock.calls:>11}{mock.failures:>12}"
+          f"{scheduler['classes']['interactive']['p95_wait_ms']:>15.1f}")
+
+if __name__ == "__main__":
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 32,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 10,
+        sys.argv[3] if len(sys.argv) > 3 else "lognormal:0.3,0.5"
+    )
@@ -0,0 +1,154 @@
+"""
+宠物状态检查点（内存热层 + SQLite持久层）
+"""
+
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+from db_pool import ConnectionPool
+
+# 检查点保存的状态字段（对话消息不在这里保存，历史以conversations表为准）
+CHECKPOINT_FIELDS = ("personality", "mood", "energy", "last_interaction")
+
+class CheckpointStore:
+    """按宠物保存Agent状态：读取优先走内存，写入时同步写穿到SQLite"""
+
+    CREATE_TABLE_SQL = '''
+        CREATE TABLE IF NOT EXISTS pet_states (
+            pet_id INTEGER PRIMARY KEY,
+            personality TEXT,
+            mood TEXT NOT NULL,
+            energy INTEGER NOT NULL,
+            last_interaction TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    '''
+    SELECT_SQL = 'SELECT personality, mood, energy, last_interaction FROM pet_states WHERE pet_id = ?'
+    UPSERT_SQL = '''
+        INSERT INTO pet_states (pet_id, personality, mood, energy, last_interaction, updated_at)
+        VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(pet_id) DO UPDATE SET
+            personality = excluded.personality,
+            mood = excluded.mood,
+            energy = excluded.energy,
+            last_interaction = excluded.last_interaction,
+            updated_at = excluded.updated_at
+    '''
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        max_entries: int = 1024,
+        run_in_executor: Optional[Callable[..., Awaitable]] = None
+    ):
+        self.pool = pool
+        self.max_entries = max_entries
+        # 异步接口执行阻塞数据库操作的方式（默认asyncio.to_thread，应用中使用数据库专用线程）
+        self.run_in_executor = run_in_executor or asyncio.to_thread
+
+        # 热层：pet_id -> 状态（None表示数据库中也没有，避免重复查询）
+        self._states: "OrderedDict[Hashable, Optional[Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 写库不持有热层的锁，事件循环上的读取不会等磁盘；按版本号跳过已被更新状态取代的写入
+        self._write_lock = threading.Lock()
+        self._versions: Dict[Hashable, int] = {}
+        self._version = 0
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+        with self.pool.transaction() as conn:
+            conn.execute(self.CREATE_TABLE_SQL)
+
+    def _remember(self, pet_id: Hashable, state: Optional[Dict]):
+        """放入热层，超出容量时淘汰最久未用的宠物（持有锁时调用）"""
+        self._states[pet_id] = state
+        self._states.move_to_end(pet_id)
+        while len(self._states) > self.max_entries:
+            self._states.popitem(last=False)
+
+    def _lookup(self, pet_id: Hashable) -> tuple:
+        """查热层，返回 (是否命中, 状态副本)"""
+        with self._lock:
+            if pet_id not in self._states:
+                return False, None
+            self.hits += 1
+            self._states.move_to_end(pet_id)
+            state = self._states[pet_id]
+            return True, dict(state) if state is not None else None
+
+    def load(self, pet_id: Hashable) -> Optional[Dict]:
+        """读取宠物状态，没有检查点时返回None"""
+        found, state = self._lookup(pet_id)
+        if found:
+            return state
+
+        row = self.pool.fetchone(self.SELECT_SQL, (pet_id,))
+        state = dict(zip(CHECKPOINT_FIELDS, row)) if row else None
+        with self._lock:
+            self.misses += 1
+            # 并发加载时以先写入热层的为准（可能是刚保存的新状态）
+            if pet_id not in self._states:
+                self._remember(pet_id, state)
+            state = self._states[pet_id]
+            return dict(state) if state is not None else None
+
+    def save(self, pet_id: Hashable, state: Dict):
+        """保存宠物状态（只保存 CHECKPOINT_FIELDS 中的字段）"""
+        checkpoint = {field: state.get(field) for field in CHECKPOINT_FIELDS}
+        personality = checkpoint["personality"]
+        checkpoint["personality"] = getattr(personality, "value", personality)
+
+        with self._lock:
+            self._remember(pet_id, checkpoint)
+            self.writes += 1
+            self._version += 1
+            version = self._versions[pet_id] = self._version
+
+        with self._write_lock:
+            with self._lock:
+                if self._versions.get(pet_id) != version:
+                    # 之后又保存了新状态，由那次保存写库
+                    return
+            self.pool.execute(self.UPSERT_SQL, (
+                pet_id,
+                checkpoint["personality"],
+                checkpoint["mood"],
+                checkpoint["energy"],
+                checkpoint["last_interaction"]
+            ))
+
+    async def aload(self, pet_id: Hashable) -> Optional[Dict]:
+        """异步读取（热层命中只是内存操作，无需切换线程）"""
+        found, state = self._lookup(pet_id)
+        if found:
+            return state
+        return await self.run_in_executor(self.load, pet_id)
+
+    async def asave(self, pet_id: Hashable, state: Dict):
+        """异步保存（写库放到数据库线程中执行）"""
+        await self.run_in_executor(self.save, pet_id, state)
+
+    def invalidate(self, pet_id: Optional[Hashable] = None):
+        """清空热层（不指定pet_id时清空全部），下次读取时从数据库加载"""
+        with self._lock:
+            if pet_id is None:
+                self._states.clear()
+            else:
+                self._states.pop(pet_id, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._states),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "writes": self.writes
+            }
@@ -0,0 +1,167 @@
+"""
+对话记录后写队列
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Tuple
+
+from db_pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+class ConversationWriter:
+    """对话记录后写队列：请求中只入队，后台线程按数量/时间阈值批量落库"""
+
+    INSERT_SQL = '''
+        INSERT INTO conversations (pet_id, user_input, pet_response, timestamp)
+        VALUES (?, ?, ?, ?)
+    '''
+
+    def __init__(self, pool: ConnectionPool, batch_size: int = 50, flush_interval: float = 0.5):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval  # 秒
+
+        self._pending: List[Dict] = []
+        self._in_flight: List[Dict] = []
+        self._first_queued_at = 0.0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # 保证批次按顺序写入
+        self._closed = False
+
+        # 统计信息
+        self.rows_written = 0
+        self.flush_count = 0
+
+        self._thread = threading.Thread(target=self._run, name="conversation-writer", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _row(pet_id: int, user_input: str, response: str) -> Dict:
+        return {
+            "id": None,
+            "pet_id": pet_id,
+            "user_input": user_input,
+            "pet_response": response,
+            # 与SQLite的CURRENT_TIMESTAMP格式一致（UTC）
+            "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def submit(self, pet_id: int, user_input: str, response: str) -> Dict:
+        """提交一条对话记录，立即返回；落库后记录中的id会被回填"""
+        row = self._row(pet_id, user_input, response)
+
+        with self._cond:
+            closed = self._closed
+            if not closed:
+                if not self._pending:
+                    self._first_queued_at = time.monotonic()
+                self._pending.append(row)
+                if len(self._pending) >= self.batch_size:
+                    self._cond.notify()
+
+        # 队列已关闭（进程退出阶段）时直接同步写入
+        if closed:
+            self._write([row])
+        return row
+
+    def has_pending(self, pet_id: int) -> bool:
+        """是否有该宠物尚未落库的记录"""
+        with self._cond:
+            return any(row["pet_id"] == pet_id for row in self._pending + self._in_flight)
+
+    def pending_count(self) -> int:
+        """尚未落库的记录数"""
+        with self._cond:
+            return len(self._pending) + len(self._in_flight)
+
+    def write_batch(self, pet_id: int, turns: Iterable[Tuple[str, str]]) -> List[Dict]:
+        """在一个事务中同步写入一批对话记录 (用户输入, 回复)，返回回填了id的记录
+
+        先写完队列中已有的记录，保证id顺序与保存顺序一致。
+        """
+        rows = [self._row(pet_id, user_input, response) for user_input, response in turns]
+        with self._flush_lock:
+            self._flush_pending()
+            if rows:
+                self._write(rows)
+        return rows
+
+    def flush(self):
+        """把当前队列中的记录全部写入数据库"""
+        with self._flush_lock:
+            self._flush_pending()
+
+    def _flush_pending(self):
+        """写入队列中的记录（持有_flush_lock时调用）"""
+        with self._cond:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            self._in_flight = batch
+
+        try:
+            self._write(batch)
+        except Exception as e:
+            logger.error(f"对话记录写入失败，将重试: {e}")
+            with self._cond:
+                # 放回队首，保持原有顺序
+                self._pending = batch + self._pending
+                self._first_queued_at = time.monotonic()
+            raise
+        finally:
+            with self._cond:
+                self._in_flight = []
+
+    def _write(self, batch: List[Dict]):
+        """在一个事务中批量写入，并回填自增id"""
+        with self.pool.transaction() as conn:
+            conn.executemany(self.INSERT_SQL, [
+                (row["pet_id"], row["user_input"], row["pet_response"], row["timestamp"])
+                for row in batch
+            ])
+            # 同一事务内持有写锁，自增id连续分配
+            last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+
+        first_id = last_id - len(batch) + 1
+        for offset, row in enumerate(batch):
+            row["id"] = first_id + offset
+
+        self.rows_written += len(batch)
+        self.flush_count += 1
+
+    def _run(self):
+        """后台刷新循环"""
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+
+                # 攒批：达到数量阈值或等待超过时间阈值
+                while self._pending and not self._closed and len(self._pending) < self.batch_size:
+                    remaining = self._first_queued_at + self.flush_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+            try:
+                self.flush()
+            except Exception:
+                # 出错后稍等再重试，避免忙等
+                time.sleep(self.flush_interval)
+
+    def close(self):
+        """停止后台线程并同步写完剩余记录"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+
+        self._thread.join()
+        self.flush()
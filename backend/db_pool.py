@@ -0,0 +1,100 @@
+"""
+SQLite连接池
+"""
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence
+
+# 默认连接参数：WAL日志 + NORMAL同步，读写互不阻塞，提交时不再每次fsync主库
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -8000,  # 负数表示KB，约8MB页缓存
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,  # 毫秒
+}
+
+class ConnectionPool:
+    """SQLite连接池（每个线程持有一个持久连接）"""
+
+    def __init__(
+        self,
+        db_path: str,
+        pragmas: Optional[Dict[str, object]] = None,
+        cached_statements: int = 256
+    ):
+        self.db_path = db_path
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+        self.cached_statements = cached_statements
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+
+    def _connect(self) -> sqlite3.Connection:
+        """创建新连接并应用PRAGMA"""
+        # sqlite3会按SQL文本缓存预编译语句，相同语句在同一连接上复用
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """获取当前线程的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """在事务中执行，成功提交、失败回滚"""
+        conn = self.connection()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def fetchone(self, sql: str, params: Sequence = ()) -> Optional[tuple]:
+        """查询单行"""
+        return self.connection().execute(sql, params).fetchone()
+
+    def fetchall(self, sql: str, params: Sequence = ()) -> List[tuple]:
+        """查询多行"""
+        return self.connection().execute(sql, params).fetchall()
+
+    def execute(self, sql: str, params: Sequence = ()) -> Optional[int]:
+        """执行写语句并提交，返回lastrowid"""
+        with self.transaction() as conn:
+            return conn.execute(sql, params).lastrowid
+
+    def executemany(self, sql: str, seq_of_params: Iterable[Sequence]) -> int:
+        """在一个事务中批量执行写语句，返回影响行数"""
+        with self.transaction() as conn:
+            return conn.executemany(sql, seq_of_params).rowcount
+
+    def close_all(self):
+        """关闭所有线程的连接"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        # 当前线程的引用也一并失效，其它线程下次访问时会重新建立连接
+        self._local = threading.local()
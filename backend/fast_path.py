@@ -0,0 +1,167 @@
+"""
+快速回复：问候、告别、摸摸/抱抱等简单互动直接从本地模板库回复，不调用LLM
+"""
+
+import json
+import random
+import threading
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Optional
+
+from keyword_matcher import KeywordMatch
+from metrics import registry
+
+# 指标（GET /metrics 导出）
+RESPONSE_PATHS = registry.counter(
+    "pet_response_path_total",
+    "按处理方式统计的对话回复数（local本地模板/sampled命中模板但抽样走LLM/llm不适合本地回复）",
+    ("personality", "intent", "path")
+)
+FAST_PATH_DURATION = registry.histogram(
+    "pet_fast_path_duration_seconds", "本地模板回复耗时", ("personality",),
+    buckets=(0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.001)
+)
+
+# 除关键词外允许出现的语气词；其它剩余内容（包括英文字母）说明这不只是一句简单互动
+FILLER_CHARS = set("呀啊吧嘛呢哦噢喔哈嘿嗯啦咯哟呦嘻喵汪")
+# 含否定词的输入（不要摸、别抱、再见不到）意思可能相反，交给LLM
+NEGATION_CHARS = set("不别没")
+# 不依赖上下文的简单互动（输入类型）：走LLM时也不带历史和记忆，回复只按输入缓存
+SMALL_TALK_TYPES = frozenset(("greeting", "physical_interaction", "farewell"))
+
+# 模板库：性格 -> 意图 -> 回复（意图优先取user_intent，没有时取input_type）
+DEFAULT_TEMPLATES: Dict[str, Dict[str, List[str]]] = {
+    "cold": {
+        "greeting": ["哼，你来了", "嗯，主人", "有什么事吗"],
+        "farewell": ["嗯，走吧", "哼，早点回来", "知道了"],
+        "want_physical_contact": ["……别乱摸", "哼，就一下", "手拿开……算了"],
+        "want_hug": ["……就抱一下", "哼，勉强让你抱", "别抱太久"],
+    },
+    "clingy": {
+        "greeting": ["主人！你终于来了！", "想死你了！", "主人抱抱！"],
+        "farewell": ["不要走嘛……", "主人要早点回来哦！", "我会一直等你的！"],
+        "want_physical_contact": ["好舒服～再摸摸！", "呼噜呼噜～最喜欢主人了", "不要停嘛～"],
+        "want_hug": ["抱紧紧！", "主人的怀里最暖和了～", "再抱一会儿嘛！"],
+    },
+    "playful": {
+        "greeting": ["喵喵！主人好！", "汪汪！主人来了！", "主人主人！一起玩吧！"],
+        "farewell": ["拜拜！回来陪我玩！", "下次见喵～", "去吧去吧，我自己玩！"],
+        "want_physical_contact": ["嘿嘿好痒！", "摸完了该陪我玩了！", "喵呜～再来！"],
+        "want_hug": ["抱抱！转圈圈！", "扑——抱住啦！", "嘿嘿，抓到主人了！"],
+    },
+    "quiet": {
+        "greeting": ["主人好", "嗯，在", "你好"],
+        "farewell": ["嗯，再见", "路上小心", "等你回来"],
+        "want_physical_contact": ["嗯……", "（蹭蹭）", "好舒服"],
+        "want_hug": ["（轻轻靠过来）", "嗯，抱抱", "暖暖的"],
+    },
+}
+
+class FastPathResponder:
+    """分层回复的第一层：高置信度的简单互动从模板库随机选一句
+
+    只处理短输入、除关键词外只有标点和语气词、不含否定词、命中了模板库里的意图且不需要工具的消息；
+    其余消息返回None交给LLM。
+    为了保持回复的多样性，命中的消息仍有 llm_sample_rate 的比例抽样走LLM。
+    """
+
+    def __init__(
+        self,
+        templates: Optional[Dict[str, Dict[str, Iterable[str]]]] = None,
+        llm_sample_rate: float = 0.1,
+        max_input_chars: int = 8,
+        rng: Optional[random.Random] = None
+    ):
+        self.llm_sample_rate = llm_sample_rate
+        self.max_input_chars = max_input_chars
+        self._random = rng or random.Random()
+        self._templates: Dict[str, Dict[str, List[str]]] = {}
+        self._lock = threading.Lock()
+        self.add_templates(DEFAULT_TEMPLATES if templates is None else templates)
+
+        # 统计信息
+        self.local = 0
+        self.sampled = 0
+        self.llm = 0
+
+    def add_templates(self, templates: Dict[str, Dict[str, Iterable[str]]]):
+        """扩充模板库：{性格: {意图: [回复, ...]}}，与已有模板合并"""
+        with self._lock:
+            for personality, intents in templates.items():
+                bank = self._templates.setdefault(personality, {})
+                for intent, replies in intents.items():
+                    bank.setdefault(intent, []).extend(reply for reply in replies if reply)
+
+    def load(self, path: str):
+        """从JSON文件扩充模板库（格式同add_templates）"""
+        with open(path, "r", encoding="utf-8") as f:
+            self.add_templates(json.load(f))
+
+    @staticmethod
+    def _only_keywords(match: KeywordMatch, text: str) -> bool:
+        """输入是否只由命中的关键词和标点、语气词、表情组成
+
+        关键词按子串命中，"which"里的"hi"、"你好烦"里的"你好"都会命中；去掉关键词后
+        不能有剩余内容，英文关键词因此也必须是完整的单词。
+        """
+        for keyword in sorted(set(match.keywords), key=len, reverse=True):
+            text = text.replace(keyword, " ")
+        return all(
+            char.isspace() or char in FILLER_CHARS or unicodedata.category(char)[0] in "PS"
+            for char in text
+        )
+
+    def _plain(self, match: KeywordMatch, user_input: str) -> bool:
+        """短输入、不需要工具、除关键词外只有标点和语气词、不含否定词"""
+        text = user_input.strip().lower()
+        if match.tools or len(text) > self.max_input_chars or not match.keywords:
+            return False
+        return not NEGATION_CHARS.intersection(text) and self._only_keywords(match, text)
+
+    def is_small_talk(self, match: KeywordMatch, user_input: str) -> bool:
+        """是否是不依赖上下文的简单互动（问候、告别、摸摸抱抱），与是否有模板、是否抽样无关"""
+        return match.input_type in SMALL_TALK_TYPES and self._plain(match, user_input)
+
+    def _intent(self, match: KeywordMatch, user_input: str, personality: str) -> Optional[str]:
+        """可以本地回复的意图；不满足条件时返回None"""
+        if not self._plain(match, user_input):
+            return None
+        bank = self._templates.get(personality, {})
+        for intent in (match.user_intent, match.input_type):
+            if bank.get(intent):
+                return intent
+        return None
+
+    def respond(self, match: KeywordMatch, user_input: str, personality) -> Optional[str]:
+        """返回本地回复；不适合本地回复或被抽样走LLM时返回None"""
+        start = time.perf_counter()
+        personality = getattr(personality, "value", personality)
+        intent = self._intent(match, user_input, personality)
+        if intent is None:
+            self.llm += 1
+            RESPONSE_PATHS.inc(personality=personality, intent=match.input_type, path="llm")
+            return None
+
+        if self._random.random() < self.llm_sample_rate:
+            self.sampled += 1
+            RESPONSE_PATHS.inc(personality=personality, intent=intent, path="sampled")
+            return None
+
+        reply = self._random.choice(self._templates[personality][intent])
+        self.local += 1
+        RESPONSE_PATHS.inc(personality=personality, intent=intent, path="local")
+        FAST_PATH_DURATION.observe(time.perf_counter() - start, personality=personality)
+        return reply
+
+    def stats(self) -> Dict:
+        total = self.local + self.sampled + self.llm
+        return {
+            "llm_sample_rate": self.llm_sample_rate,
+            "max_input_chars": self.max_input_chars,
+            "local": self.local,
+            "sampled": self.sampled,
+            "llm": self.llm,
+            "local_ratio": self.local / total if total else 0.0,
+            "templates": sum(len(replies) for bank in self._templates.values() for replies in bank.values())
+        }
@@ -0,0 +1,116 @@
+"""
+对话历史尾部缓存（每只宠物在内存中保留最近K轮，未命中时从conversations表预热）
+"""
+
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Hashable, List, Optional
+
+class HistoryCache:
+    """按宠物缓存最近 max_turns 轮对话
+
+    首次访问某只宠物时调用 load(pet_id, max_turns)（按时间倒序返回）预热，之后每保存一轮
+    对话就追加到队尾；宠物数超过 max_pets 时淘汰最久未用的宠物。请求条数超过 max_turns 或
+    不是正数时不走缓存，返回None由调用方查数据库（结果与缓存是否预热无关）。
+    """
+
+    def __init__(
+        self,
+        load: Callable[[Hashable, int], List[Dict]],
+        max_turns: int = 20,
+        max_pets: int = 128
+    ):
+        self.load = load
+        self.max_turns = max_turns
+        self.max_pets = max_pets
+
+        # pet_id -> 最近几轮对话（按时间正序）
+        self._tails: "OrderedDict[Hashable, Deque[Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 正在预热的宠物 -> (并发预热数, 预热开始后的追加次数)；预热期间该宠物有追加时不缓存加载结果，
+        # 避免漏掉刚保存的对话（其它宠物的追加不影响）
+        self._loading: Dict[Hashable, List[int]] = {}
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, pet_id: Hashable, limit: int) -> Optional[List[Dict]]:
+        """最近 limit 轮对话（按时间倒序，与数据库查询一致）；超出缓存容量或limit不是正数时返回None"""
+        if limit <= 0 or limit > self.max_turns:
+            return None
+
+        with self._lock:
+            tail = self._tails.get(pet_id)
+            if tail is not None:
+                self.hits += 1
+                self._tails.move_to_end(pet_id)
+                return [tail[i] for i in range(len(tail) - 1, max(len(tail) - limit, 0) - 1, -1)]
+            self.misses += 1
+            loading = self._loading.setdefault(pet_id, [0, 0])
+            loading[0] += 1
+            version = loading[1]
+
+        try:
+            rows = self.load(pet_id, self.max_turns)
+        except Exception:
+            with self._lock:
+                self._finish_loading(pet_id)
+            raise
+        with self._lock:
+            if self._loading[pet_id][1] == version and pet_id not in self._tails:
+                self._remember(pet_id, deque(reversed(rows), maxlen=self.max_turns))
+            self._finish_loading(pet_id)
+        return rows[:limit]
+
+    def _finish_loading(self, pet_id: Hashable):
+        """一次预热结束（持有锁时调用）"""
+        loading = self._loading[pet_id]
+        loading[0] -= 1
+        if not loading[0]:
+            del self._loading[pet_id]
+
+    def cached(self, pet_id: Hashable) -> bool:
+        """该宠物是否已预热"""
+        with self._lock:
+            return pet_id in self._tails
+
+    def append(self, pet_id: Hashable, row: Dict):
+        """保存一轮对话后追加（尚未预热的宠物跳过，下次访问时从数据库加载）"""
+        with self._lock:
+            loading = self._loading.get(pet_id)
+            if loading is not None:
+                loading[1] += 1
+            tail = self._tails.get(pet_id)
+            if tail is not None:
+                tail.append(row)
+                self._tails.move_to_end(pet_id)
+
+    def _remember(self, pet_id: Hashable, tail: Deque[Dict]):
+        """放入缓存，超出容量时淘汰最久未用的宠物（持有锁时调用）"""
+        self._tails[pet_id] = tail
+        while len(self._tails) > self.max_pets:
+            self._tails.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, pet_id: Optional[Hashable] = None):
+        """丢弃某只宠物（不指定时丢弃全部）的缓存"""
+        with self._lock:
+            if pet_id is None:
+                self._tails.clear()
+            else:
+                self._tails.pop(pet_id, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "max_turns": self.max_turns,
+                "max_pets": self.max_pets,
+                "pets": len(self._tails),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0
+            }
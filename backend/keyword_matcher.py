@@ -0,0 +1,202 @@
+"""
+多关键词单遍匹配（Aho–Corasick自动机），用于输入分类、意图提取、工具路由和心情打分
+"""
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+@dataclass(frozen=True)
+class KeywordRule:
+    """一个关键词命中后带来的标签（不适用的字段为None）"""
+    keyword: str
+    category: Optional[str] = None  # 输入类型
+    intent: Optional[str] = None  # 用户意图
+    tool: Optional[str] = None  # 需要执行的工具
+    sentiment: Optional[str] = None  # 情感倾向
+
+# 关键词表（匹配时不区分大小写）
+KEYWORD_RULES: Tuple[KeywordRule, ...] = (
+    # 问候
+    KeywordRule("你好", category="greeting", sentiment="positive"),  # 含“好”
+    KeywordRule("hello", category="greeting"),
+    KeywordRule("hi", category="greeting"),
+    KeywordRule("嗨", category="greeting"),
+    # 身体接触
+    KeywordRule("摸摸", category="physical_interaction", intent="want_physical_contact", sentiment="positive"),
+    KeywordRule("摸摸头", category="physical_interaction"),
+    KeywordRule("抱抱", category="physical_interaction", intent="want_hug", sentiment="positive"),
+    # 情感
+    KeywordRule("开心", category="emotional", intent="check_mood"),
+    KeywordRule("高兴", category="emotional", intent="check_mood"),
+    KeywordRule("喜欢", category="emotional", sentiment="positive"),
+    KeywordRule("爱", category="emotional", sentiment="positive"),
+    KeywordRule("好", sentiment="positive"),
+    # 告别
+    KeywordRule("再见", category="farewell", intent="saying_goodbye"),
+    KeywordRule("拜拜", category="farewell", intent="saying_goodbye"),
+    KeywordRule("走了", category="farewell"),
+    # 工具
+    KeywordRule("时间", tool="get_time"),
+    KeywordRule("几点", tool="get_time"),
+    KeywordRule("现在", tool="get_time"),
+    KeywordRule("天气", tool="get_weather"),
+    KeywordRule("温度", tool="get_weather"),
+    KeywordRule("下雨", tool="get_weather"),
+    KeywordRule("健康", tool="get_health"),
+    KeywordRule("状态", tool="get_health"),
+    KeywordRule("怎么样", tool="get_health"),
+    KeywordRule("提醒", tool="get_reminders"),
+    KeywordRule("待办", tool="get_reminders"),
+    KeywordRule("任务", tool="get_reminders"),
+    KeywordRule("喂食", tool="feed_pet"),
+    KeywordRule("吃饭", tool="feed_pet"),
+    KeywordRule("饿了", tool="feed_pet"),
+    KeywordRule("玩耍", tool="play_with_pet"),
+    KeywordRule("玩", tool="play_with_pet"),
+    KeywordRule("游戏", tool="play_with_pet"),
+)
+
+# 同时命中多个时按以下顺序取第一个
+CATEGORY_PRIORITY = ("greeting", "physical_interaction", "emotional", "farewell")
+INTENT_PRIORITY = ("want_physical_contact", "want_hug", "check_mood", "saying_goodbye")
+# 工具按以下顺序执行
+TOOL_ORDER = ("get_time", "get_weather", "get_health", "get_reminders", "feed_pet", "play_with_pet")
+
+DEFAULT_CATEGORY = "general"
+DEFAULT_INTENT = "general_chat"
+
+@dataclass(frozen=True)
+class KeywordMatch:
+    """一条输入的匹配结果"""
+    input_type: str = DEFAULT_CATEGORY
+    user_intent: str = DEFAULT_INTENT
+    tools: Tuple[str, ...] = ()
+    sentiments: FrozenSet[str] = frozenset()
+    keywords: Tuple[str, ...] = ()  # 命中的关键词（按结束位置排序）
+
+    @property
+    def positive(self) -> bool:
+        return "positive" in self.sentiments
+
+class KeywordMatcher:
+    """把关键词表编译成确定性自动机，每条输入只扫描一遍
+
+    每个状态的输出预先合并成标签位掩码（含失败链上的输出），扫描时只需查转移表，
+    最后把命中状态的掩码合并后解码为 KeywordMatch（按命中序列缓存）。
+    """
+
+    def __init__(
+        self,
+        rules: Iterable[KeywordRule] = KEYWORD_RULES,
+        category_priority: Sequence[str] = CATEGORY_PRIORITY,
+        intent_priority: Sequence[str] = INTENT_PRIORITY,
+        tool_order: Sequence[str] = TOOL_ORDER,
+        cache_size: int = 4096
+    ):
+        self.rules = tuple(rules)
+        self.category_priority = tuple(category_priority)
+        self.intent_priority = tuple(intent_priority)
+        self.tool_order = tuple(tool_order)
+
+        # 标签 -> 位
+        self._bits: Dict[Tuple[str, str], int] = {}
+        self._labels: List[Tuple[str, str]] = []
+        self._transitions: List[Dict[str, int]] = [{}]
+        self._masks: List[int] = [0]
+        self._outputs: List[Tuple[str, ...]] = [()]
+        self._decoded: Dict[int, KeywordMatch] = {}
+        self.cache_size = cache_size
+        self._matches: Dict[Tuple[int, ...], KeywordMatch] = {}
+        self._build()
+
+    def _bit(self, kind: str, value: str) -> int:
+        label = (kind, value)
+        if label not in self._bits:
+            self._bits[label] = 1 << len(self._labels)
+            self._labels.append(label)
+        return self._bits[label]
+
+    def _build(self):
+        transitions, masks, outputs = self._transitions, self._masks, self._outputs
+
+        # 1. 构建关键词前缀树
+        for rule in self.rules:
+            keyword = rule.keyword.lower()
+            if not keyword:
+                raise ValueError("关键词不能为空")
+            state = 0
+            for char in keyword:
+                if char not in transitions[state]:
+                    transitions.append({})
+                    masks.append(0)
+                    outputs.append(())
+                    transitions[state][char] = len(transitions) - 1
+                state = transitions[state][char]
+            for kind in ("category", "intent", "tool", "sentiment"):
+                value = getattr(rule, kind)
+                if value is not None:
+                    masks[state] |= self._bit(kind, value)
+            if keyword not in outputs[state]:
+                outputs[state] += (keyword,)
+
+        # 2. 按层计算失败指针，合并输出，并把缺失的转移补全成确定性自动机
+        fail = [0] * len(transitions)
+        queue = deque(transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            masks[state] |= masks[fail[state]]
+            outputs[state] = outputs[fail[state]] + outputs[state]
+            for char, child in transitions[state].items():
+                fail[child] = transitions[fail[state]].get(char, 0) if state else 0
+                queue.append(child)
+            # 补全：本状态没有的转移沿用失败状态的转移（失败状态层级更浅，已补全）
+            if state:
+                for char, target in transitions[fail[state]].items():
+                    transitions[state].setdefault(char, target)
+
+    def match(self, text: str) -> KeywordMatch:
+        """单遍扫描输入，返回所有节点共用的匹配结果"""
+        transitions, masks = self._transitions, self._masks
+        state, hits = 0, []
+        for char in text.lower():
+            state = transitions[state].get(char, 0)
+            if masks[state]:
+                hits.append(state)
+
+        # 结果只取决于依次命中的状态，按命中序列缓存
+        key = tuple(hits)
+        match = self._matches.get(key)
+        if match is None:
+            mask = 0
+            for state in hits:
+                mask |= masks[state]
+            decoded = self._decode(mask)
+            match = KeywordMatch(
+                decoded.input_type,
+                decoded.user_intent,
+                decoded.tools,
+                decoded.sentiments,
+                tuple(keyword for state in hits for keyword in self._outputs[state])
+            )
+            if len(self._matches) >= self.cache_size:
+                self._matches.clear()
+            self._matches[key] = match
+        return match
+
+    def _decode(self, mask: int) -> KeywordMatch:
+        """把标签掩码解码为匹配结果（结果按掩码缓存，不含命中的关键词）"""
+        decoded = self._decoded.get(mask)
+        if decoded is None:
+            def has(kind: str, value: str) -> bool:
+                return bool(mask & self._bits.get((kind, value), 0))
+
+            decoded = KeywordMatch(
+                input_type=next((c for c in self.category_priority if has("category", c)), DEFAULT_CATEGORY),
+                user_intent=next((i for i in self.intent_priority if has("intent", i)), DEFAULT_INTENT),
+                tools=tuple(tool for tool in self.tool_order if has("tool", tool)),
+                sentiments=frozenset(value for kind, value in self._labels
+                                     if kind == "sentiment" and has(kind, value))
+            )
+            self._decoded[mask] = decoded
+        return decoded
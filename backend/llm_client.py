@@ -1,18 +1,61 @@
 import os
+import json
+import time
+import asyncio
 import logging
-from typing import List, Dict, Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import AsyncIterator, Hashable, List, Dict, Optional, Set
 from enum import Enum
 from dataclasses import dataclass
-from openai import OpenAI
+import httpx
+from openai import APITimeoutError, OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
 
+from llm_scheduler import PRIORITY_INTERACTIVE, PRIORITY_PROACTIVE, LLMScheduler
+from metrics import TOKEN_BUCKETS, registry
+from prompt_builder import PromptBuilder, TokenCounter
+from provider_router import CircuitOpenError, ProviderEndpoint, ProviderRouter
+from response_cache import ResponseCache
+from retry_budget import RetryBudget
+from semantic_cache import SemanticCache
+from singleflight import SingleFlight
+
 # 加载环境变量
 load_dotenv()
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 日志输出由 log_config.setup_logging 统一配置
 logger = logging.getLogger(__name__)
 
+# 上游调用的用途：reply对话回复，summary长期记忆摘要（不属于任何性格，personality标签为空）
+PURPOSE_REPLY = "reply"
+PURPOSE_SUMMARY = "summary"
+
+# 指标（GET /metrics 导出）
+LLM_CALL_DURATION = registry.histogram(
+    "llm_call_duration_seconds", "单次上游LLM调用耗时", ("provider", "purpose", "personality", "outcome")
+)
+LLM_PROMPT_TOKENS = registry.histogram(
+    "llm_prompt_tokens", "单次上游LLM调用的提示词token数", ("provider", "purpose", "personality"),
+    buckets=TOKEN_BUCKETS
+)
+LLM_COMPLETION_TOKENS = registry.histogram(
+    "llm_completion_tokens", "单次上游LLM调用的生成token数", ("provider", "purpose", "personality"),
+    buckets=TOKEN_BUCKETS
+)
+LLM_RESPONSE_DURATION = registry.histogram(
+    "llm_response_duration_seconds", "生成一条回复的端到端耗时（含缓存、排队和重试）", ("personality", "outcome")
+)
+LLM_RESPONSES = registry.counter(
+    "llm_responses_total", "按结果（success/cache/fallback/timeout）统计的回复数", ("personality", "outcome")
+)
+
+def _is_timeout(error: BaseException) -> bool:
+    return isinstance(error, (APITimeoutError, httpx.TimeoutException, asyncio.TimeoutError, TimeoutError))
+
+def _record_response(personality: "PersonalityType", start: float, outcome: str):
+    LLM_RESPONSE_DURATION.observe(time.perf_counter() - start, personality=personality, outcome=outcome)
+    LLM_RESPONSES.inc(personality=personality, outcome=outcome)
+
 class PersonalityType(str, Enum):
     COLD = "cold"
     CLINGY = "clingy"
@@ -34,8 +77,57 @@ class LLMClient:
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         self.openai_model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
         
-        # 初始化客户端
-        self.client = None
+        # HTTP连接池配置（同步和异步客户端各自复用keep-alive连接）
+        self.pool_size = int(os.getenv("LLM_POOL_SIZE", "20"))
+        self.keepalive_size = int(os.getenv("LLM_KEEPALIVE_SIZE", str(self.pool_size)))
+        self.timeout = float(os.getenv("LLM_TIMEOUT", "30"))
+        self.connect_timeout = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+        
+        # 响应缓存（LLM_CACHE_SIZE=0 关闭）
+        self.response_cache = ResponseCache(
+            max_entries=int(os.getenv("LLM_CACHE_SIZE", "512")),
+            ttl=float(os.getenv("LLM_CACHE_TTL", "300")),
+            variants_per_key=int(os.getenv("LLM_CACHE_VARIANTS", "3"))
+        )
+        
+        # 语义近似缓存（LLM_SEMANTIC_CACHE_SIZE=0 关闭）
+        self.semantic_cache = SemanticCache(
+            threshold=float(os.getenv("LLM_SEMANTIC_THRESHOLD", "0.7")),
+            max_entries_per_personality=int(os.getenv("LLM_SEMANTIC_CACHE_SIZE", "256")),
+            variants_per_prompt=int(os.getenv("LLM_CACHE_VARIANTS", "3")),
+            ttl=float(os.getenv("LLM_CACHE_TTL", "300"))
+        )
+        
+        # 合并同时在途的相同请求
+        self.singleflight = SingleFlight()
+        
+        # 全局并发上限和优先级调度（对话 > 问候 > 后台主动生成）
+        self.scheduler = LLMScheduler(max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT", "8")))
+        
+        # 提示词token预算（系统提示词 + 工具信息 + 历史），默认按字符估算；
+        # LLM_TOKENIZER指定tiktoken编码时需要词表已缓存在TIKTOKEN_CACHE_DIR中
+        self.prompt_builder = PromptBuilder(
+            TokenCounter(os.getenv("LLM_TOKENIZER", "estimate")),
+            token_budget=int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "1024")),
+            memory_token_budget=int(os.getenv("LLM_MEMORY_TOKEN_BUDGET", "200"))
+        )
+        
+        # 对冲请求：主请求超过p95延迟仍未返回时再发一个，取先返回的结果
+        self.hedge_enabled = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+        self.hedge_percentile = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+        self.hedge_default_delay = float(os.getenv("LLM_HEDGE_DELAY", "2"))  # 还没有延迟样本时使用
+        self.hedge_min_delay = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.05"))
+        self._hedge_executor: Optional[ThreadPoolExecutor] = None
+        
+        # 全局重试预算（重试和对冲共用）
+        self.retry_budget = RetryBudget(
+            ratio=float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.1")),
+            max_tokens=float(os.getenv("LLM_RETRY_BUDGET_MAX", "10")),
+            backoff_base=float(os.getenv("LLM_RETRY_BACKOFF_BASE", "0.1")),
+            backoff_max=float(os.getenv("LLM_RETRY_BACKOFF_MAX", "2"))
+        )
+        
+        # 初始化客户端（按健康度在各提供商之间路由）
         self._init_client()
         
         # 性格提示词模板
@@ -81,85 +173,606 @@ class LLMClient:
 请始终保持这个性格特点，用温和、安静、默默陪伴的方式回应主人。"""
         }
     
+    def _http_options(self) -> dict:
+        """HTTP连接池和超时配置"""
+        return {
+            "limits": httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.keepalive_size
+            ),
+            "timeout": httpx.Timeout(self.timeout, connect=self.connect_timeout)
+        }
+    
+    def _create_endpoint(self, name: str, api_key: str, model: str, base_url: Optional[str] = None) -> ProviderEndpoint:
+        """创建一个提供商端点（同步和异步客户端共用配置）"""
+        client_kwargs = {"api_key": api_key, "max_retries": 0}  # 重试和切换由路由负责
+        if base_url:
+            client_kwargs["base_url"] = base_url
+        return ProviderEndpoint(
+            name=name,
+            model=model,
+            client=OpenAI(http_client=httpx.Client(**self._http_options()), **client_kwargs),
+            async_client=AsyncOpenAI(http_client=httpx.AsyncClient(**self._http_options()), **client_kwargs),
+            base_url=base_url
+        )
+    
+    def _load_providers(self) -> List[ProviderEndpoint]:
+        """按优先级加载配置的提供商：DeepSeek、OpenAI，以及LLM_PROVIDERS中的额外端点"""
+        providers = []
+        if self.deepseek_api_key:
+            providers.append(self._create_endpoint(
+                "deepseek", self.deepseek_api_key, self.deepseek_model, self.deepseek_base_url
+            ))
+        if self.openai_api_key:
+            providers.append(self._create_endpoint("openai", self.openai_api_key, self.openai_model))
+        
+        # 额外端点，JSON数组：[{"name": ..., "base_url": ..., "api_key": ..., "model": ...}]
+        extra = os.getenv("LLM_PROVIDERS")
+        if extra:
+            try:
+                for item in json.loads(extra):
+                    providers.append(self._create_endpoint(
+                        item["name"], item.get("api_key", "none"), item["model"], item.get("base_url")
+                    ))
+            except (ValueError, KeyError, TypeError) as e:
+                logger.error(f"LLM_PROVIDERS配置无效: {e}")
+        
+        return providers
+    
     def _init_client(self):
         """初始化LLM客户端"""
         try:
-            if self.deepseek_api_key:
-                # 使用DeepSeek
-                self.client = OpenAI(
-                    api_key=self.deepseek_api_key,
-                    base_url=self.deepseek_base_url
-                )
-                logger.info("使用DeepSeek API")
-            elif self.openai_api_key:
-                # 使用OpenAI作为备用
-                self.client = OpenAI(api_key=self.openai_api_key)
-                logger.info("使用OpenAI API")
-            else:
-                logger.error("未配置API密钥")
-                self.client = None
+            providers = self._load_providers()
         except Exception as e:
             logger.error(f"初始化LLM客户端失败: {e}")
-            self.client = None
-    
-    def _format_conversation(self, messages: List[ConversationMessage]) -> List[Dict]:
-        """格式化对话消息"""
-        formatted_messages = []
-        for msg in messages:
-            # 确保role是有效的值
-            if msg.role not in ["system", "user", "assistant"]:
+            providers = []
+        
+        if providers:
+            logger.info(f"使用LLM提供商: {', '.join(provider.name for provider in providers)}")
+        else:
+            logger.error("未配置API密钥")
+        
+        self.router = ProviderRouter(
+            providers,
+            failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "3")),
+            reset_timeout=float(os.getenv("LLM_BREAKER_RESET", "30"))
+        )
+    
+    @property
+    def client(self):
+        """首选提供商的同步客户端（兼容旧代码）"""
+        return self.router.providers[0].client if self.router.providers else None
+    
+    @property
+    def async_client(self):
+        """首选提供商的异步客户端（兼容旧代码）"""
+        return self.router.providers[0].async_client if self.router.providers else None
+    
+    def _build_messages(
+        self,
+        user_input: str,
+        personality: PersonalityType,
+        conversation_history: List[Dict] = None,
+        tool_context: Optional[str] = None,
+        memory: Optional[str] = None
+    ) -> List[Dict]:
+        """构建发送给LLM的消息列表（系统提示词 + 长期记忆 + 工具信息 + 预算内的最近历史）"""
+        prompt = self.prompt_builder.build(
+            self.personality_prompts[personality], user_input, conversation_history, tool_context, memory
+        )
+        logger.debug(
+            f"提示词token数: {prompt.prompt_tokens}/{self.prompt_builder.token_budget}，"
+            f"历史消息{prompt.history_turns}条{'，工具信息已截断' if prompt.truncated else ''}"
+        )
+        return prompt.messages
+    
+    def _completion_params(self, messages: List[Dict], model: str) -> Dict:
+        """LLM调用参数"""
+        return {
+            "model": model,
+            "messages": messages,
+            "max_tokens": 150,
+            "temperature": 0.8,
+            "top_p": 0.9
+        }
+    
+    def _cached_response(
+        self,
+        user_input: str,
+        personality: PersonalityType,
+        conversation_history: Optional[List[Dict]],
+        tool_context: Optional[str],
+        memory: Optional[str] = None
+    ) -> tuple:
+        """依次查精确缓存和语义缓存，返回 (缓存键, 缓存的回复或None)"""
+        cache_key = self.response_cache.make_key(
+            personality, user_input, tool_context, conversation_history, memory=memory
+        )
+        cached = self.response_cache.get(cache_key)
+        
+        # 语义缓存只用于没见过的说法；精确缓存里已有该键时让它继续积累候选回复。
+        # 语义缓存不区分上下文，带工具结果、对话历史或长期记忆的输入不走语义缓存
+        if cached is None and not self._has_context(tool_context, conversation_history, memory) \
+                and not self.response_cache.contains(cache_key):
+            cached = self.semantic_cache.lookup(personality, user_input)
+        
+        return cache_key, cached
+    
+    @staticmethod
+    def _drop_context(
+        context_free: bool,
+        tool_context: Optional[str],
+        conversation_history: Optional[List[Dict]],
+        memory: Optional[str]
+    ) -> tuple:
+        """不依赖上下文的简单互动不带历史和记忆（有工具结果时照常带上），返回 (对话历史, 记忆)
+
+        这样生成的回复对任何上下文都适用，精确缓存和语义缓存只按输入命中；其它输入带着上下文，
+        只能命中上下文相同的精确缓存。
+        """
+        if context_free and not tool_context:
+            return None, None
+        return conversation_history, memory
+    
+    @staticmethod
+    def _has_context(
+        tool_context: Optional[str],
+        conversation_history: Optional[List[Dict]],
+        memory: Optional[str]
+    ) -> bool:
+        return bool(tool_context or conversation_history or memory)
+    
+    def _remember(
+        self,
+        cache_key: tuple,
+        user_input: str,
+        personality: PersonalityType,
+        contextual: bool,
+        response: str
+    ):
+        """把LLM的回复写入缓存（带上下文的回复只写精确缓存）"""
+        self.response_cache.put(cache_key, response)
+        if not contextual:
+            self.semantic_cache.add(personality, user_input, response)
+    
+    def _record_call(
+        self,
+        provider: ProviderEndpoint,
+        personality: Optional[PersonalityType],
+        elapsed: float,
+        error: Optional[Exception] = None,
+        messages: Optional[List[Dict]] = None,
+        content: str = "",
+        usage=None,
+        purpose: str = PURPOSE_REPLY
+    ):
+        """记录一次上游调用：路由健康度、耗时和token用量（响应没有usage时按提示词估算）"""
+        self.router.record(provider, elapsed, ok=error is None)
+        outcome = "success" if error is None else "timeout" if _is_timeout(error) else "error"
+        labels = {"provider": provider.name, "purpose": purpose, "personality": personality or ""}
+        LLM_CALL_DURATION.observe(elapsed, outcome=outcome, **labels)
+        if error is not None:
+            return
+        
+        counter = self.prompt_builder.counter
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or \
+            sum(counter.count_message(message) for message in messages or [])
+        completion_tokens = getattr(usage, "completion_tokens", None) or counter.count(content)
+        LLM_PROMPT_TOKENS.observe(prompt_tokens, **labels)
+        LLM_COMPLETION_TOKENS.observe(completion_tokens, **labels)
+    
+    def _call_provider(
+        self,
+        provider: ProviderEndpoint,
+        messages: List[Dict],
+        personality: Optional[PersonalityType],
+        purpose: str = PURPOSE_REPLY
+    ) -> str:
+        """调用一个提供商并记录延迟和结果"""
+        self.router.acquire(provider)
+        start = time.perf_counter()
+        try:
+            response = provider.client.chat.completions.create(**self._completion_params(messages, provider.model))
+            content = response.choices[0].message.content.strip()
+        except Exception as e:
+            self._record_call(provider, personality, time.perf_counter() - start, error=e, purpose=purpose)
+            raise
+        self._record_call(
+            provider, personality, time.perf_counter() - start,
+            messages=messages, content=content, usage=getattr(response, "usage", None), purpose=purpose
+        )
+        return content
+    
+    async def _acall_provider(
+        self,
+        provider: ProviderEndpoint,
+        messages: List[Dict],
+        personality: Optional[PersonalityType],
+        purpose: str = PURPOSE_REPLY
+    ) -> str:
+        """异步版本的 _call_provider（被取消时不记录结果，只归还半开试探名额）"""
+        self.router.acquire(provider)
+        start = time.perf_counter()
+        try:
+            response = await provider.async_client.chat.completions.create(
+                **self._completion_params(messages, provider.model)
+            )
+            content = response.choices[0].message.content.strip()
+        except asyncio.CancelledError:
+            self.router.release(provider)
+            raise
+        except Exception as e:
+            self._record_call(provider, personality, time.perf_counter() - start, error=e, purpose=purpose)
+            raise
+        self._record_call(
+            provider, personality, time.perf_counter() - start,
+            messages=messages, content=content, usage=getattr(response, "usage", None), purpose=purpose
+        )
+        return content
+    
+    def _hedge_delay(self, provider: ProviderEndpoint) -> float:
+        """对冲延迟：该提供商的p95延迟，还没有样本时使用默认值"""
+        latency = self.router.latency_percentile(provider, self.hedge_percentile)
+        if latency is None:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, latency)
+    
+    @staticmethod
+    def _hedge_target(candidates: List[ProviderEndpoint]) -> ProviderEndpoint:
+        """对冲请求优先发往备用提供商，只有一个提供商时发往同一个"""
+        return candidates[1] if len(candidates) > 1 else candidates[0]
+    
+    def _hedged_call(
+        self,
+        candidates: List[ProviderEndpoint],
+        messages: List[Dict],
+        personality: Optional[PersonalityType],
+        purpose: str = PURPOSE_REPLY,
+        tried: Optional[Set[str]] = None
+    ) -> str:
+        """主请求超过对冲延迟仍未返回时，再发一个对冲请求，取先成功的结果
+
+        发过请求的提供商名称加入 tried，失败后重试时跳过它们。
+        """
+        tried = set() if tried is None else tried
+        primary = candidates[0]
+        if self._hedge_executor is None:
+            self._hedge_executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="llm-hedge")
+        
+        tried.add(primary.name)
+        pending = {self._hedge_executor.submit(self._call_provider, primary, messages, personality, purpose)}
+        done, pending = wait(pending, timeout=self._hedge_delay(primary))
+        hedge = None
+        if not done and self.retry_budget.acquire_hedge():
+            target = self._hedge_target(candidates)
+            tried.add(target.name)
+            hedge = self._hedge_executor.submit(self._call_provider, target, messages, personality, purpose)
+            pending.add(hedge)
+        
+        last_error: Optional[Exception] = None
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self.retry_budget.record_hedge_win()
+                    # 同步请求无法中断，落后的请求在后台完成后丢弃
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                last_error = future.exception()
+            if not pending:
+                raise last_error
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+    
+    async def _ahedged_call(
+        self,
+        candidates: List[ProviderEndpoint],
+        messages: List[Dict],
+        personality: Optional[PersonalityType],
+        purpose: str = PURPOSE_REPLY,
+        tried: Optional[Set[str]] = None
+    ) -> str:
+        """异步版本的 _hedged_call，落后的请求会被取消"""
+        tried = set() if tried is None else tried
+        primary = candidates[0]
+        tried.add(primary.name)
+        pending = {asyncio.ensure_future(self._acall_provider(primary, messages, personality, purpose))}
+        done, pending = await asyncio.wait(pending, timeout=self._hedge_delay(primary))
+        hedge = None
+        if not done and self.retry_budget.acquire_hedge():
+            target = self._hedge_target(candidates)
+            tried.add(target.name)
+            hedge = asyncio.ensure_future(self._acall_provider(target, messages, personality, purpose))
+            pending.add(hedge)
+        
+        last_error: Optional[BaseException] = None
+        try:
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.retry_budget.record_hedge_win()
+                        return task.result()
+                    last_error = task.exception()
+                if not pending:
+                    raise last_error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    def _complete(
+        self,
+        messages: List[Dict],
+        personality: Optional[PersonalityType],
+        purpose: str = PURPOSE_REPLY
+    ) -> str:
+        """按健康度依次尝试各提供商，返回第一个成功的回复；重试受全局预算限制
+
+        personality 和 purpose 只用于指标标签（摘要等不属于某个性格的调用 personality 为None）
+        """
+        self.retry_budget.deposit()
+        candidates = self.router.candidates()
+        last_error: Optional[Exception] = None
+        tried: Set[str] = set()
+        attempt = 0
+        for provider in candidates:
+            # 对冲请求已经发过的提供商不再重试
+            if provider.name in tried:
                 continue
-            formatted_messages.append({
-                "role": msg.role, 
-                "content": msg.content
-            })
-        return formatted_messages
+            if attempt:
+                if not self.retry_budget.acquire_retry():
+                    break
+                time.sleep(self.retry_budget.backoff(attempt))
+            attempt += 1
+            try:
+                if self.hedge_enabled and attempt == 1:
+                    return self._hedged_call(candidates, messages, personality, purpose, tried)
+                tried.add(provider.name)
+                return self._call_provider(provider, messages, personality, purpose)
+            except Exception as e:
+                logger.warning(f"LLM提供商 {provider.name} 调用失败: {e}")
+                last_error = e
+        
+        raise last_error or RuntimeError("没有可用的LLM提供商（全部熔断）")
+    
+    async def _acomplete(
+        self,
+        messages: List[Dict],
+        personality: Optional[PersonalityType],
+        purpose: str = PURPOSE_REPLY
+    ) -> str:
+        """异步版本的 _complete"""
+        self.retry_budget.deposit()
+        candidates = self.router.candidates()
+        last_error: Optional[Exception] = None
+        tried: Set[str] = set()
+        attempt = 0
+        for provider in candidates:
+            if provider.name in tried:
+                continue
+            if attempt:
+                if not self.retry_budget.acquire_retry():
+                    break
+                await asyncio.sleep(self.retry_budget.backoff(attempt))
+            attempt += 1
+            try:
+                if self.hedge_enabled and attempt == 1:
+                    return await self._ahedged_call(candidates, messages, personality, purpose, tried)
+                tried.add(provider.name)
+                return await self._acall_provider(provider, messages, personality, purpose)
+            except Exception as e:
+                logger.warning(f"LLM提供商 {provider.name} 调用失败: {e}")
+                last_error = e
+        
+        raise last_error or RuntimeError("没有可用的LLM提供商（全部熔断）")
     
     def generate_response(
         self, 
         user_input: str, 
         personality: PersonalityType,
-        conversation_history: List[Dict] = None
+        conversation_history: List[Dict] = None,
+        tool_context: Optional[str] = None,
+        priority: str = PRIORITY_INTERACTIVE,
+        session: Optional[Hashable] = None,
+        memory: Optional[str] = None,
+        context_free: bool = False
     ) -> str:
-        """生成性格化的对话响应"""
-        if not self.client:
+        """生成性格化的对话响应
+
+        priority/session 用于调度：优先级高的先执行，同一优先级内按会话（宠物）轮流；
+        memory 是该宠物的长期记忆摘要；context_free 表示调用方判断这是不依赖上下文的简单互动
+        （问候、告别、摸摸抱抱），不带历史和记忆生成，回复只按输入缓存
+        """
+        start = time.perf_counter()
+        conversation_history, memory = self._drop_context(context_free, tool_context, conversation_history, memory)
+        if not self.router.providers:
+            _record_response(personality, start, "fallback")
             return self._fallback_response(user_input, personality)
         
-        try:
-            # 构建对话历史
-            messages = []
-            
-            # 添加系统提示词
-            system_prompt = self.personality_prompts[personality]
-            messages.append(ConversationMessage("system", system_prompt))
-            
-            # 添加对话历史（限制长度）
-            if conversation_history:
-                for msg in conversation_history[-6:]:  # 保留最近6轮对话
-                    # 确保消息格式正确
-                    if "user_input" in msg and "pet_response" in msg:
-                        messages.append(ConversationMessage("user", msg["user_input"]))
-                        messages.append(ConversationMessage("assistant", msg["pet_response"]))
-                    elif "role" in msg and "content" in msg:
-                        messages.append(ConversationMessage(msg["role"], msg["content"]))
+        cache_key, cached = self._cached_response(
+            user_input, personality, conversation_history, tool_context, memory
+        )
+        if cached is not None:
+            _record_response(personality, start, "cache")
+            return cached
+        
+        def call_llm() -> str:
+            messages = self._build_messages(user_input, personality, conversation_history, tool_context, memory)
             
-            # 添加当前用户输入
-            messages.append(ConversationMessage("user", user_input))
+            # 调用LLM（受全局并发上限和优先级调度）
+            with self.scheduler.slot(priority, session):
+                content = self._complete(messages, personality)
             
-            # 调用LLM
-            response = self.client.chat.completions.create(
-                model=self.deepseek_model if self.deepseek_api_key else self.openai_model,
-                messages=self._format_conversation(messages),
-                max_tokens=150,
-                temperature=0.8,
-                top_p=0.9
+            self._remember(
+                cache_key, user_input, personality,
+                self._has_context(tool_context, conversation_history, memory), content
             )
+            return content
+        
+        try:
+            # 相同请求同时在途时只调用一次LLM
+            content = self.singleflight.do(cache_key, call_llm)
+            
+        except Exception as e:
+            logger.error(f"LLM调用失败: {e}")
+            _record_response(personality, start, "timeout" if _is_timeout(e) else "fallback")
+            return self._fallback_response(user_input, personality)
+        
+        _record_response(personality, start, "success")
+        return content
+    
+    async def agenerate_response(
+        self,
+        user_input: str,
+        personality: PersonalityType,
+        conversation_history: List[Dict] = None,
+        tool_context: Optional[str] = None,
+        priority: str = PRIORITY_INTERACTIVE,
+        session: Optional[Hashable] = None,
+        memory: Optional[str] = None,
+        context_free: bool = False
+    ) -> str:
+        """异步生成性格化的对话响应（不阻塞事件循环）"""
+        start = time.perf_counter()
+        conversation_history, memory = self._drop_context(context_free, tool_context, conversation_history, memory)
+        if not self.router.providers:
+            _record_response(personality, start, "fallback")
+            return self._fallback_response(user_input, personality)
+        
+        cache_key, cached = self._cached_response(
+            user_input, personality, conversation_history, tool_context, memory
+        )
+        if cached is not None:
+            _record_response(personality, start, "cache")
+            return cached
+        
+        async def call_llm() -> str:
+            messages = self._build_messages(user_input, personality, conversation_history, tool_context, memory)
             
-            return response.choices[0].message.content.strip()
+            # 调用LLM（受全局并发上限和优先级调度）
+            async with self.scheduler.aslot(priority, session):
+                content = await self._acomplete(messages, personality)
             
+            self._remember(
+                cache_key, user_input, personality,
+                self._has_context(tool_context, conversation_history, memory), content
+            )
+            return content
+        
+        try:
+            # 相同请求同时在途时只调用一次LLM
+            content = await self.singleflight.ado(cache_key, call_llm)
+        
         except Exception as e:
             logger.error(f"LLM调用失败: {e}")
+            _record_response(personality, start, "timeout" if _is_timeout(e) else "fallback")
             return self._fallback_response(user_input, personality)
+        
+        _record_response(personality, start, "success")
+        return content
+    
+    async def astream_response(
+        self,
+        user_input: str,
+        personality: PersonalityType,
+        conversation_history: List[Dict] = None,
+        tool_context: Optional[str] = None,
+        priority: str = PRIORITY_INTERACTIVE,
+        session: Optional[Hashable] = None,
+        memory: Optional[str] = None,
+        context_free: bool = False
+    ) -> AsyncIterator[str]:
+        """流式生成响应，逐段产出文本"""
+        response_start = time.perf_counter()
+        conversation_history, memory = self._drop_context(context_free, tool_context, conversation_history, memory)
+        if not self.router.providers:
+            _record_response(personality, response_start, "fallback")
+            yield self._fallback_response(user_input, personality)
+            return
+        
+        cache_key, cached = self._cached_response(
+            user_input, personality, conversation_history, tool_context, memory
+        )
+        if cached is not None:
+            _record_response(personality, response_start, "cache")
+            yield cached
+            return
+        
+        messages = self._build_messages(user_input, personality, conversation_history, tool_context, memory)
+        emitted = False
+        chunks = []
+        last_error = None
+        # 整个流式过程占用一个执行名额
+        async with self.scheduler.aslot(priority, session):
+            # 第一个片段输出之前失败的可以切换到下一个提供商（受重试预算限制）
+            self.retry_budget.deposit()
+            for attempt, provider in enumerate(self.router.candidates()):
+                if attempt:
+                    if not self.retry_budget.acquire_retry():
+                        break
+                    await asyncio.sleep(self.retry_budget.backoff(attempt))
+                try:
+                    self.router.acquire(provider)
+                except CircuitOpenError as e:
+                    last_error = e
+                    continue
+                start = time.perf_counter()
+                try:
+                    stream = await provider.async_client.chat.completions.create(
+                        **self._completion_params(messages, provider.model), stream=True
+                    )
+                    
+                    # 客户端断开时生成器被关闭或取消，也要关闭上游流，归还HTTP连接
+                    try:
+                        async for chunk in stream:
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta.content
+                            if delta:
+                                # 去掉开头的空白，与非流式接口的strip保持一致
+                                if not emitted:
+                                    delta = delta.lstrip()
+                                    if not delta:
+                                        continue
+                                emitted = True
+                                chunks.append(delta)
+                                yield delta
+                    finally:
+                        await stream.close()
+                    
+                    if not emitted:
+                        raise ValueError("流式响应为空")
+                    
+                    content = "".join(chunks).strip()
+                    self._record_call(
+                        provider, personality, time.perf_counter() - start, messages=messages, content=content
+                    )
+                    _record_response(personality, response_start, "success")
+                    # 完整生成后才写入缓存
+                    self._remember(
+                        cache_key, user_input, personality,
+                        self._has_context(tool_context, conversation_history, memory), content
+                    )
+                    return
+                
+                except (GeneratorExit, asyncio.CancelledError):
+                    # 客户端断开不算提供商成功或失败，只归还半开试探名额
+                    self.router.release(provider)
+                    raise
+                except Exception as e:
+                    self._record_call(provider, personality, time.perf_counter() - start, error=e)
+                    logger.error(f"LLM提供商 {provider.name} 流式调用失败: {e}")
+                    # 已经输出了部分内容时直接结束
+                    if emitted:
+                        _record_response(personality, response_start, "timeout" if _is_timeout(e) else "fallback")
+                        return
+                    last_error = e
+        
+        # 所有提供商都失败，使用备用响应
+        outcome = "timeout" if last_error is not None and _is_timeout(last_error) else "fallback"
+        _record_response(personality, response_start, outcome)
+        yield self._fallback_response(user_input, personality)
     
     def generate_greeting(self, personality: PersonalityType) -> str:
         """生成主动问候"""
@@ -189,6 +802,35 @@ class LLMClient:
         import random
         return random.choice(greetings[personality])
     
+    def summarize_conversation(
+        self,
+        previous_summary: Optional[str],
+        turns: List[Dict],
+        max_chars: int,
+        session: Optional[Hashable] = None
+    ) -> str:
+        """把较早的对话折叠进长期记忆摘要（后台调用，最低优先级）；LLM不可用时直接摘录原文"""
+        dialogue = "\n".join(f"主人：{turn['user_input']}\n宠物：{turn['pet_response']}" for turn in turns)
+        if self.router.providers:
+            messages = [
+                {
+                    "role": "system",
+                    "content": f"你负责整理桌面宠物对主人的长期记忆。把已有记忆和新的对话合并成一段不超过{max_chars}字的摘要，"
+                               "保留主人的称呼、喜好、重要的事和约定，省略寒暄，只输出摘要。"
+                },
+                {"role": "user", "content": f"已有记忆：{previous_summary or '无'}\n\n新的对话：\n{dialogue}"}
+            ]
+            try:
+                with self.scheduler.slot(PRIORITY_PROACTIVE, session):
+                    return self._complete(messages, None, PURPOSE_SUMMARY)[:max_chars]
+            except Exception as e:
+                logger.error(f"生成对话摘要失败: {e}")
+        
+        # 摘录：保留主人说过的话，超出上限时丢弃最早的内容
+        excerpts = [previous_summary] if previous_summary else []
+        excerpts.extend(f"主人说“{turn['user_input']}”" for turn in turns if turn["user_input"])
+        return "；".join(excerpts)[-max_chars:]
+    
     def _fallback_response(self, user_input: str, personality: PersonalityType) -> str:
         """备用响应（当LLM不可用时）"""
         fallback_responses = {
@@ -202,5 +844,21 @@ class LLMClient:
         return random.choice(fallback_responses[personality])
     
     def is_available(self) -> bool:
-        """检查LLM服务是否可用"""
-        return self.client is not None 
\ No newline at end of file
+        """检查LLM服务是否可用（至少有一个提供商未被熔断）"""
+        return self.router.has_available()
+    
+    def current_provider(self) -> str:
+        """当前首选的提供商"""
+        candidates = self.router.candidates()
+        return candidates[0].name if candidates else "none"
+    
+    async def aclose(self):
+        """关闭HTTP连接池"""
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+            self._hedge_executor = None
+        for provider in self.router.providers:
+            if provider.client:
+                provider.client.close()
+            if provider.async_client:
+                await provider.async_client.close() 
\ No newline at end of file
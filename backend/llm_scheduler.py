@@ -0,0 +1,190 @@
+"""
+LLM请求调度（并发上限 + 优先级队列 + 会话间公平）
+"""
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Deque, Dict, Hashable, List, Optional, Tuple
+
+# 优先级：数值越小越先执行
+PRIORITY_INTERACTIVE = "interactive"  # 用户正在等待的对话
+PRIORITY_GREETING = "greeting"  # 问候
+PRIORITY_PROACTIVE = "proactive"  # 后台主动生成
+PRIORITIES = {PRIORITY_INTERACTIVE: 0, PRIORITY_GREETING: 1, PRIORITY_PROACTIVE: 2}
+
+class _Waiter:
+    """一个排队中的请求，同步请求用Event唤醒，异步请求用Future唤醒"""
+
+    __slots__ = ("priority", "queued_at", "event", "future", "loop", "granted", "cancelled")
+
+    def __init__(self, priority: str, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.priority = priority
+        self.queued_at = time.perf_counter()
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+        self.granted = False
+        self.cancelled = False
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+class _ClassStats:
+    """单个优先级的排队统计"""
+
+    def __init__(self, window: int):
+        self.queued = 0
+        self.max_queued = 0
+        self.admitted = 0
+        self.waits: Deque[float] = deque(maxlen=window)  # 秒
+
+class LLMScheduler:
+    """限制同时进行的LLM请求数；超出时按优先级排队，同一优先级内各会话轮流执行"""
+
+    def __init__(self, max_in_flight: int = 8, stats_window: int = 1000):
+        self.max_in_flight = max(1, max_in_flight)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queue: List[Tuple[int, float, int, _Waiter]] = []  # (优先级, 虚拟开始时间, 序号, 等待者)
+        self._seq = itertools.count()
+
+        # 公平调度（start-time fair queuing）：每个会话的下一个请求从其上一个请求之后开始排，
+        # 新会话从当前虚拟时间开始，因此请求多的会话不会挤占其它会话
+        self._virtual_time = 0.0
+        self._session_finish: Dict[Hashable, float] = {}
+
+        self._stats = {priority: _ClassStats(stats_window) for priority in PRIORITIES}
+
+    def _enqueue_key(self, priority: str, session: Optional[Hashable]) -> Tuple[int, float, int]:
+        start = self._virtual_time
+        if session is not None:
+            start = max(start, self._session_finish.get(session, 0.0))
+            self._session_finish[session] = start + 1
+        return PRIORITIES[priority], start, next(self._seq)
+
+    def _admit(self, waiter: _Waiter, start: float):
+        """分配一个执行名额（持有锁时调用）"""
+        self._in_flight += 1
+        self._virtual_time = max(self._virtual_time, start)
+        stats = self._stats[waiter.priority]
+        stats.admitted += 1
+        stats.waits.append(time.perf_counter() - waiter.queued_at)
+        waiter.granted = True
+
+        # 清理已经落后于虚拟时间的会话记录
+        if len(self._session_finish) > 1024:
+            self._session_finish = {
+                session: finish for session, finish in self._session_finish.items() if finish > self._virtual_time
+            }
+
+    def _try_enter(self, waiter: _Waiter, session: Optional[Hashable]) -> bool:
+        """有空闲名额且无人排队时直接执行，否则入队（持有锁时调用）"""
+        priority, start, seq = self._enqueue_key(waiter.priority, session)
+        # 队首已取消的等待者不算排队
+        while self._queue and self._queue[0][3].cancelled:
+            heapq.heappop(self._queue)
+        if self._in_flight < self.max_in_flight and not self._queue:
+            self._admit(waiter, start)
+            return True
+        heapq.heappush(self._queue, (priority, start, seq, waiter))
+        stats = self._stats[waiter.priority]
+        stats.queued += 1
+        stats.max_queued = max(stats.max_queued, stats.queued)
+        return False
+
+    def _dispatch(self):
+        """把空出来的名额分给队首的等待者（持有锁时调用）"""
+        while self._queue and self._in_flight < self.max_in_flight:
+            _, start, _, waiter = heapq.heappop(self._queue)
+            if waiter.cancelled:
+                continue
+            self._stats[waiter.priority].queued -= 1
+            self._admit(waiter, start)
+            waiter.wake()
+
+    def _validate(self, priority: str):
+        if priority not in PRIORITIES:
+            raise ValueError(f"未知的优先级: {priority}")
+
+    def acquire(self, priority: str = PRIORITY_INTERACTIVE, session: Optional[Hashable] = None):
+        """同步获取执行名额（阻塞直到轮到）"""
+        self._validate(priority)
+        waiter = _Waiter(priority)
+        with self._lock:
+            if self._try_enter(waiter, session):
+                return
+        waiter.event.wait()
+
+    async def aacquire(self, priority: str = PRIORITY_INTERACTIVE, session: Optional[Hashable] = None):
+        """异步获取执行名额（不阻塞事件循环）"""
+        self._validate(priority)
+        waiter = _Waiter(priority, asyncio.get_running_loop())
+        with self._lock:
+            if self._try_enter(waiter, session):
+                return
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    # 已分到名额但调用方被取消，归还名额
+                    self._in_flight -= 1
+                    self._dispatch()
+                else:
+                    waiter.cancelled = True
+                    self._stats[priority].queued -= 1
+            raise
+
+    def release(self):
+        """归还执行名额"""
+        with self._lock:
+            self._in_flight -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority: str = PRIORITY_INTERACTIVE, session: Optional[Hashable] = None):
+        self.acquire(priority, session)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, priority: str = PRIORITY_INTERACTIVE, session: Optional[Hashable] = None):
+        await self.aacquire(priority, session)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict:
+        """并发数、各优先级的队列深度和等待时间"""
+        with self._lock:
+            classes = {}
+            for priority, stats in self._stats.items():
+                waits = sorted(stats.waits)
+                classes[priority] = {
+                    "queued": stats.queued,
+                    "max_queued": stats.max_queued,
+                    "admitted": stats.admitted,
+                    "avg_wait_ms": sum(waits) / len(waits) * 1000 if waits else 0.0,
+                    "p95_wait_ms": waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000 if waits else 0.0
+                }
+            return {
+                "in_flight": self._in_flight,
+                "max_in_flight": self.max_in_flight,
+                "queued": sum(stats["queued"] for stats in classes.values()),
+                "classes": classes
+            }
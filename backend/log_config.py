@@ -0,0 +1,125 @@
+"""
+日志配置（后台线程输出 + JSON格式 + DEBUG日志采样）
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+# LogRecord自带的属性，其余属性（通过extra传入）作为结构化字段输出
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出一行JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc_info"] = record.exc_text
+        if record.stack_info:
+            payload["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+class DebugSampler(logging.Filter):
+    """DEBUG日志按比例采样，INFO及以上全部保留"""
+
+    def __init__(self, rate: float = 1.0, rng: Optional[random.Random] = None):
+        super().__init__()
+        self.rate = rate
+        self._random = (rng or random.Random()).random
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        return self._random() < self.rate
+
+class _StructuredQueueHandler(QueueHandler):
+    """入队前只合并消息参数并把异常转成文本，完整格式化留给后台线程"""
+
+    _exception_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[_StructuredQueueHandler] = None
+_lock = threading.Lock()
+
+def setup_logging(
+    level: Optional[str] = None,
+    json_format: Optional[bool] = None,
+    debug_sample_rate: Optional[float] = None,
+    stream=None
+) -> QueueListener:
+    """配置根日志：调用方只把日志放入队列，格式化和写输出在后台线程完成
+
+    未指定的参数从环境变量读取：LOG_LEVEL、LOG_FORMAT（json/text）、LOG_DEBUG_SAMPLE_RATE。
+    重复调用时替换之前的配置。
+    """
+    global _listener, _queue_handler
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).strip().upper()
+    if json_format is None:
+        json_format = os.getenv("LOG_FORMAT", "json").strip().lower() == "json"
+    if debug_sample_rate is None:
+        debug_sample_rate = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(
+        JsonFormatter() if json_format else logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+
+    with _lock:
+        shutdown_logging()
+
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        _queue_handler = _StructuredQueueHandler(log_queue)
+        # 在入队前采样，被丢弃的DEBUG日志不占用队列和后台线程
+        _queue_handler.addFilter(DebugSampler(debug_sample_rate))
+
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(_queue_handler)
+
+        _listener = QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        return _listener
+
+def shutdown_logging():
+    """写完队列中剩余的日志并移除队列处理器"""
+    global _listener, _queue_handler
+
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(shutdown_logging)
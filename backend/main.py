@@ -1,27 +1,47 @@
 import asyncio
+import atexit
+import functools
 import json
+import logging
 import os
-import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Optional
 from enum import Enum
 from dataclasses import dataclass
 import random
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
 # 导入LLM客户端和LangGraph Agent
 from llm_client import LLMClient, PersonalityType
+from llm_scheduler import PRIORITY_GREETING, PRIORITY_PROACTIVE
+from metrics import registry
+from checkpoint_store import CheckpointStore
 from pet_agent import PetAgent
+from summary_memory import SummaryMemory
 from tools import ToolManager
+from db_pool import ConnectionPool
+from conversation_writer import ConversationWriter
+from history_cache import HistoryCache
+from log_config import setup_logging
 
 # 加载环境变量
 load_dotenv()
 
+# 日志放入队列，由后台线程格式化输出，请求路径上不做控制台I/O
+setup_logging()
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="Desktop Pet API", version="1.0.0")
 
+# 调试模式：响应中附带工作流各节点的耗时
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
 # 数据模型
 # PersonalityType 现在从 llm_client 导入
 
@@ -46,61 +66,142 @@ class MessageRequest(BaseModel):
 class MessageResponse(BaseModel):
     response: str
 
+class ChatMessageResponse(MessageResponse):
+    """/message 的响应（问候、主动事件等接口仍返回MessageResponse）"""
+    profile: Optional[Dict[str, Dict[str, float]]] = None  # 调试模式下各节点的耗时（需开启PROFILE_NODES）
+
+class BatchMessageRequest(BaseModel):
+    messages: List[str]
+    max_concurrency: Optional[int] = None
+
+class BatchMessageResult(BaseModel):
+    response: Optional[str] = None
+    error: Optional[str] = None  # 该条处理失败时的错误信息（不保存对话）
+
+class BatchMessageResponse(BaseModel):
+    results: List[BatchMessageResult]  # 与请求中的messages顺序一致
+
 # 数据库管理
 class DatabaseManager:
-    def __init__(self, db_path: str = "pet.db"):
+    # 所有语句保持固定文本，便于连接上的预编译语句缓存复用
+    SELECT_LATEST_PET_SQL = 'SELECT * FROM pets ORDER BY id DESC LIMIT 1'
+    INSERT_PET_SQL = 'INSERT INTO pets (name, type, personality) VALUES (?, ?, ?)'
+    UPDATE_PET_TYPE_SQL = '''
+        UPDATE pets
+        SET type = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE id = (SELECT id FROM pets ORDER BY id DESC LIMIT 1)
+    '''
+    # 对话历史按 (timestamp, id) 做键集分页，走 idx_conversations_pet_time 索引
+    SELECT_HISTORY_SQL = '''
+        SELECT id, user_input, pet_response, timestamp
+        FROM conversations
+        WHERE pet_id = ?
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    '''
+    SELECT_HISTORY_BEFORE_SQL = '''
+        SELECT id, user_input, pet_response, timestamp
+        FROM conversations
+        WHERE pet_id = ? AND (timestamp, id) < (?, ?)
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    '''
+    SELECT_HISTORY_AFTER_SQL = '''
+        SELECT id, user_input, pet_response, timestamp
+        FROM conversations
+        WHERE pet_id = ? AND (timestamp, id) > (?, ?)
+        ORDER BY timestamp ASC, id ASC
+        LIMIT ?
+    '''
+
+    def __init__(
+        self,
+        db_path: str = "pet.db",
+        pool: Optional[ConnectionPool] = None,
+        max_workers: int = 4,
+        history_cache_turns: int = 20,
+        history_cache_pets: int = 128
+    ):
         self.db_path = db_path
-        self.init_database()
-    
-    def init_database(self):
-        """初始化数据库"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        self.pool = pool or ConnectionPool(db_path)
         
-        # 创建宠物表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS pets (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                type TEXT NOT NULL,
-                personality TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        # 异步接口使用的专用数据库线程（首次使用时创建），避免阻塞事件循环
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
         
-        # 创建对话历史表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS conversations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                pet_id INTEGER,
-                user_input TEXT,
-                pet_response TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (pet_id) REFERENCES pets(id)
-            )
-        ''')
+        # 当前宠物缓存：读走内存，写入时同步更新
+        self._pet_cache: Optional[Pet] = None
+        self._pet_lock = threading.Lock()
         
-        # 创建设置表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS settings (
-                key TEXT PRIMARY KEY,
-                value TEXT,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        self.init_database()
         
-        conn.commit()
-        conn.close()
+        # 对话记录走后写队列，请求路径上不再同步提交事务
+        self.conversation_writer = ConversationWriter(self.pool)
+        # 每只宠物最近几轮对话常驻内存，提示词和小页数的历史查询不再查库
+        self.history_cache = HistoryCache(self._select_history, history_cache_turns, history_cache_pets)
+        atexit.register(self.close)
+    
+    def init_database(self):
+        """初始化数据库"""
+        with self.pool.transaction() as conn:
+            cursor = conn.cursor()
+            
+            # 创建宠物表
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS pets (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    personality TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # 创建对话历史表
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS conversations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    pet_id INTEGER,
+                    user_input TEXT,
+                    pet_response TEXT,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (pet_id) REFERENCES pets(id)
+                )
+            ''')
+            
+            # 对话历史按宠物和时间查询的复合索引
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_conversations_pet_time
+                ON conversations (pet_id, timestamp, id)
+            ''')
+            
+            # 创建设置表
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS settings (
+                    key TEXT PRIMARY KEY,
+                    value TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
     
     def get_or_create_pet(self) -> Pet:
         """获取或创建宠物"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        pet = self._pet_cache
+        if pet is None:
+            with self._pet_lock:
+                # 双重检查，避免并发请求重复创建宠物
+                if self._pet_cache is None:
+                    self._pet_cache = self._load_or_create_pet()
+                pet = self._pet_cache
         
+        # 返回副本，调用方修改不会污染缓存
+        return pet.model_copy()
+    
+    def _load_or_create_pet(self) -> Pet:
+        """从数据库读取最新宠物，没有则创建"""
         # 检查是否已有宠物
-        cursor.execute('SELECT * FROM pets ORDER BY id DESC LIMIT 1')
-        result = cursor.fetchone()
+        result = self.pool.fetchone(self.SELECT_LATEST_PET_SQL)
         
         if result:
             pet = Pet(
@@ -118,13 +219,10 @@ class DatabaseManager:
             personality = random.choice(list(PersonalityType))
             name = self.get_pet_name(pet_type, personality)
             
-            cursor.execute('''
-                INSERT INTO pets (name, type, personality)
-                VALUES (?, ?, ?)
-            ''', (name, pet_type.value, personality.value))
-            
-            pet_id = cursor.lastrowid
-            conn.commit()
+            pet_id = self.pool.execute(
+                self.INSERT_PET_SQL,
+                (name, pet_type.value, personality.value)
+            )
             
             pet = Pet(
                 id=pet_id,
@@ -136,9 +234,24 @@ class DatabaseManager:
                 currentMessage=""  # 初始为空
             )
         
-        conn.close()
         return pet
     
+    def update_pet_type(self, pet_type: PetType):
+        """更改当前宠物的类型"""
+        with self._pet_lock:
+            self.pool.execute(self.UPDATE_PET_TYPE_SQL, (pet_type.value,))
+            
+            # 写穿缓存：原地更新，无缓存时保持未加载状态
+            if self._pet_cache is not None:
+                self._pet_cache = self._pet_cache.model_copy(
+                    update={"type": pet_type, "updated_at": datetime.now()}
+                )
+    
+    def invalidate_pet_cache(self):
+        """使宠物缓存失效（外部直接修改pets表后调用）"""
+        with self._pet_lock:
+            self._pet_cache = None
+    
     def get_pet_name(self, pet_type: PetType, personality: PersonalityType) -> str:
         """根据宠物类型和性格生成名字"""
         names = {
@@ -171,42 +284,149 @@ class DatabaseManager:
         return random.choice(names[pet_type][personality])
     
     def save_conversation(self, pet_id: int, user_input: str, response: str):
-        """保存对话记录"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO conversations (pet_id, user_input, pet_response)
-            VALUES (?, ?, ?)
-        ''', (pet_id, user_input, response))
-        
-        conn.commit()
-        conn.close()
+        """保存对话记录（入队后立即返回）"""
+        row = self.conversation_writer.submit(pet_id, user_input, response)
+        self.history_cache.append(pet_id, row)
+    
+    def save_conversations(self, pet_id: int, turns: List[tuple]):
+        """在一个事务中保存一批对话记录 (用户输入, 回复)，写完才返回"""
+        for row in self.conversation_writer.write_batch(pet_id, turns):
+            self.history_cache.append(pet_id, row)
+    
+    def flush_conversations(self, pet_id: int):
+        """该宠物有未落库的记录时刷新队列"""
+        if self.conversation_writer.has_pending(pet_id):
+            self.conversation_writer.flush()
     
-    def get_conversation_history(self, pet_id: int, limit: int = 10) -> List[Dict]:
-        """获取对话历史"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def _select_history(self, pet_id: int, limit: int) -> List[Dict]:
+        """从数据库读取最近的对话（按时间倒序）"""
+        # 读己之写：该宠物有未落库的记录时先刷新队列
+        self.flush_conversations(pet_id)
         
-        cursor.execute('''
-            SELECT user_input, pet_response, timestamp
-            FROM conversations
-            WHERE pet_id = ?
-            ORDER BY timestamp DESC
-            LIMIT ?
-        ''', (pet_id, limit))
+        return [
+            {"id": row[0], "user_input": row[1], "pet_response": row[2], "timestamp": row[3]}
+            for row in self.pool.fetchall(self.SELECT_HISTORY_SQL, (pet_id, limit))
+        ]
+    
+    def get_recent_turns(self, pet_id: int, limit: int) -> List[Dict]:
+        """最近几轮对话（按时间倒序），用于拼提示词；尚未落库的记录id为None"""
+        rows = self.history_cache.get(pet_id, limit)
+        return rows if rows is not None else self._select_history(pet_id, limit)
+    
+    def get_conversation_history(
+        self,
+        pet_id: int,
+        limit: int = 10,
+        before: Optional[str] = None,
+        after: Optional[str] = None
+    ) -> List[Dict]:
+        """获取对话历史（按时间倒序，支持before/after游标分页）"""
+        if before and after:
+            raise ValueError("before和after不能同时使用")
         
-        results = cursor.fetchall()
-        conn.close()
+        results = None if before or after else self.history_cache.get(pet_id, limit)
+        if results is not None:
+            # 缓存中还有未落库的记录时先刷新队列，回填id后才能生成游标
+            if any(row["id"] is None for row in results):
+                self.conversation_writer.flush()
+            results = [(row["id"], row["user_input"], row["pet_response"], row["timestamp"]) for row in results]
+        else:
+            # 读己之写：该宠物有未落库的记录时先刷新队列
+            if self.conversation_writer.has_pending(pet_id):
+                self.conversation_writer.flush()
+            
+            if before:
+                timestamp, row_id = self.parse_cursor(before)
+                results = self.pool.fetchall(self.SELECT_HISTORY_BEFORE_SQL, (pet_id, timestamp, row_id, limit))
+            elif after:
+                timestamp, row_id = self.parse_cursor(after)
+                results = self.pool.fetchall(self.SELECT_HISTORY_AFTER_SQL, (pet_id, timestamp, row_id, limit))
+                results.reverse()  # 统一为时间倒序
+            else:
+                results = self.pool.fetchall(self.SELECT_HISTORY_SQL, (pet_id, limit))
         
         return [
             {
-                "user_input": row[0],
-                "pet_response": row[1],
-                "timestamp": row[2]
+                "id": row[0],
+                "user_input": row[1],
+                "pet_response": row[2],
+                "timestamp": row[3],
+                "cursor": self.make_cursor(row[3], row[0])
             }
             for row in results
         ]
+    
+    @staticmethod
+    def make_cursor(timestamp: str, row_id: int) -> str:
+        """生成分页游标"""
+        return f"{timestamp}|{row_id}"
+    
+    @staticmethod
+    def parse_cursor(cursor: str) -> tuple:
+        """解析分页游标，返回 (timestamp, id)"""
+        timestamp, sep, row_id = cursor.rpartition("|")
+        if not sep or not row_id.isdigit():
+            raise ValueError(f"无效的游标: {cursor}")
+        return timestamp, int(row_id)
+    
+    # 异步接口：阻塞的SQLite操作放到数据库线程执行
+    async def run_in_executor(self, func, *args, **kwargs):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="db")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+    
+    async def aget_or_create_pet(self) -> Pet:
+        """异步获取或创建宠物"""
+        if self._pet_cache is not None:
+            # 缓存命中只是内存操作，无需切换线程
+            return self.get_or_create_pet()
+        return await self.run_in_executor(self.get_or_create_pet)
+    
+    async def aget_recent_turns(self, pet_id: int, limit: int) -> List[Dict]:
+        """异步读取最近几轮对话"""
+        if 0 < limit <= self.history_cache.max_turns and self.history_cache.cached(pet_id):
+            # 缓存命中只是内存操作，无需切换线程
+            return self.get_recent_turns(pet_id, limit)
+        return await self.run_in_executor(self.get_recent_turns, pet_id, limit)
+    
+    async def aupdate_pet_type(self, pet_type: PetType):
+        """异步更改当前宠物的类型"""
+        await self.run_in_executor(self.update_pet_type, pet_type)
+    
+    async def asave_conversation(self, pet_id: int, user_input: str, response: str):
+        """异步保存对话记录（入队为内存操作，直接执行）"""
+        self.save_conversation(pet_id, user_input, response)
+    
+    async def asave_conversations(self, pet_id: int, turns: List[tuple]):
+        """异步批量保存对话记录"""
+        await self.run_in_executor(self.save_conversations, pet_id, turns)
+    
+    async def aget_conversation_history(
+        self,
+        pet_id: int,
+        limit: int = 10,
+        before: Optional[str] = None,
+        after: Optional[str] = None
+    ) -> List[Dict]:
+        """异步获取对话历史"""
+        if (
+            not before and not after and 0 < limit <= self.history_cache.max_turns
+            and self.history_cache.cached(pet_id) and not self.conversation_writer.has_pending(pet_id)
+        ):
+            # 缓存命中且记录都已落库，只是内存操作，无需切换线程
+            return self.get_conversation_history(pet_id, limit)
+        return await self.run_in_executor(
+            self.get_conversation_history, pet_id, limit, before=before, after=after
+        )
+    
+    def close(self):
+        """写完队列中的对话记录并关闭数据库连接"""
+        self.conversation_writer.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.pool.close_all()
 
 # 对话系统
 class DialogueManager:
@@ -217,15 +437,36 @@ class DialogueManager:
         """使用LLM生成性格化的对话响应"""
         return self.llm_client.generate_response(user_input, personality, conversation_history)
     
+    async def agenerate_response(self, user_input: str, personality: PersonalityType, conversation_history: List[Dict] = None) -> str:
+        """异步生成性格化的对话响应"""
+        return await self.llm_client.agenerate_response(user_input, personality, conversation_history)
+    
     def generate_greeting(self, personality: PersonalityType) -> str:
         """生成主动问候"""
         return self.llm_client.generate_greeting(personality)
 
 # 全局实例
-db_manager = DatabaseManager()
+db_manager = DatabaseManager(
+    os.getenv("PET_DB_PATH", "pet.db"),
+    history_cache_turns=int(os.getenv("HISTORY_CACHE_TURNS", "20")),
+    history_cache_pets=int(os.getenv("HISTORY_CACHE_PETS", "128"))
+)
 llm_client = LLMClient()
 dialogue_manager = DialogueManager(llm_client)
-pet_agent = PetAgent(llm_client)
+checkpoint_store = CheckpointStore(db_manager.pool, run_in_executor=db_manager.run_in_executor)
+# 长期记忆：最近几轮对话原样放进提示词，每隔若干轮在后台把更早的对话折叠进摘要
+summary_memory = SummaryMemory(
+    db_manager.pool,
+    llm_client.summarize_conversation,
+    every_n_turns=int(os.getenv("MEMORY_SUMMARY_EVERY", "10")),
+    recent_turns=int(os.getenv("MEMORY_RECENT_TURNS", "6")),
+    max_summary_chars=int(os.getenv("MEMORY_SUMMARY_MAX_CHARS", "600")),
+    history=db_manager.get_recent_turns,
+    run_in_executor=db_manager.run_in_executor,
+    ahistory=db_manager.aget_recent_turns,
+    flush=db_manager.flush_conversations
+)
+pet_agent = PetAgent(llm_client, checkpoint_store=checkpoint_store, memory=summary_memory)
 tool_manager = ToolManager()
 
 # API 路由
@@ -242,14 +483,28 @@ async def get_llm_status():
     """获取LLM服务状态"""
     return {
         "available": llm_client.is_available(),
-        "provider": "deepseek" if llm_client.deepseek_api_key else "openai" if llm_client.openai_api_key else "none"
+        "provider": llm_client.current_provider(),
+        "providers": llm_client.router.status(),
+        "cache": llm_client.response_cache.stats(),
+        "semantic_cache": llm_client.semantic_cache.stats(),
+        "singleflight": llm_client.singleflight.stats(),
+        "retry_budget": llm_client.retry_budget.stats(),
+        "prompt": llm_client.prompt_builder.stats(),
+        "scheduler": llm_client.scheduler.stats()
     }
 
+@app.get("/metrics")
+async def get_metrics(format: str = "prometheus"):
+    """导出指标：默认Prometheus文本格式，format=json时返回带分位数的JSON"""
+    if format == "json":
+        return registry.snapshot()
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/pet/status")
 async def get_pet_status():
     """获取宠物状态"""
-    pet = db_manager.get_or_create_pet()
-    agent_status = pet_agent.get_status()
+    pet = await db_manager.aget_or_create_pet()
+    agent_status = await pet_agent.aget_status(pet.id)
     
     return {
         "pet_id": pet.id,
@@ -264,10 +519,10 @@ async def get_pet_status():
 @app.post("/pet/greeting")
 async def trigger_greeting():
     """触发主动问候"""
-    pet = db_manager.get_or_create_pet()
+    pet = await db_manager.aget_or_create_pet()
     
     # 使用LangGraph Agent生成主动问候
-    result = pet_agent.invoke("", pet.personality)  # 空消息触发主动问候
+    result = await pet_agent.ainvoke("", pet.personality, priority=PRIORITY_GREETING, session=pet.id)  # 空消息触发主动问候
     
     # 提取AI响应
     ai_messages = [msg for msg in result["messages"] if hasattr(msg, 'content') and hasattr(msg, '__class__') and 'AIMessage' in str(msg.__class__)]
@@ -295,7 +550,7 @@ async def get_available_tools():
 @app.post("/proactive/trigger")
 async def trigger_proactive_event(event_type: str):
     """触发主动事件"""
-    pet = db_manager.get_or_create_pet()
+    pet = await db_manager.aget_or_create_pet()
     
     # 确保主动互动系统已设置
     if not pet_agent.proactive_system:
@@ -307,7 +562,7 @@ async def trigger_proactive_event(event_type: str):
 @app.post("/proactive/start")
 async def start_proactive_system():
     """启动主动互动系统"""
-    pet = db_manager.get_or_create_pet()
+    pet = await db_manager.aget_or_create_pet()
     pet_agent.setup_proactive_system(pet.personality)
     return {"message": "主动互动系统已启动"}
 
@@ -320,53 +575,131 @@ async def stop_proactive_system():
 @app.get("/pet", response_model=Pet)
 async def get_pet():
     """获取宠物信息"""
-    return db_manager.get_or_create_pet()
+    return await db_manager.aget_or_create_pet()
 
 @app.head("/pet")
 async def get_pet_head():
     """获取宠物信息 - HEAD方法"""
     return {"message": "Pet info available"}
 
-@app.post("/message", response_model=MessageResponse)
+def _extract_response(result: dict) -> str:
+    """从Agent结果中取最后一条AI响应"""
+    ai_messages = [msg for msg in result["messages"] if hasattr(msg, 'content') and hasattr(msg, '__class__') and 'AIMessage' in str(msg.__class__)]
+    return ai_messages[-1].content if ai_messages else "嗯..."
+
+def _debug_profile(result: dict) -> Optional[Dict]:
+    """调试模式下返回各节点的耗时，否则返回None"""
+    return result.get("context", {}).get("profile") if DEBUG else None
+
+@app.post("/message", response_model=ChatMessageResponse, response_model_exclude_none=True)
 async def send_message(request: MessageRequest):
     """发送消息给宠物（使用LangGraph Agent）"""
-    pet = db_manager.get_or_create_pet()
+    pet = await db_manager.aget_or_create_pet()
     
     # 使用LangGraph Agent处理消息
-    result = pet_agent.invoke(request.message, pet.personality)
+    result = await pet_agent.ainvoke(request.message, pet.personality, session=pet.id)
     
     # 提取AI响应
-    ai_messages = [msg for msg in result["messages"] if hasattr(msg, 'content') and hasattr(msg, '__class__') and 'AIMessage' in str(msg.__class__)]
-    response = ai_messages[-1].content if ai_messages else "嗯..."
+    response = _extract_response(result)
     
-    # 保存对话记录
-    db_manager.save_conversation(pet.id, request.message, response)
+    # 保存对话记录，累计满若干轮后在后台更新摘要
+    await db_manager.asave_conversation(pet.id, request.message, response)
+    summary_memory.record_turn(pet.id)
     
-    return MessageResponse(response=response)
+    return ChatMessageResponse(response=response, profile=_debug_profile(result))
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "100"))
+
+@app.post("/message/batch", response_model=BatchMessageResponse)
+async def send_message_batch(request: BatchMessageRequest):
+    """批量发送消息（并发运行工作流，结果按请求顺序返回，成功的对话在一个事务中保存）"""
+    if len(request.messages) > BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"一次最多 {BATCH_MAX_SIZE} 条消息")
+    pet = await db_manager.aget_or_create_pet()
+    
+    # 批量回放/预生成排在实时对话之后，不抢占同一只宠物的交互请求
+    results = await pet_agent.abatch(
+        request.messages, pet.personality, PRIORITY_PROACTIVE, session=pet.id,
+        max_concurrency=request.max_concurrency
+    )
+    
+    items, turns = [], []
+    for message, result in zip(request.messages, results):
+        if isinstance(result, Exception):
+            logger.error("批量消息处理失败", extra={"user_input": message, "error": str(result)})
+            items.append(BatchMessageResult(error=str(result)))
+        else:
+            response = _extract_response(result)
+            turns.append((message, response))
+            items.append(BatchMessageResult(response=response))
+    
+    if turns:
+        await db_manager.asave_conversations(pet.id, turns)
+        summary_memory.record_turn(pet.id, len(turns))
+    
+    return BatchMessageResponse(results=items)
+
+def _sse_event(data: dict, event: Optional[str] = None) -> str:
+    """格式化一条Server-Sent Event"""
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n" if event else f"data: {payload}\n\n"
+
+@app.post("/message/stream")
+async def send_message_stream(request: MessageRequest):
+    """发送消息给宠物，以SSE逐段返回响应（data: {"token": ...}，结束时 event: done）"""
+    pet = await db_manager.aget_or_create_pet()
+    
+    async def event_stream():
+        result = None
+        async for kind, payload in pet_agent.astream(request.message, pet.personality, session=pet.id):
+            if kind == "token":
+                yield _sse_event({"token": payload})
+            else:
+                result = payload
+        
+        # 提取AI响应
+        response = _extract_response(result)
+        
+        # 流结束后保存完整的对话记录
+        await db_manager.asave_conversation(pet.id, request.message, response)
+        summary_memory.record_turn(pet.id)
+        
+        done = {"response": response}
+        profile = _debug_profile(result)
+        if profile:
+            done["profile"] = profile
+        yield _sse_event(done, event="done")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/conversations")
-async def get_conversations(limit: int = 10):
-    """获取对话历史"""
-    pet = db_manager.get_or_create_pet()
-    return db_manager.get_conversation_history(pet.id, limit)
+async def get_conversations(limit: int = Query(10, gt=0), before: Optional[str] = None, after: Optional[str] = None):
+    """获取对话历史（翻页时把上一页最后一条的cursor作为before传入）"""
+    pet = await db_manager.aget_or_create_pet()
+    try:
+        return await db_manager.aget_conversation_history(pet.id, limit, before=before, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/pet/change-type")
 async def change_pet_type(pet_type: PetType):
     """改变宠物类型"""
-    conn = sqlite3.connect(db_manager.db_path)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        UPDATE pets 
-        SET type = ?, updated_at = CURRENT_TIMESTAMP
-        WHERE id = (SELECT id FROM pets ORDER BY id DESC LIMIT 1)
-    ''', (pet_type.value,))
-    
-    conn.commit()
-    conn.close()
+    await db_manager.aupdate_pet_type(pet_type)
     
     return {"message": f"宠物类型已更改为 {pet_type.value}"}
 
+@app.on_event("shutdown")
+async def shutdown():
+    """关闭时写完对话记录和摘要并释放数据库、工具线程和LLM连接"""
+    summary_memory.close()
+    db_manager.close()
+    pet_agent.close()
+    await llm_client.aclose()
+
 if __name__ == "__main__":
     import uvicorn
     import os
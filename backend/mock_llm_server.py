@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+本地模拟LLM服务（OpenAI兼容的 /v1/chat/completions，支持流式）
+
+用于基准测试和CI：可配置延迟分布、错误率和token输出速率，不需要API密钥。
+
+用法：
+    python mock_llm_server.py --port 9000 --latency lognormal:0.8,0.5 --error-rate 0.02 --tokens-per-second 30
+    DEEPSEEK_API_KEY=mock DEEPSEEK_BASE_URL=http://127.0.0.1:9000/v1 python main.py
+
+延迟分布（秒）：
+    fixed:0.05                  固定延迟
+    uniform:0.02,0.08           均匀分布
+    normal:0.5,0.1              正态分布（均值, 标准差），小于0时取0
+    lognormal:0.8,0.5           对数正态分布（中位数, sigma），贴近真实LLM的长尾
+    spike:0.02,0.03,1.0         基础延迟, 尖峰概率, 尖峰延迟
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional, Union
+
+# 默认回复（按字符作为token输出）
+DEFAULT_REPLIES = [
+    "喵~主人好呀！",
+    "嗯，我在这里陪着你。",
+    "哼，才不是特意等你的。",
+    "主人主人！今天一起玩吧！"
+]
+
+def parse_latency(spec: Union[str, float, Callable[[random.Random], float]]) -> Callable[[random.Random], float]:
+    """把延迟配置解析为采样函数"""
+    if callable(spec):
+        return spec
+    if isinstance(spec, (int, float)):
+        return lambda rng: float(spec)
+
+    kind, _, args = spec.partition(":")
+    values = [float(value) for value in args.split(",")] if args else []
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    if kind == "spike":
+        base, rate, spike = values
+        return lambda rng: spike if rng.random() < rate else base
+    raise ValueError(f"未知的延迟分布: {spec}")
+
+class _MockHandler(BaseHTTPRequestHandler):
+    """处理OpenAI兼容请求"""
+
+    protocol_version = "HTTP/1.1"  # 支持keep-alive，与真实服务一致
+    disable_nagle_algorithm = True  # 头和正文分开写，避免keep-alive连接上的40ms延迟确认
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端已断开（例如对冲请求中落后的一方被取消）
+            pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/v1/models", "/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": self.server.mock.model, "object": "model"}]})
+        elif self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+            return
+
+        mock = self.server.mock
+        latency, fail = mock.next_call()
+        time.sleep(latency)
+
+        if fail:
+            self._send_json(mock.error_status, {"error": {"message": "mock failure", "type": "server_error"}})
+        elif body.get("stream"):
+            self._stream(body, mock)
+        else:
+            self._complete(body, mock)
+
+    def _complete(self, body: dict, mock: "MockLLMServer"):
+        reply = mock.next_reply()
+        if mock.tokens_per_second:
+            time.sleep(len(reply) / mock.tokens_per_second)
+        self._send_json(200, {
+            "id": f"mock-{mock.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", mock.model),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop"
+            }],
+            "usage": self._usage(body, reply)
+        })
+
+    def _stream(self, body: dict, mock: "MockLLMServer"):
+        reply = mock.next_reply()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        for char in reply:
+            chunk = {
+                "id": f"mock-{mock.calls}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", mock.model),
+                "choices": [{"index": 0, "delta": {"content": char}, "finish_reason": None}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if mock.tokens_per_second:
+                time.sleep(1 / mock.tokens_per_second)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+    @staticmethod
+    def _usage(body: dict, reply: str) -> dict:
+        prompt_tokens = sum(len(message.get("content", "")) for message in body.get("messages", []))
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(reply),
+            "total_tokens": prompt_tokens + len(reply)
+        }
+
+    def _send_json(self, status: int, payload: dict):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class MockLLMServer:
+    """在后台线程运行的模拟LLM服务"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: Union[str, float, Callable] = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        tokens_per_second: Optional[float] = None,
+        reply: Optional[str] = None,
+        model: str = "mock-model",
+        seed: Optional[int] = None
+    ):
+        self.host = host
+        self.port = port
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.tokens_per_second = tokens_per_second  # None表示不限速
+        self.reply = reply  # None时轮流使用DEFAULT_REPLIES
+        self.model = model
+
+        # delays: 依次使用的延迟序列（用于注入确定的延迟尖峰），用完后按延迟分布采样
+        self.delays: List[float] = []
+        self.calls = 0
+        self.failures = 0
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def next_call(self) -> tuple:
+        """本次请求的延迟和是否失败"""
+        with self._lock:
+            self.calls += 1
+            latency = self.delays.pop(0) if self.delays else self.latency(self._rng)
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.failures += 1
+            return latency, fail
+
+    def next_reply(self) -> str:
+        if self.reply is not None:
+            return self.reply
+        with self._lock:
+            return DEFAULT_REPLIES[self.calls % len(DEFAULT_REPLIES)]
+
+    @property
+    def url(self) -> str:
+        """OpenAI客户端使用的base_url（可直接设置为DEEPSEEK_BASE_URL）"""
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self) -> "MockLLMServer":
+        self._server = ThreadingHTTPServer((self.host, self.port), _MockHandler)
+        self._server.daemon_threads = True
+        self._server.mock = self
+        self.port = self._server.server_port
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟LLM服务（OpenAI兼容）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", default="lognormal:0.8,0.5", help="延迟分布，见模块说明")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--tokens-per-second", type=float, default=None)
+    parser.add_argument("--reply", default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = MockLLMServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        tokens_per_second=args.tokens_per_second,
+        reply=args.reply,
+        seed=args.seed
+    ).start()
+    print(f"模拟LLM服务已启动: {server.url}")
+    print(f"使用方式: DEEPSEEK_API_KEY=mock DEEPSEEK_BASE_URL={server.url} python main.py")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
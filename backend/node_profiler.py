@@ -0,0 +1,88 @@
+"""
+工作流节点性能剖析（每个节点的墙钟时间、CPU时间和内存分配）
+"""
+
+import functools
+import time
+import tracemalloc
+from typing import Callable, Dict, Optional, Tuple
+
+from metrics import LATENCY_BUCKETS, registry
+
+# 节点耗时多在毫秒级，在默认分桶前补几个更细的
+NODE_TIME_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025) + LATENCY_BUCKETS
+ALLOC_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)  # 字节
+
+# 指标（GET /metrics 导出）
+NODE_WALL_TIME = registry.histogram(
+    "pet_node_wall_seconds", "工作流节点墙钟耗时", ("node",), buckets=NODE_TIME_BUCKETS
+)
+NODE_CPU_TIME = registry.histogram(
+    "pet_node_cpu_seconds", "工作流节点在执行线程上消耗的CPU时间", ("node",), buckets=NODE_TIME_BUCKETS
+)
+NODE_ALLOCATED = registry.histogram(
+    "pet_node_allocated_bytes", "工作流节点执行期间新增的Python内存（tracemalloc）", ("node",), buckets=ALLOC_BUCKETS
+)
+
+class NodeProfiler:
+    """包装工作流节点，记录每次执行的耗时和内存分配
+
+    关闭时wrap原样返回节点函数，没有额外开销。结果写入指标直方图，并按节点累加到
+    state["context"]["profile"]，便于调试模式下随响应返回。
+
+    CPU时间取执行线程的thread_time：同步节点在各自线程中执行，数值准确；异步节点在事件循环线程上
+    执行，等待期间其它协程消耗的CPU也会计入。内存分配取tracemalloc全局计数的差值，
+    并发请求之间会互相干扰，适合看趋势。
+    """
+
+    def __init__(self, enabled: bool = False, trace_allocations: bool = False):
+        self.enabled = enabled
+        self.trace_allocations = enabled and trace_allocations
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def wrap(self, name: str, func: Callable, afunc: Optional[Callable] = None) -> Tuple[Callable, Optional[Callable]]:
+        """返回包装后的 (同步实现, 异步实现)"""
+        if not self.enabled:
+            return func, afunc
+
+        @functools.wraps(func)
+        def wrapped(state):
+            start = self._start()
+            result = func(state)
+            return self._finish(name, start, result)
+
+        awrapped = None
+        if afunc is not None:
+            @functools.wraps(afunc)
+            async def awrapped(state):
+                start = self._start()
+                result = await afunc(state)
+                return self._finish(name, start, result)
+
+        return wrapped, awrapped
+
+    def _start(self) -> tuple:
+        allocated = tracemalloc.get_traced_memory()[0] if self.trace_allocations else 0
+        return time.perf_counter(), time.thread_time(), allocated
+
+    def _finish(self, name: str, start: tuple, result):
+        wall = time.perf_counter() - start[0]
+        cpu = time.thread_time() - start[1]
+        NODE_WALL_TIME.observe(wall, node=name)
+        NODE_CPU_TIME.observe(cpu, node=name)
+
+        entry = {"wall_ms": round(wall * 1000, 3), "cpu_ms": round(cpu * 1000, 3)}
+        if self.trace_allocations:
+            allocated = max(0, tracemalloc.get_traced_memory()[0] - start[2])
+            NODE_ALLOCATED.observe(allocated, node=name)
+            entry["allocated_bytes"] = allocated
+
+        # 同一个节点在一次调用中执行多次时累加
+        if isinstance(result, dict):
+            profile: Dict[str, Dict] = result.setdefault("context", {}).setdefault("profile", {})
+            previous = profile.get(name)
+            if previous is not None:
+                entry = {key: round(previous.get(key, 0) + value, 3) for key, value in entry.items()}
+            profile[name] = entry
+        return result
@@ -3,17 +3,32 @@
 """
 
 import asyncio
-from typing import TypedDict, Annotated, Literal, Optional
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import AsyncIterator, Dict, Hashable, List, TypedDict, Annotated, Literal, Optional
 from datetime import datetime
 import random
 
+from langgraph.config import get_stream_writer
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
 from langchain_openai import ChatOpenAI
 
+from checkpoint_store import CheckpointStore
+from fast_path import FastPathResponder
+from keyword_matcher import KeywordMatch, KeywordMatcher
+from node_profiler import NodeProfiler
 from llm_client import PersonalityType, LLMClient
+from llm_scheduler import PRIORITY_INTERACTIVE
 from tools import ToolManager
 from proactive_system import ProactiveSystem
+from summary_memory import MemoryContext, SummaryMemory
+
+logger = logging.getLogger(__name__)
 
 # 定义状态类型
 class PetState(TypedDict):
@@ -26,13 +41,65 @@ class PetState(TypedDict):
     last_interaction: str  # 最后互动时间
     context: dict  # 上下文信息
 
+# 工具结果交给LLM时使用的前缀
+TOOL_RESULT_PREFIX = {
+    "get_time": "时间信息",
+    "get_weather": "天气信息",
+    "get_health": "健康状态",
+    "get_reminders": "提醒信息",
+    "feed_pet": "喂食结果",
+    "play_with_pet": "玩耍结果",
+}
+
+# 精力低于该值时宠物会累，提示词中带上对应性格的疲惫提示（不替换生成的回复）
+TIRED_ENERGY = 30
+TIRED_HINTS = {
+    PersonalityType.PLAYFUL: "你现在玩累了，回复时带点困倦，想休息一下下",
+    PersonalityType.CLINGY: "你现在有点累了，但还是想和主人待在一起",
+    PersonalityType.COLD: "你现在有点累了，话更少一些",
+    PersonalityType.QUIET: "你现在有点累，想安静地休息一下",
+}
+
 class PetAgent:
     """基于LangGraph的宠物Agent"""
     
-    def __init__(self, llm_client: LLMClient):
+    def __init__(
+        self,
+        llm_client: LLMClient,
+        checkpoint_store: Optional[CheckpointStore] = None,
+        memory: Optional[SummaryMemory] = None
+    ):
         self.llm_client = llm_client
+        # 检查点：按宠物（session）保存心情和精力，下次调用时接着用
+        self.checkpoint_store = checkpoint_store
+        # 长期记忆：最近几轮对话放进消息列表，更早的对话以摘要形式交给LLM
+        self.memory = memory
+        # 精力恢复：距上次互动每过一分钟恢复的精力（检查点中的精力按此恢复后再用）
+        self.energy_recovery_per_minute = float(os.getenv("PET_ENERGY_RECOVERY_PER_MINUTE", "2"))
         self.tool_manager = ToolManager()
+        # 关键词自动机：每条输入只扫描一遍，分类、意图、工具和心情都读同一个结果
+        self.keyword_matcher = KeywordMatcher()
+        # 分层回复：问候、告别、摸摸/抱抱等简单互动直接用本地模板回复，按比例抽样走LLM保持多样性
+        self.fast_path = FastPathResponder(
+            llm_sample_rate=float(os.getenv("FAST_PATH_LLM_SAMPLE_RATE", "0.1")),
+            max_input_chars=int(os.getenv("FAST_PATH_MAX_INPUT_CHARS", "8"))
+        )
+        if os.getenv("FAST_PATH_TEMPLATES"):
+            self.fast_path.load(os.getenv("FAST_PATH_TEMPLATES"))
+        
+        # 工具并发执行：线程池大小、默认超时（秒）和按工具覆盖的超时
+        self.tool_max_workers = int(os.getenv("TOOL_MAX_WORKERS", "4"))
+        self.tool_timeout = float(os.getenv("TOOL_TIMEOUT", "2"))
+        self.tool_timeouts: Dict[str, float] = self._load_tool_timeouts()
+        self._tool_executor: Optional[ThreadPoolExecutor] = None
+        # 批量调用时同时运行的工作流数
+        self.batch_max_concurrency = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
         self.proactive_system = None  # 将在设置性格时初始化
+        # 节点剖析：记录每个节点的耗时和内存分配（通过环境变量开启，默认关闭）
+        self.profiler = NodeProfiler(
+            enabled=os.getenv("PROFILE_NODES", "false").lower() == "true",
+            trace_allocations=os.getenv("PROFILE_NODE_ALLOCATIONS", "false").lower() == "true"
+        )
         self.workflow = self._create_workflow()
     
     def _create_workflow(self) -> StateGraph:
@@ -42,12 +109,16 @@ class PetAgent:
         workflow = StateGraph(PetState)
         
         # 添加节点
-        workflow.add_node("analyze_input", self._analyze_input_node)
-        workflow.add_node("generate_response", self._generate_response_node)
-        workflow.add_node("update_mood", self._update_mood_node)
-        workflow.add_node("check_energy", self._check_energy_node)
-        workflow.add_node("proactive_greeting", self._proactive_greeting_node)
-        workflow.add_node("tool_execution", self._tool_execution_node)
+        workflow.add_node("analyze_input", self._node("analyze_input", self._analyze_input_node))
+        workflow.add_node("generate_response", self._node(
+            "generate_response", self._generate_response_node, self._agenerate_response_node
+        ))
+        workflow.add_node("update_mood", self._node("update_mood", self._update_mood_node))
+        workflow.add_node("check_energy", self._node("check_energy", self._check_energy_node))
+        workflow.add_node("proactive_greeting", self._node("proactive_greeting", self._proactive_greeting_node))
+        workflow.add_node("tool_execution", self._node(
+            "tool_execution", self._tool_execution_node, self._atool_execution_node
+        ))
         
         # 设置入口点
         workflow.set_entry_point("analyze_input")
@@ -71,6 +142,11 @@ class PetAgent:
         
         return workflow.compile()
     
+    def _node(self, name: str, func, afunc=None) -> RunnableLambda:
+        """包装节点：invoke走同步实现，ainvoke走异步实现；开启剖析时记录每个节点的耗时"""
+        func, afunc = self.profiler.wrap(name, func, afunc)
+        return RunnableLambda(func, afunc=afunc, name=name)
+    
     def _analyze_input_node(self, state: PetState) -> PetState:
         """分析输入节点"""
         messages = state.get("messages", [])
@@ -83,44 +159,18 @@ class PetAgent:
         
         # 分析消息类型
         if isinstance(last_message, HumanMessage):
-            content = last_message.content.lower()
+            match = self.keyword_matcher.match(last_message.content)
             
             # 更新上下文
             context = state.get("context", {})
-            context["input_type"] = self._classify_input(content)
-            context["user_intent"] = self._extract_intent(content)
+            context["keyword_match"] = match
+            context["input_type"] = match.input_type
+            context["user_intent"] = match.user_intent
             
             state["context"] = context
         
         return state
     
-    def _classify_input(self, content: str) -> str:
-        """分类用户输入"""
-        if any(word in content for word in ["你好", "hello", "hi", "嗨"]):
-            return "greeting"
-        elif any(word in content for word in ["摸摸", "抱抱", "摸摸头"]):
-            return "physical_interaction"
-        elif any(word in content for word in ["开心", "高兴", "喜欢", "爱"]):
-            return "emotional"
-        elif any(word in content for word in ["再见", "拜拜", "走了"]):
-            return "farewell"
-        else:
-            return "general"
-    
-    def _extract_intent(self, content: str) -> str:
-        """提取用户意图"""
-        # 简单的意图提取
-        if "摸摸" in content:
-            return "want_physical_contact"
-        elif "抱抱" in content:
-            return "want_hug"
-        elif "开心" in content or "高兴" in content:
-            return "check_mood"
-        elif "再见" in content or "拜拜" in content:
-            return "saying_goodbye"
-        else:
-            return "general_chat"
-    
     def _should_greet_condition(self, state: PetState) -> Literal["proactive_greeting", "generate_response"]:
         """判断是否应该主动问候"""
         messages = state.get("messages", [])
@@ -146,14 +196,14 @@ class PetAgent:
         
         return "generate_response"
     
-    def _generate_response_node(self, state: PetState) -> PetState:
-        """生成响应节点"""
+    def _prepare_generation(self, state: PetState) -> Optional[tuple]:
+        """准备生成响应所需的输入，返回 (用户输入, 性格, 对话历史, 工具信息)"""
         messages = state.get("messages", [])
         personality = state.get("personality", PersonalityType.QUIET)
         context = state.get("context", {})
         
         if not messages:
-            return state
+            return None
         
         # 获取用户输入
         user_input = ""
@@ -163,130 +213,193 @@ class PetAgent:
                 break
         
         if not user_input:
-            return state
+            return None
         
         # 检查是否有工具执行结果
         tool_results = context.get("tool_results", [])
-        print(f"🤖 响应生成节点 - 工具结果: {tool_results}")
         
-        # 构建响应内容
-        if tool_results:
-            # 如果有工具结果，将其作为上下文传递给LLM
-            tool_info = "\n".join(tool_results)
-            enhanced_input = f"{user_input}\n\n工具信息：{tool_info}"
-            print(f"🔧 增强的用户输入: {enhanced_input}")
-            
-            response = self.llm_client.generate_response(
-                enhanced_input, 
-                personality,
-                self._format_conversation_history(messages)
-            )
-            print(f"✅ 包含工具结果的响应: {response}")
-        else:
-            # 正常生成响应
-            response = self.llm_client.generate_response(
-                user_input, 
-                personality,
-                self._format_conversation_history(messages)
-            )
-            print(f"📝 普通响应: {response}")
+        # 如果有工具结果，将其作为上下文传递给LLM；累了的时候附上疲惫提示
+        if state.get("energy", 100) < TIRED_ENERGY:
+            tool_results = tool_results + [f"状态：{TIRED_HINTS[PersonalityType(personality)]}"]
+        tool_info = "\n".join(tool_results) if tool_results else None
+        logger.debug("响应生成节点", extra={"tool_results": tool_results})
+        
+        return user_input, personality, self._format_conversation_history(messages), tool_info
+    
+    def _scheduling(self, state: PetState, user_input: str) -> dict:
+        """LLM调用参数：调度用的优先级和会话（宠物）、长期记忆摘要，以及是否是不依赖上下文的简单互动"""
+        context = state.get("context", {})
+        return {
+            "priority": context.get("priority", PRIORITY_INTERACTIVE),
+            "session": context.get("session"),
+            "memory": context.get("memory"),
+            "context_free": self.fast_path.is_small_talk(self._keyword_match(state, user_input), user_input)
+        }
+    
+    def _finish_generation(self, state: PetState, response: str) -> PetState:
+        """把AI响应写回状态"""
+        logger.debug(
+            "生成响应", extra={"response": response, "with_tools": bool(state.get("context", {}).get("tool_results"))}
+        )
         
         # 添加AI响应到消息列表
         ai_message = AIMessage(content=response)
-        state["messages"] = messages + [ai_message]
+        state["messages"] = state.get("messages", []) + [ai_message]
         
         # 更新最后互动时间
         state["last_interaction"] = datetime.now().isoformat()
         
         return state
     
-    def _tool_execution_node(self, state: PetState) -> PetState:
-        """工具执行节点"""
+    def _fast_reply(self, state: PetState, prepared: tuple) -> Optional[str]:
+        """简单互动的本地回复；需要LLM时返回None"""
+        user_input, personality = prepared[0], prepared[1]
+        return self.fast_path.respond(self._keyword_match(state, user_input), user_input, personality)
+    
+    def _generate_response_node(self, state: PetState) -> PetState:
+        """生成响应节点"""
+        prepared = self._prepare_generation(state)
+        if prepared is None:
+            return state
+        
+        response = self._fast_reply(state, prepared)
+        if response is None:
+            response = self.llm_client.generate_response(*prepared, **self._scheduling(state, prepared[0]))
+        return self._finish_generation(state, response)
+    
+    async def _agenerate_response_node(self, state: PetState) -> PetState:
+        """生成响应节点（异步，流式调用时逐段推送token）"""
+        prepared = self._prepare_generation(state)
+        if prepared is None:
+            return state
+        
+        response = self._fast_reply(state, prepared)
+        if response is not None:
+            if state.get("context", {}).get("stream"):
+                get_stream_writer()({"token": response})
+        elif state.get("context", {}).get("stream"):
+            writer = get_stream_writer()
+            chunks = []
+            async for token in self.llm_client.astream_response(*prepared, **self._scheduling(state, prepared[0])):
+                chunks.append(token)
+                writer({"token": token})
+            response = "".join(chunks)
+        else:
+            response = await self.llm_client.agenerate_response(*prepared, **self._scheduling(state, prepared[0]))
+        return self._finish_generation(state, response)
+    
+    def _keyword_match(self, state: PetState, user_input: str) -> KeywordMatch:
+        """当前输入的关键词匹配结果（analyze_input中计算一次，各节点共用）"""
+        match = state.get("context", {}).get("keyword_match")
+        if match is None:
+            match = self.keyword_matcher.match(user_input)
+        return match
+    
+    def _matched_tools(self, state: PetState) -> list:
+        """根据关键词匹配结果决定执行哪些工具"""
         messages = state.get("messages", [])
-        context = state.get("context", {})
         
-        # 检查是否需要执行工具
         user_input = ""
         for msg in reversed(messages):
-            if hasattr(msg, 'content') and hasattr(msg, '__class__') and 'HumanMessage' in str(msg.__class__):
+            if isinstance(msg, HumanMessage):
                 user_input = msg.content.lower()
                 break
         
-        print(f"🔧 工具执行节点 - 用户输入: {user_input}")
-        
-        # 根据用户输入决定是否执行工具
+        tool_names = list(self._keyword_match(state, user_input).tools)
+        logger.debug("工具执行节点", extra={"user_input": user_input, "tools": tool_names})
+        return tool_names
+    
+    @staticmethod
+    def _load_tool_timeouts() -> Dict[str, float]:
+        """按工具覆盖的超时，JSON对象：{"get_weather": 5}"""
+        timeouts = os.getenv("TOOL_TIMEOUTS")
+        if not timeouts:
+            return {}
+        try:
+            return {name: float(seconds) for name, seconds in json.loads(timeouts).items()}
+        except (ValueError, AttributeError, TypeError) as e:
+            logger.error(f"TOOL_TIMEOUTS配置无效: {e}")
+            return {}
+    
+    def _tool_timeout(self, tool_name: str) -> float:
+        return self.tool_timeouts.get(tool_name, self.tool_timeout)
+    
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._tool_executor is None:
+            self._tool_executor = ThreadPoolExecutor(max_workers=self.tool_max_workers, thread_name_prefix="tool")
+        return self._tool_executor
+    
+    def _run_tool(self, tool_name: str) -> tuple:
+        """在工具线程中执行，返回 (结果, 耗时秒)"""
+        start = time.perf_counter()
+        result = self.tool_manager.execute_tool(tool_name)
+        return result, time.perf_counter() - start
+    
+    def _finish_tools(self, state: PetState, outcomes: list) -> PetState:
+        """汇总工具结果：超时或失败的工具跳过，其余结果照常写入上下文"""
+        context = state.get("context", {})
         tool_results = []
-        
-        # 时间相关
-        if any(word in user_input for word in ["时间", "几点", "现在"]):
-            print(f"⏰ 检测到时间查询，执行时间工具")
-            result = self.tool_manager.execute_tool("get_time")
-            if result.success:
-                tool_results.append(f"时间信息：{result.message}")
-                print(f"✅ 时间工具执行成功: {result.message}")
-            else:
-                print(f"❌ 时间工具执行失败: {result.message}")
-        
-        # 天气相关
-        if any(word in user_input for word in ["天气", "温度", "下雨"]):
-            print(f"🌤️ 检测到天气查询，执行天气工具")
-            result = self.tool_manager.execute_tool("get_weather")
-            if result.success:
-                tool_results.append(f"天气信息：{result.message}")
-                print(f"✅ 天气工具执行成功: {result.message}")
-            else:
-                print(f"❌ 天气工具执行失败: {result.message}")
-        
-        # 健康相关
-        if any(word in user_input for word in ["健康", "状态", "怎么样"]):
-            print(f"💊 检测到健康查询，执行健康工具")
-            result = self.tool_manager.execute_tool("get_health")
-            if result.success:
-                tool_results.append(f"健康状态：{result.message}")
-                print(f"✅ 健康工具执行成功: {result.message}")
-            else:
-                print(f"❌ 健康工具执行失败: {result.message}")
-        
-        # 提醒相关
-        if any(word in user_input for word in ["提醒", "待办", "任务"]):
-            print(f"📝 检测到提醒查询，执行提醒工具")
-            result = self.tool_manager.execute_tool("get_reminders")
-            if result.success:
-                tool_results.append(f"提醒信息：{result.message}")
-                print(f"✅ 提醒工具执行成功: {result.message}")
-            else:
-                print(f"❌ 提醒工具执行失败: {result.message}")
-        
-        # 喂食相关
-        if any(word in user_input for word in ["喂食", "吃饭", "饿了"]):
-            print(f"🍽️ 检测到喂食请求，执行喂食工具")
-            result = self.tool_manager.execute_tool("feed_pet")
-            if result.success:
-                tool_results.append(f"喂食结果：{result.message}")
-                print(f"✅ 喂食工具执行成功: {result.message}")
+        tool_timings = {}
+        
+        for tool_name, result, elapsed in outcomes:
+            prefix = TOOL_RESULT_PREFIX[tool_name]
+            if result is None:
+                status = "timeout"
+                logger.warning("工具执行超时", extra={"tool": tool_name, "timeout": self._tool_timeout(tool_name)})
+            elif result.success:
+                status = "ok"
+                tool_results.append(f"{prefix}：{result.message}")
             else:
-                print(f"❌ 喂食工具执行失败: {result.message}")
-        
-        # 玩耍相关
-        if any(word in user_input for word in ["玩耍", "玩", "游戏"]):
-            print(f"🎮 检测到玩耍请求，执行玩耍工具")
-            result = self.tool_manager.execute_tool("play_with_pet")
-            if result.success:
-                tool_results.append(f"玩耍结果：{result.message}")
-                print(f"✅ 玩耍工具执行成功: {result.message}")
-            else:
-                print(f"❌ 玩耍工具执行失败: {result.message}")
+                status = "error"
+                logger.warning("工具执行失败", extra={"tool": tool_name, "error": result.message})
+            tool_timings[tool_name] = {"status": status, "elapsed_ms": round(elapsed * 1000, 3)}
         
         # 更新上下文
+        if tool_timings:
+            context["tool_timings"] = tool_timings
+            logger.debug("工具执行完成", extra={"tool_results": tool_results, "tool_timings": tool_timings})
         if tool_results:
             context["tool_results"] = tool_results
-            state["context"] = context
-            print(f"📦 工具结果已保存到上下文: {tool_results}")
-        else:
-            print(f"ℹ️ 没有检测到需要执行的工具")
+        state["context"] = context
         
         return state
     
+    def _tool_execution_node(self, state: PetState) -> PetState:
+        """工具执行节点（匹配到的工具并发执行，每个工具有各自的超时）"""
+        tool_names = self._matched_tools(state)
+        start = time.perf_counter()
+        futures = [(name, self._executor().submit(self._run_tool, name)) for name in tool_names]
+        outcomes = []
+        for tool_name, future in futures:
+            # 所有工具同时开始，各自的截止时间从提交时算起
+            timeout = self._tool_timeout(tool_name)
+            try:
+                result, elapsed = future.result(timeout=max(0.0, start + timeout - time.perf_counter()))
+            except FutureTimeoutError:
+                future.cancel()
+                result, elapsed = None, timeout
+            outcomes.append((tool_name, result, elapsed))
+        
+        return self._finish_tools(state, outcomes)
+    
+    async def _atool_execution_node(self, state: PetState) -> PetState:
+        """工具执行节点（异步，等待工具时不阻塞事件循环）"""
+        tool_names = self._matched_tools(state)
+        loop = asyncio.get_running_loop()
+        
+        async def run(tool_name: str) -> tuple:
+            timeout = self._tool_timeout(tool_name)
+            try:
+                result, elapsed = await asyncio.wait_for(
+                    loop.run_in_executor(self._executor(), self._run_tool, tool_name), timeout
+                )
+            except asyncio.TimeoutError:
+                result, elapsed = None, timeout
+            return tool_name, result, elapsed
+        
+        outcomes = await asyncio.gather(*[run(tool_name) for tool_name in tool_names])
+        return self._finish_tools(state, list(outcomes))
+    
     def _proactive_greeting_node(self, state: PetState) -> PetState:
         """主动问候节点"""
         personality = state.get("personality", PersonalityType.QUIET)
@@ -315,14 +428,18 @@ class PetAgent:
         mood = state.get("mood", "neutral")
         energy = state.get("energy", 100)
         
-        # 分析最近的互动
+        # 分析最近的互动（当前输入复用已有的匹配结果）
         recent_interactions = messages[-4:] if len(messages) >= 4 else messages
+        current = next((msg for msg in reversed(messages) if isinstance(msg, HumanMessage)), None)
         
         positive_interactions = 0
         for msg in recent_interactions:
             if isinstance(msg, HumanMessage):
-                content = msg.content.lower()
-                if any(word in content for word in ["摸摸", "抱抱", "喜欢", "爱", "好"]):
+                if msg is current:
+                    match = self._keyword_match(state, msg.content)
+                else:
+                    match = self.keyword_matcher.match(msg.content)
+                if match.positive:
                     positive_interactions += 1
         
         # 更新心情
@@ -352,30 +469,24 @@ class PetAgent:
     def _check_energy_node(self, state: PetState) -> PetState:
         """检查精力节点"""
         energy = state.get("energy", 100)
-        personality = state.get("personality", PersonalityType.QUIET)
         
-        # 如果精力过低，可能需要休息
-        if energy < 30:
-            messages = state.get("messages", [])
-            
-            if personality == PersonalityType.PLAYFUL:
-                rest_message = "好累啊...让我休息一下下~ 😴"
-            elif personality == PersonalityType.CLINGY:
-                rest_message = "主人，我有点累了，但是还想和你在一起... 💤"
-            elif personality == PersonalityType.COLD:
-                rest_message = "哼，有点累了。"
-            else:  # QUIET
-                rest_message = "嗯...想休息一下。"
-            
-            ai_message = AIMessage(content=rest_message)
-            state["messages"] = messages + [ai_message]
+        # 精力过低时标记为累了；下次生成回复时提示词会带上疲惫提示，不覆盖这次的回复
+        context = state.get("context", {})
+        context["tired"] = energy < TIRED_ENERGY
+        state["context"] = context
         
         return state
     
     def _format_conversation_history(self, messages: list) -> list:
-        """格式化对话历史"""
+        """格式化对话历史（不含当前这条用户输入，它会单独作为最后一条消息发送）"""
         formatted_history = []
         
+        # 去掉最后一条用户消息及其之后的内容
+        for end in range(len(messages) - 1, -1, -1):
+            if isinstance(messages[end], HumanMessage):
+                messages = messages[:end]
+                break
+        
         for msg in messages:
             if isinstance(msg, HumanMessage):
                 formatted_history.append({
@@ -390,33 +501,224 @@ class PetAgent:
         
         return formatted_history
     
-    def invoke(self, user_input: str, personality: PersonalityType) -> dict:
-        """调用宠物Agent"""
-        # 初始化状态
-        initial_state = {
-            "messages": [HumanMessage(content=user_input)],
+    def _initial_state(
+        self,
+        user_input: str,
+        personality: PersonalityType,
+        priority: str = PRIORITY_INTERACTIVE,
+        session: Optional[Hashable] = None,
+        checkpoint: Optional[dict] = None,
+        memory: Optional[MemoryContext] = None
+    ) -> dict:
+        """构建初始状态（有检查点时接着上次的心情和精力，有记忆时带上最近几轮对话和摘要）"""
+        checkpoint = checkpoint or {}
+        memory = memory or MemoryContext()
+        history = []
+        for turn in memory.recent_turns:
+            history.append(HumanMessage(content=turn["user_input"]))
+            history.append(AIMessage(content=turn["pet_response"]))
+        return {
+            "messages": history + [HumanMessage(content=user_input)],
             "personality": personality,
             "current_time": datetime.now().isoformat(),
-            "mood": "neutral",
-            "energy": 100,
+            "mood": checkpoint.get("mood", "neutral"),
+            "energy": self._recovered_energy(checkpoint),
+            # 本次互动从现在开始；上次互动时间不放进来，否则隔了5分钟的消息会被当成主动问候
             "last_interaction": datetime.now().isoformat(),
-            "context": {}
+            "context": {"priority": priority, "session": session, "memory": memory.summary}
         }
+    
+    def _recovered_energy(self, checkpoint: dict) -> int:
+        """检查点中的精力，加上距上次互动这段时间恢复的精力"""
+        energy = checkpoint.get("energy", 100)
+        try:
+            idle = (datetime.now() - datetime.fromisoformat(checkpoint["last_interaction"])).total_seconds() / 60
+        except (KeyError, TypeError, ValueError):
+            return energy
+        return min(100, energy + int(max(0.0, idle) * self.energy_recovery_per_minute))
+    
+    def _load_checkpoint(self, session: Optional[Hashable]) -> Optional[dict]:
+        if self.checkpoint_store is None or session is None:
+            return None
+        return self.checkpoint_store.load(session)
+    
+    async def _aload_checkpoint(self, session: Optional[Hashable]) -> Optional[dict]:
+        if self.checkpoint_store is None or session is None:
+            return None
+        return await self.checkpoint_store.aload(session)
+    
+    def _load_memory(self, user_input: str, session: Optional[Hashable]) -> Optional[MemoryContext]:
+        # 主动问候（空输入）不需要记忆
+        if self.memory is None or session is None or not user_input:
+            return None
+        return self.memory.context(session)
+    
+    async def _aload_memory(self, user_input: str, session: Optional[Hashable]) -> Optional[MemoryContext]:
+        if self.memory is None or session is None or not user_input:
+            return None
+        return await self.memory.acontext(session)
+    
+    def _save_checkpoint(self, session: Optional[Hashable], result: dict):
+        if self.checkpoint_store is not None and session is not None:
+            self.checkpoint_store.save(session, result)
+    
+    async def _asave_checkpoint(self, session: Optional[Hashable], result: dict):
+        if self.checkpoint_store is not None and session is not None:
+            await self.checkpoint_store.asave(session, result)
+    
+    def invoke(
+        self,
+        user_input: str,
+        personality: PersonalityType,
+        priority: str = PRIORITY_INTERACTIVE,
+        session: Optional[Hashable] = None
+    ) -> dict:
+        """调用宠物Agent（session为宠物id时读写该宠物的检查点和记忆）"""
+        initial_state = self._initial_state(
+            user_input, personality, priority, session,
+            self._load_checkpoint(session), self._load_memory(user_input, session)
+        )
         
         # 执行工作流
         result = self.workflow.invoke(initial_state)
         
+        self._save_checkpoint(session, result)
+        return result
+    
+    async def ainvoke(
+        self,
+        user_input: str,
+        personality: PersonalityType,
+        priority: str = PRIORITY_INTERACTIVE,
+        session: Optional[Hashable] = None
+    ) -> dict:
+        """异步调用宠物Agent（LLM请求不阻塞事件循环）"""
+        initial_state = self._initial_state(
+            user_input, personality, priority, session,
+            await self._aload_checkpoint(session), await self._aload_memory(user_input, session)
+        )
+        result = await self.workflow.ainvoke(initial_state)
+        await self._asave_checkpoint(session, result)
         return result
     
-    def get_status(self) -> dict:
-        """获取宠物状态"""
+    def _batch_states(
+        self,
+        user_inputs: List[str],
+        personality: PersonalityType,
+        priority: str,
+        session: Optional[Hashable],
+        checkpoint: Optional[dict],
+        memory: Optional[MemoryContext]
+    ) -> List[dict]:
+        """批量调用的初始状态：各条输入从同一个检查点和记忆出发，互不可见"""
+        return [
+            self._initial_state(user_input, personality, priority, session, checkpoint, memory)
+            for user_input in user_inputs
+        ]
+    
+    def _batch_config(self, max_concurrency: Optional[int]) -> dict:
+        return {"max_concurrency": max(1, max_concurrency or self.batch_max_concurrency)}
+    
+    @staticmethod
+    def _last_success(results: list) -> Optional[dict]:
+        """最后一条成功的结果（用于保存检查点）"""
+        return next((result for result in reversed(results) if not isinstance(result, Exception)), None)
+    
+    def batch(
+        self,
+        user_inputs: List[str],
+        personality: PersonalityType,
+        priority: str = PRIORITY_INTERACTIVE,
+        session: Optional[Hashable] = None,
+        max_concurrency: Optional[int] = None
+    ) -> list:
+        """批量调用宠物Agent，最多 max_concurrency 条同时运行
+
+        结果与输入一一对应、顺序一致；某条失败时对应位置是异常对象，不影响其他输入。
+        检查点按最后一条成功的结果保存。
+        """
+        if not user_inputs:
+            return []
+        states = self._batch_states(
+            user_inputs, personality, priority, session,
+            self._load_checkpoint(session), self._load_memory(next(filter(None, user_inputs), ""), session)
+        )
+        results = self.workflow.batch(states, self._batch_config(max_concurrency), return_exceptions=True)
+        
+        last = self._last_success(results)
+        if last is not None:
+            self._save_checkpoint(session, last)
+        return results
+    
+    async def abatch(
+        self,
+        user_inputs: List[str],
+        personality: PersonalityType,
+        priority: str = PRIORITY_INTERACTIVE,
+        session: Optional[Hashable] = None,
+        max_concurrency: Optional[int] = None
+    ) -> list:
+        """异步批量调用宠物Agent（语义同batch）"""
+        if not user_inputs:
+            return []
+        states = self._batch_states(
+            user_inputs, personality, priority, session,
+            await self._aload_checkpoint(session), await self._aload_memory(next(filter(None, user_inputs), ""), session)
+        )
+        results = await self.workflow.abatch(states, self._batch_config(max_concurrency), return_exceptions=True)
+        
+        last = self._last_success(results)
+        if last is not None:
+            await self._asave_checkpoint(session, last)
+        return results
+    
+    async def astream(
+        self,
+        user_input: str,
+        personality: PersonalityType,
+        priority: str = PRIORITY_INTERACTIVE,
+        session: Optional[Hashable] = None
+    ) -> AsyncIterator[tuple]:
+        """流式调用宠物Agent
+
+        依次产出 ("token", 文本片段)，最后产出 ("result", 最终状态)
+        """
+        initial_state = self._initial_state(
+            user_input, personality, priority, session,
+            await self._aload_checkpoint(session), await self._aload_memory(user_input, session)
+        )
+        initial_state["context"]["stream"] = True
+        
+        result = initial_state
+        async for mode, chunk in self.workflow.astream(initial_state, stream_mode=["custom", "values"]):
+            if mode == "custom":
+                yield "token", chunk["token"]
+            else:
+                result = chunk
+        
+        await self._asave_checkpoint(session, result)
+        yield "result", result
+    
+    @staticmethod
+    def _status(checkpoint: Optional[dict]) -> dict:
+        if checkpoint is None:
+            # 还没有互动过
+            return {"personality": "active", "mood": "neutral", "energy": 100, "last_interaction": None}
         return {
-            "personality": "active",
-            "mood": "neutral",
-            "energy": 100,
-            "last_interaction": datetime.now().isoformat()
+            "personality": checkpoint["personality"] or "active",
+            "mood": checkpoint["mood"],
+            "energy": checkpoint["energy"],
+            "last_interaction": checkpoint["last_interaction"]
         }
     
+    def get_status(self, pet_id: Optional[Hashable] = None) -> dict:
+        """获取宠物状态（读检查点，不运行工作流）"""
+        return self._status(self._load_checkpoint(pet_id))
+    
+    async def aget_status(self, pet_id: Optional[Hashable] = None) -> dict:
+        """异步获取宠物状态"""
+        return self._status(await self._aload_checkpoint(pet_id))
+    
     def setup_proactive_system(self, personality: PersonalityType):
         """设置主动互动系统"""
         self.proactive_system = ProactiveSystem(self.tool_manager, personality)
@@ -427,6 +729,13 @@ class PetAgent:
         if self.proactive_system:
             self.proactive_system.stop()
     
+    def close(self):
+        """停止主动互动系统并关闭工具线程池（不等待超时未完成的工具）"""
+        self.stop_proactive_system()
+        if self._tool_executor is not None:
+            self._tool_executor.shutdown(wait=False, cancel_futures=True)
+            self._tool_executor = None
+    
     def trigger_proactive_event(self, event_type: str) -> Optional[str]:
         """触发主动事件"""
         if self.proactive_system:
@@ -3,6 +3,7 @@
 """
 
 import asyncio
+import logging
 import threading
 import time
 from datetime import datetime, timedelta
@@ -13,6 +14,8 @@ import random
 from tools import ToolManager
 from llm_client import PersonalityType
 
+logger = logging.getLogger(__name__)
+
 @dataclass
 class ProactiveEvent:
     """主动事件"""
@@ -53,14 +56,14 @@ class ProactiveSystem:
             self.is_running = True
             self.thread = threading.Thread(target=self._run_loop, daemon=True)
             self.thread.start()
-            print("主动互动系统已启动")
+            logger.info("主动互动系统已启动", extra={"personality": self.personality.value})
     
     def stop(self):
         """停止主动互动系统"""
         self.is_running = False
         if self.thread:
             self.thread.join()
-        print("主动互动系统已停止")
+        logger.info("主动互动系统已停止")
     
     def _run_loop(self):
         """运行主循环"""
@@ -77,7 +80,7 @@ class ProactiveSystem:
                 time.sleep(30)  # 每30秒检查一次
                 
             except Exception as e:
-                print(f"主动互动系统错误: {e}")
+                logger.exception("主动互动系统错误: %s", e)
                 time.sleep(60)  # 出错时等待更长时间
     
     def _check_events(self) -> List[ProactiveEvent]:
@@ -216,13 +219,13 @@ class ProactiveSystem:
                 message = handler(event.conditions)
                 if message:
                     # 这里可以调用回调函数发送消息
-                    print(f"主动事件 [{event.event_type}]: {message}")
+                    logger.info("主动事件", extra={"event_type": event.event_type, "event_message": message})
                 
                 # 更新最后事件时间
                 self.last_events[event.event_type] = datetime.now()
                 
             except Exception as e:
-                print(f"处理事件 {event.event_type} 时出错: {e}")
+                logger.exception("处理事件 %s 时出错: %s", event.event_type, e)
     
     def _handle_time_greeting(self, conditions: Dict) -> Optional[str]:
         """处理时间问候"""
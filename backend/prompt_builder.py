@@ -0,0 +1,198 @@
+"""
+按token预算组装提示词
+"""
+
+import functools
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 估算参数（按cl100k_base在中文闲聊语料上校准）：汉字约1个token，其它字符约3.3个一个token
+_CJK = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+_CJK_TOKENS_PER_CHAR = 1.0
+_OTHER_TOKENS_PER_CHAR = 0.3
+
+# tiktoken词表的下载地址（本地缓存文件名为该地址的sha1）
+_TIKTOKEN_BLOB_URL = "https://openaipublic.blob.core.windows.net/encodings/{}.tiktoken"
+
+# 与OpenAI的计数方式一致：每条消息额外约4个token，回复前缀约3个
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+
+def _vocabulary_cached(name: str) -> bool:
+    """词表是否已在TIKTOKEN_CACHE_DIR中（不在时tiktoken会联网下载，启动时可能卡住）"""
+    cache_dir = os.getenv("TIKTOKEN_CACHE_DIR")
+    if not cache_dir:
+        return False
+    cache_key = hashlib.sha1(_TIKTOKEN_BLOB_URL.format(name).encode()).hexdigest()
+    return os.path.exists(os.path.join(cache_dir, cache_key))
+
+@functools.lru_cache(maxsize=None)
+def _load_encoding(name: str):
+    """加载tiktoken编码；未安装或词表不在本地缓存中时返回None（每个进程只尝试一次）"""
+    if not _vocabulary_cached(name):
+        logger.info(f"TIKTOKEN_CACHE_DIR中没有{name}词表，使用估算计数")
+        return None
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.info(f"tiktoken不可用，使用估算计数: {e}")
+        return None
+
+class TokenCounter:
+    """token计数：默认按字符估算；指定编码且词表已缓存在本地时使用tiktoken"""
+
+    def __init__(self, encoding: str = "estimate"):
+        self._encoding = None if encoding == "estimate" else _load_encoding(encoding)
+
+    @property
+    def backend(self) -> str:
+        return "tiktoken" if self._encoding is not None else "estimate"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        cjk = len(_CJK.findall(text))
+        return int(cjk * _CJK_TOKENS_PER_CHAR + (len(text) - cjk) * _OTHER_TOKENS_PER_CHAR + 0.999)
+
+    def count_message(self, message: Dict) -> int:
+        return self.count(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """截断文本使其不超过max_tokens"""
+        if self.count(text) <= max_tokens:
+            return text
+        if max_tokens <= 0:
+            return ""
+        if self._encoding is not None:
+            return self._encoding.decode(self._encoding.encode(text)[:max_tokens])
+        # 估算模式下二分查找最长前缀
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count(text[:mid]) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low]
+
+@dataclass
+class BuiltPrompt:
+    """组装结果"""
+    messages: List[Dict]
+    prompt_tokens: int
+    history_turns: int  # 实际放入的历史消息条数
+    truncated: bool  # 工具信息是否被截断
+
+class PromptBuilder:
+    """系统提示词和当前输入必定保留，剩余预算从最近的历史开始往前填充"""
+
+    def __init__(
+        self,
+        counter: TokenCounter,
+        token_budget: int = 1024,
+        stats_window: int = 1000,
+        memory_token_budget: int = 200
+    ):
+        self.counter = counter
+        self.token_budget = token_budget
+        self.memory_token_budget = memory_token_budget  # 长期记忆摘要的固定上限
+
+        # 每次调用的提示词token数（滚动窗口）
+        self._samples: Deque[int] = deque(maxlen=stats_window)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.over_budget = 0  # 必需内容已超出预算的次数
+
+    @staticmethod
+    def _history_messages(conversation_history: Optional[List[Dict]]) -> List[Dict]:
+        """兼容数据库格式（user_input/pet_response）和消息格式（role/content）"""
+        messages = []
+        for msg in conversation_history or []:
+            if "user_input" in msg and "pet_response" in msg:
+                messages.append({"role": "user", "content": msg["user_input"]})
+                messages.append({"role": "assistant", "content": msg["pet_response"]})
+            elif "role" in msg and "content" in msg:
+                messages.append({"role": msg["role"], "content": msg["content"]})
+        return messages
+
+    def build(
+        self,
+        system_prompt: str,
+        user_input: str,
+        conversation_history: Optional[List[Dict]] = None,
+        tool_context: Optional[str] = None,
+        memory: Optional[str] = None
+    ) -> BuiltPrompt:
+        """组装消息列表（长期记忆摘要截断到 memory_token_budget 后附在系统提示词后面）"""
+        counter = self.counter
+        if memory:
+            memory = counter.truncate(memory, self.memory_token_budget)
+            if memory:
+                system_prompt = f"{system_prompt}\n\n你记得和主人之前的事：{memory}"
+        system = {"role": "system", "content": system_prompt}
+        used = REPLY_PRIMING_TOKENS + counter.count_message(system) + \
+            counter.count_message({"role": "user", "content": user_input})
+
+        # 工具信息放在当前输入后面，超出预算时截断
+        truncated = False
+        if tool_context:
+            prefix = "\n\n工具信息："
+            available = self.token_budget - used - counter.count(prefix)
+            fitted = counter.truncate(tool_context, available)
+            truncated = fitted != tool_context
+            if fitted:
+                user_input = f"{user_input}{prefix}{fitted}"
+                used += counter.count(prefix) + counter.count(fitted)
+
+        # 从最近的历史开始往前放，放不下就停止（保持历史连续）
+        history = []
+        for message in reversed(self._history_messages(conversation_history)):
+            cost = counter.count_message(message)
+            if used + cost > self.token_budget:
+                break
+            history.append(message)
+            used += cost
+        history.reverse()
+        # 不以助手消息开头
+        while history and history[0]["role"] == "assistant":
+            used -= counter.count_message(history.pop(0))
+
+        self._record(used)
+        return BuiltPrompt(
+            messages=[system] + history + [{"role": "user", "content": user_input}],
+            prompt_tokens=used,
+            history_turns=len(history),
+            truncated=truncated
+        )
+
+    def _record(self, prompt_tokens: int):
+        with self._lock:
+            self.calls += 1
+            if prompt_tokens > self.token_budget:
+                self.over_budget += 1
+            self._samples.append(prompt_tokens)
+
+    def stats(self) -> Dict:
+        """提示词token数统计"""
+        with self._lock:
+            ordered = sorted(self._samples)
+            return {
+                "tokenizer": self.counter.backend,
+                "token_budget": self.token_budget,
+                "calls": self.calls,
+                "over_budget": self.over_budget,
+                "avg_prompt_tokens": sum(ordered) / len(ordered) if ordered else 0.0,
+                "p95_prompt_tokens": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] if ordered else 0,
+                "max_prompt_tokens": ordered[-1] if ordered else 0
+            }
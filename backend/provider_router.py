@@ -0,0 +1,197 @@
+"""
+LLM提供商路由（按健康度选择 + 熔断）
+"""
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+@dataclass
+class ProviderEndpoint:
+    """一个LLM提供商端点"""
+    name: str
+    model: str
+    client: Any = None  # OpenAI
+    async_client: Any = None  # AsyncOpenAI
+    base_url: Optional[str] = None
+
+class CircuitOpenError(RuntimeError):
+    """提供商被熔断（或半开状态下已有试探请求在进行），本次不发请求"""
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后打开，冷却后半开试探，成功则关闭
+
+    半开状态下只放行一个试探请求，试探有结果之前其它请求被拒绝（由调用方切换到下一个提供商）。
+    试探请求被取消、没有记录结果时，超过 reset_timeout 后允许重新试探。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout  # 秒
+        self._state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_started_at: Optional[float] = None  # 半开试探开始时间，None表示没有试探在进行
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+        return self._state
+
+    def _probing(self) -> bool:
+        return self.probe_started_at is not None and time.monotonic() - self.probe_started_at < self.reset_timeout
+
+    def available(self) -> bool:
+        """是否可能放行请求（只查看状态，不占用试探名额）"""
+        state = self.state
+        return state == self.CLOSED or state == self.HALF_OPEN and not self._probing()
+
+    def allow_request(self) -> bool:
+        """放行一次请求；半开状态下占用唯一的试探名额"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.OPEN or self._probing():
+            return False
+        self.probe_started_at = time.monotonic()
+        return True
+
+    def release(self):
+        """请求被取消、没有结果：归还试探名额，不改变熔断状态"""
+        self.probe_started_at = None
+
+    def record_success(self):
+        self._state = self.CLOSED
+        self.consecutive_failures = 0
+        self.probe_started_at = None
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        # 半开状态下试探失败立即重新打开
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self._state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.probe_started_at = None
+
+class ProviderHealth:
+    """滚动窗口内的延迟和错误率"""
+
+    def __init__(self, window: int = 50):
+        self.samples: Deque[Tuple[float, bool]] = deque(maxlen=window)
+        self.total_calls = 0
+        self.total_failures = 0
+
+    def record(self, latency: float, ok: bool):
+        self.samples.append((latency, ok))
+        self.total_calls += 1
+        if not ok:
+            self.total_failures += 1
+
+    @property
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def latency_percentile(self, pct: float) -> Optional[float]:
+        """成功调用的延迟分位数（秒），没有样本时返回None"""
+        latencies = sorted(latency for latency, ok in self.samples if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))]
+
+class ProviderRouter:
+    """跟踪每个提供商的健康度，把请求路由到最健康的提供商"""
+
+    def __init__(
+        self,
+        providers: List[ProviderEndpoint],
+        failure_threshold: int = 3,
+        reset_timeout: float = 30,
+        window: int = 50
+    ):
+        self.providers = providers
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {
+            provider.name: CircuitBreaker(failure_threshold, reset_timeout) for provider in providers
+        }
+        self._health: Dict[str, ProviderHealth] = {
+            provider.name: ProviderHealth(window) for provider in providers
+        }
+
+    def _score(self, provider: ProviderEndpoint) -> float:
+        """分数越低越健康：p50延迟按错误率加权；没有成功样本的排在后面（作为备用）"""
+        health = self._health[provider.name]
+        p50 = health.latency_percentile(50)
+        if p50 is None:
+            return float("inf")
+        return p50 * (1 + 4 * health.error_rate)
+
+    def candidates(self) -> List[ProviderEndpoint]:
+        """熔断器允许的提供商，按健康度排序（同分时保持配置顺序）
+
+        只是候选列表，真正发请求前还要调用 acquire。
+        """
+        with self._lock:
+            allowed = [
+                (self._score(provider), index, provider)
+                for index, provider in enumerate(self.providers)
+                if self._breakers[provider.name].available()
+            ]
+        return [provider for _, _, provider in sorted(allowed, key=lambda item: item[:2])]
+
+    def acquire(self, provider: ProviderEndpoint):
+        """发请求前调用：熔断器不放行时抛出CircuitOpenError（半开状态下只有一个请求能通过）"""
+        with self._lock:
+            if not self._breakers[provider.name].allow_request():
+                raise CircuitOpenError(f"提供商 {provider.name} 已熔断")
+
+    def release(self, provider: ProviderEndpoint):
+        """acquire之后请求被取消（客户端断开等），不计入成功或失败"""
+        with self._lock:
+            self._breakers[provider.name].release()
+
+    def record(self, provider: ProviderEndpoint, latency: float, ok: bool):
+        """记录一次调用结果"""
+        with self._lock:
+            self._health[provider.name].record(latency, ok)
+            breaker = self._breakers[provider.name]
+            if ok:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+
+    def latency_percentile(self, provider: ProviderEndpoint, pct: float) -> Optional[float]:
+        with self._lock:
+            return self._health[provider.name].latency_percentile(pct)
+
+    def has_available(self) -> bool:
+        """是否至少有一个提供商未被熔断"""
+        return bool(self.candidates())
+
+    def status(self) -> List[Dict]:
+        """各提供商的健康状态"""
+        with self._lock:
+            result = []
+            for provider in self.providers:
+                health = self._health[provider.name]
+                p50 = health.latency_percentile(50)
+                p95 = health.latency_percentile(95)
+                result.append({
+                    "name": provider.name,
+                    "model": provider.model,
+                    "circuit": self._breakers[provider.name].state,
+                    "error_rate": health.error_rate,
+                    "p50_ms": p50 * 1000 if p50 is not None else None,
+                    "p95_ms": p95 * 1000 if p95 is not None else None,
+                    "calls": health.total_calls,
+                    "failures": health.total_failures
+                })
+            return result
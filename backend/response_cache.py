@@ -0,0 +1,149 @@
+"""
+LLM响应缓存（LRU + TTL）
+"""
+
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# 归一化时去掉的结尾标点和语气符号
+_TRAILING_PUNCTUATION = "!！?？。.~～,，…"
+_WHITESPACE = re.compile(r"\s+")
+
+@dataclass
+class CacheEntry:
+    """缓存条目：同一个键下保存多个候选回复"""
+    variants: List[str] = field(default_factory=list)
+    expires_at: float = 0.0
+    fills: int = 0  # 写入次数（重复的回复也计数，避免一直凑不满候选）
+
+class ResponseCache:
+    """有界的LRU响应缓存，每个条目有独立的过期时间"""
+
+    def __init__(self, max_entries: int = 512, ttl: float = 300, variants_per_key: int = 3):
+        self.max_entries = max_entries
+        self.ttl = ttl  # 秒
+        self.variants_per_key = max(1, variants_per_key)
+
+        self._entries: "OrderedDict[Tuple, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """归一化用户输入：去首尾空白、小写、合并空白、去掉结尾标点"""
+        text = _WHITESPACE.sub(" ", text.strip().lower())
+        return text.rstrip(_TRAILING_PUNCTUATION).strip()
+
+    @staticmethod
+    def fingerprint(*parts: str) -> str:
+        """短指纹"""
+        digest = hashlib.blake2b(digest_size=8)
+        for part in parts:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    @classmethod
+    def make_key(
+        cls,
+        personality: str,
+        user_input: str,
+        tool_context: Optional[str] = None,
+        conversation_history: Optional[List[Dict]] = None,
+        history_turns: int = 2,
+        memory: Optional[str] = None
+    ) -> Tuple[str, str, str, str]:
+        """缓存键：性格 + 归一化输入 + 工具上下文指纹 + 最近几条历史和长期记忆的指纹"""
+        history_parts = [memory] if memory else []
+        for msg in (conversation_history or [])[-history_turns:]:
+            if "user_input" in msg:
+                history_parts.extend([msg.get("user_input", ""), msg.get("pet_response", "")])
+            else:
+                history_parts.extend([msg.get("role", ""), msg.get("content", "")])
+
+        return (
+            getattr(personality, "value", personality),
+            cls.normalize(user_input),
+            cls.fingerprint(tool_context) if tool_context else "",
+            cls.fingerprint(*history_parts) if history_parts else ""
+        )
+
+    def get(self, key: Tuple) -> Optional[str]:
+        """读取缓存；候选回复不足时视为未命中，以便继续积累不同的回复"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+
+            if entry is None or entry.fills < self.variants_per_key:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return random.choice(entry.variants)
+
+    def contains(self, key: Tuple) -> bool:
+        """键是否存在且未过期（不计入命中统计）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry.expires_at > time.monotonic()
+
+    def put(self, key: Tuple, response: str, ttl: Optional[float] = None):
+        """写入一个候选回复"""
+        if not self.enabled or not response:
+            return
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= time.monotonic():
+                entry = CacheEntry(expires_at=time.monotonic() + (self.ttl if ttl is None else ttl))
+                self._entries[key] = entry
+
+            entry.fills += 1
+            if response not in entry.variants and len(entry.variants) < self.variants_per_key:
+                entry.variants.append(response)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
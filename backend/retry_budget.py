@@ -0,0 +1,83 @@
+"""
+全局重试预算（令牌桶 + 抖动退避）
+"""
+
+import random
+import threading
+from typing import Dict
+
+class RetryBudget:
+    """每个正常请求存入ratio个令牌，每次重试或对冲请求取出一个；
+    令牌不足时放弃重试，避免故障期间重试把上游压垮"""
+
+    def __init__(
+        self,
+        ratio: float = 0.1,
+        max_tokens: float = 10,
+        backoff_base: float = 0.1,
+        backoff_max: float = 2.0
+    ):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.backoff_base = backoff_base  # 秒
+        self.backoff_max = backoff_max
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.requests = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0  # 对冲请求先返回的次数
+        self.rejected = 0  # 因预算不足放弃的重试/对冲
+
+    def deposit(self):
+        """记录一个正常请求"""
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def _withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                self.rejected += 1
+                return False
+            self._tokens -= 1
+            return True
+
+    def acquire_retry(self) -> bool:
+        """申请一次重试"""
+        if not self._withdraw():
+            return False
+        with self._lock:
+            self.retries += 1
+        return True
+
+    def acquire_hedge(self) -> bool:
+        """申请一次对冲请求"""
+        if not self._withdraw():
+            return False
+        with self._lock:
+            self.hedges += 1
+        return True
+
+    def record_hedge_win(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+    def backoff(self, attempt: int) -> float:
+        """第attempt次重试前的等待时间（full jitter指数退避）"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def stats(self) -> Dict:
+        """预算和重试统计"""
+        with self._lock:
+            return {
+                "tokens": round(self._tokens, 2),
+                "max_tokens": self.max_tokens,
+                "requests": self.requests,
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "rejected": self.rejected
+            }
@@ -0,0 +1,188 @@
+"""
+语义近似缓存（本地哈希字符n-gram向量 + 余弦相似度）
+"""
+
+import random
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from response_cache import ResponseCache
+
+# 否定词不同的两句话字面上很像，但意思相反，命中时需要额外检查
+_NEGATIONS = "不没别非"
+
+class HashingVectorizer:
+    """哈希字符n-gram向量化器，不依赖模型文件，可离线使用"""
+
+    def __init__(self, dim: int = 1024, ngram_range: Tuple[int, int] = (1, 2)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def _ngram_indices(self, text: str) -> List[int]:
+        indices = []
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(text) - n + 1):
+                # crc32在不同进程间稳定，不受PYTHONHASHSEED影响
+                indices.append(zlib.crc32(text[i:i + n].encode("utf-8")) % self.dim)
+        return indices
+
+    def transform(self, text: str) -> np.ndarray:
+        """文本 -> L2归一化的向量"""
+        indices = self._ngram_indices(text)
+        vector = np.bincount(indices, minlength=self.dim).astype(np.float32) if indices \
+            else np.zeros(self.dim, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+class _PersonalityBucket:
+    """单个性格的缓存矩阵（环形缓冲，满了覆盖最早的条目）"""
+
+    def __init__(self, capacity: int, dim: int):
+        self.matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self.prompts: List[Optional[str]] = [None] * capacity
+        self.responses: List[List[str]] = [[] for _ in range(capacity)]
+        self.fills: List[int] = [0] * capacity  # 写入次数（与精确缓存一致，凑满候选前不命中）
+        self.expires_at = np.zeros(capacity, dtype=np.float64)
+        self.slots: Dict[str, int] = {}  # 输入 -> 所在行
+        self.size = 0
+        self.next_slot = 0
+
+class SemanticCache:
+    """按性格分组的语义缓存：一次矩阵乘法算出与所有已缓存输入的相似度
+
+    与精确缓存一样，每个条目有过期时间，并且积累满 variants_per_prompt 个候选回复后才命中。
+    缓存不区分对话历史和长期记忆，只应用于没有上下文的输入。
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.7,
+        max_entries_per_personality: int = 256,
+        variants_per_prompt: int = 3,
+        dim: int = 1024,
+        ttl: float = 300
+    ):
+        self.threshold = threshold
+        self.ttl = ttl  # 秒
+        self.capacity = max_entries_per_personality
+        self.variants_per_prompt = max(1, variants_per_prompt)
+        self.vectorizer = HashingVectorizer(dim=dim)
+
+        self._buckets: Dict[str, _PersonalityBucket] = {}
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.lookup_time = 0.0  # 秒
+        self.max_lookup_time = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def _bucket(self, personality) -> _PersonalityBucket:
+        key = getattr(personality, "value", personality)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = _PersonalityBucket(self.capacity, self.vectorizer.dim)
+            self._buckets[key] = bucket
+        return bucket
+
+    @staticmethod
+    def _negations(text: str) -> set:
+        return {char for char in text if char in _NEGATIONS}
+
+    def lookup(self, personality, user_input: str) -> Optional[str]:
+        """查找语义相近的已缓存输入，相似度达到阈值时返回其回复"""
+        if not self.enabled:
+            return None
+
+        start = time.perf_counter()
+        text = ResponseCache.normalize(user_input)
+        vector = self.vectorizer.transform(text)
+
+        with self._lock:
+            bucket = self._bucket(personality)
+            response = None
+            if bucket.size:
+                similarities = bucket.matrix[:bucket.size] @ vector
+                # 过期的条目不参与匹配
+                similarities[bucket.expires_at[:bucket.size] <= time.monotonic()] = -1.0
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold and \
+                        bucket.fills[best] >= self.variants_per_prompt and \
+                        self._negations(bucket.prompts[best]) == self._negations(text):
+                    response = random.choice(bucket.responses[best])
+
+            elapsed = time.perf_counter() - start
+            self.lookup_time += elapsed
+            self.max_lookup_time = max(self.max_lookup_time, elapsed)
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return response
+
+    def add(self, personality, user_input: str, response: str):
+        """缓存一条输入及其回复"""
+        if not self.enabled or not response:
+            return
+
+        text = ResponseCache.normalize(user_input)
+        if not text:
+            return
+        vector = self.vectorizer.transform(text)
+
+        with self._lock:
+            bucket = self._bucket(personality)
+
+            # 相同输入只追加候选回复（条目已过期时重新积累）
+            now = time.monotonic()
+            slot = bucket.slots.get(text)
+            if slot is not None:
+                if bucket.expires_at[slot] <= now:
+                    bucket.responses[slot] = []
+                    bucket.fills[slot] = 0
+                    bucket.expires_at[slot] = now + self.ttl
+                variants = bucket.responses[slot]
+                bucket.fills[slot] += 1
+                if response not in variants and len(variants) < self.variants_per_prompt:
+                    variants.append(response)
+                return
+
+            slot = bucket.next_slot
+            if bucket.prompts[slot] is not None:
+                del bucket.slots[bucket.prompts[slot]]
+            bucket.slots[text] = slot
+            bucket.matrix[slot] = vector
+            bucket.prompts[slot] = text
+            bucket.responses[slot] = [response]
+            bucket.fills[slot] = 1
+            bucket.expires_at[slot] = now + self.ttl
+            bucket.next_slot = (slot + 1) % self.capacity
+            bucket.size = min(bucket.size + 1, self.capacity)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self) -> Dict:
+        """命中率和查找耗时"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": sum(bucket.size for bucket in self._buckets.values()),
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "avg_lookup_ms": self.lookup_time / lookups * 1000 if lookups else 0.0,
+                "max_lookup_ms": self.max_lookup_time * 1000
+            }
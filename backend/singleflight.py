@@ -0,0 +1,81 @@
+"""
+相同请求合并（single-flight）
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """同一个键同时只执行一次，期间到达的相同请求等待并共享结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._async_calls: Dict[Hashable, asyncio.Task] = {}
+
+        # 统计信息
+        self.executed = 0  # 实际执行次数
+        self.coalesced = 0  # 被合并（节省）的调用次数
+
+    def do(self, key: Hashable, func: Callable[[], T]) -> T:
+        """同步执行；已有相同键在执行时等待其结果"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                future = Future()
+                self._calls[key] = future
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = func()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    async def ado(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """异步执行；已有相同键在执行时等待其结果"""
+        with self._lock:
+            task = self._async_calls.get(key)
+            if task is not None and task.get_loop() is asyncio.get_running_loop():
+                self.coalesced += 1
+            else:
+                task = asyncio.ensure_future(func())
+                self._async_calls[key] = task
+                self.executed += 1
+                task.add_done_callback(lambda done, key=key: self._forget(key, done))
+
+        # shield：某个等待方被取消时，不影响上游调用和其它等待方
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        with self._lock:
+            if self._async_calls.get(key) is task:
+                del self._async_calls[key]
+        # 所有等待方都已取消时避免"exception was never retrieved"警告
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict:
+        """合并统计"""
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls) + len(self._async_calls)
+            }
@@ -0,0 +1,218 @@
+"""
+长期记忆：按宠物维护滚动摘要（最近几轮对话原样保留，更早的对话折叠进摘要）
+"""
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional
+
+from db_pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class MemoryContext:
+    """一次对话可用的记忆：长期摘要 + 最近几轮原文（按时间正序）"""
+    summary: Optional[str] = None
+    recent_turns: List[Dict] = field(default_factory=list)
+
+class SummaryMemory:
+    """滚动摘要记忆
+
+    每保存 every_n_turns 轮对话，在后台线程把尚未摘要、且不在最近 recent_turns 轮内的对话
+    折叠进摘要（调用 summarize(旧摘要, 对话, 字数上限)）。请求路径上只读内存中的摘要。
+    对话记录走后写队列时传入 flush，摘要前先把该宠物未落库的记录写入数据库，否则最近几轮的窗口会
+    错位，把仍原样放在提示词里的对话也折叠进摘要。
+    """
+
+    CREATE_TABLE_SQL = '''
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            pet_id INTEGER PRIMARY KEY,
+            summary TEXT NOT NULL,
+            last_conversation_id INTEGER NOT NULL,
+            turns_summarized INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (pet_id) REFERENCES pets(id)
+        )
+    '''
+    SELECT_SUMMARY_SQL = '''
+        SELECT summary, last_conversation_id, turns_summarized
+        FROM conversation_summaries WHERE pet_id = ?
+    '''
+    UPSERT_SUMMARY_SQL = '''
+        INSERT INTO conversation_summaries (pet_id, summary, last_conversation_id, turns_summarized, updated_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(pet_id) DO UPDATE SET
+            summary = excluded.summary,
+            last_conversation_id = excluded.last_conversation_id,
+            turns_summarized = excluded.turns_summarized,
+            updated_at = excluded.updated_at
+    '''
+    # 尚未摘要的对话（按id正序）
+    SELECT_UNSUMMARIZED_SQL = '''
+        SELECT id, user_input, pet_response
+        FROM conversations
+        WHERE pet_id = ? AND id > ?
+        ORDER BY id ASC
+    '''
+    SELECT_RECENT_SQL = '''
+        SELECT id, user_input, pet_response, timestamp
+        FROM conversations
+        WHERE pet_id = ?
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    '''
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        summarize: Callable[[Optional[str], List[Dict], int], str],
+        every_n_turns: int = 10,
+        recent_turns: int = 6,
+        max_summary_chars: int = 600,
+        history: Optional[Callable[[Hashable, int], List[Dict]]] = None,
+        run_in_executor: Optional[Callable[..., Awaitable]] = None,
+        ahistory: Optional[Callable[[Hashable, int], Awaitable[List[Dict]]]] = None,
+        flush: Optional[Callable[[Hashable], None]] = None
+    ):
+        self.pool = pool
+        self.summarize = summarize
+        # 读取最近对话的函数 (pet_id, 条数) -> 按时间倒序的记录；默认直接查conversations表
+        self.history = history or self._select_recent
+        # 异步版本（缓存命中时不切换线程）；不传时把history放到执行器中调用
+        self.ahistory = ahistory
+        # 写入某只宠物尚未落库的对话记录
+        self.flush = flush
+        # 异步接口执行阻塞数据库操作的方式（默认asyncio.to_thread，应用中使用数据库专用线程）
+        self.run_in_executor = run_in_executor or asyncio.to_thread
+        self.every_n_turns = max(1, every_n_turns)
+        self.recent_turns = recent_turns
+        self.max_summary_chars = max_summary_chars
+
+        # pet_id -> (摘要, 已摘要到的对话id, 已摘要轮数)
+        self._summaries: Dict[Hashable, tuple] = {}
+        self._new_turns: Dict[Hashable, int] = {}  # 上次摘要后新增的轮数
+        self._running: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        # 统计信息
+        self.updates = 0
+        self.failures = 0
+
+        with self.pool.transaction() as conn:
+            conn.execute(self.CREATE_TABLE_SQL)
+
+    def _load_summary(self, pet_id: Hashable) -> tuple:
+        """读取摘要（内存没有时从数据库加载一次）"""
+        with self._lock:
+            cached = self._summaries.get(pet_id)
+        if cached is not None:
+            return cached
+
+        row = self.pool.fetchone(self.SELECT_SUMMARY_SQL, (pet_id,))
+        with self._lock:
+            return self._summaries.setdefault(pet_id, tuple(row) if row else (None, 0, 0))
+
+    def _select_recent(self, pet_id: Hashable, limit: int) -> List[Dict]:
+        rows = self.pool.fetchall(self.SELECT_RECENT_SQL, (pet_id, limit))
+        return [{"id": row[0], "user_input": row[1], "pet_response": row[2], "timestamp": row[3]} for row in rows]
+
+    def recent(self, pet_id: Hashable) -> List[Dict]:
+        """最近几轮对话原文（按时间正序）"""
+        if self.recent_turns <= 0:
+            return []
+        return list(reversed(self.history(pet_id, self.recent_turns)))
+
+    def context(self, pet_id: Hashable) -> MemoryContext:
+        """本次对话可用的记忆"""
+        return MemoryContext(summary=self._load_summary(pet_id)[0], recent_turns=self.recent(pet_id))
+
+    async def acontext(self, pet_id: Hashable) -> MemoryContext:
+        """异步读取记忆（优先读内存，未命中时才把数据库查询放到数据库线程中执行）"""
+        with self._lock:
+            cached = self._summaries.get(pet_id)
+        if cached is None:
+            cached = await self.run_in_executor(self._load_summary, pet_id)
+        return MemoryContext(summary=cached[0], recent_turns=await self._arecent(pet_id))
+
+    async def _arecent(self, pet_id: Hashable) -> List[Dict]:
+        if self.recent_turns <= 0:
+            return []
+        if self.ahistory is not None:
+            rows = await self.ahistory(pet_id, self.recent_turns)
+        else:
+            rows = await self.run_in_executor(self.history, pet_id, self.recent_turns)
+        return list(reversed(rows))
+
+    def summary(self, pet_id: Hashable) -> Optional[str]:
+        return self._load_summary(pet_id)[0]
+
+    def record_turn(self, pet_id: Hashable, turns: int = 1) -> Optional[Future]:
+        """保存对话后调用（turns为本次保存的轮数）；累计满 every_n_turns 轮时在后台更新摘要，返回后台任务"""
+        with self._lock:
+            count = self._new_turns.get(pet_id, 0) + turns
+            if count < self.every_n_turns or pet_id in self._running:
+                self._new_turns[pet_id] = count
+                return None
+            self._new_turns[pet_id] = 0
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+            future = self._executor.submit(self._update_safely, pet_id)
+            self._running[pet_id] = future
+            return future
+
+    def _update_safely(self, pet_id: Hashable):
+        try:
+            self.update(pet_id)
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+            logger.exception("更新对话摘要失败: %s", e, extra={"pet_id": pet_id})
+        finally:
+            with self._lock:
+                self._running.pop(pet_id, None)
+
+    def update(self, pet_id: Hashable) -> bool:
+        """把尚未摘要的较早对话折叠进摘要，有更新时返回True"""
+        summary, last_id, turns_summarized = self._load_summary(pet_id)
+
+        if self.flush is not None:
+            self.flush(pet_id)
+        rows = self.pool.fetchall(self.SELECT_UNSUMMARIZED_SQL, (pet_id, last_id))
+        # 最近几轮仍原样放在提示词里，不折叠
+        fold = rows[:len(rows) - self.recent_turns] if self.recent_turns > 0 else rows
+        if not fold:
+            return False
+
+        turns = [{"user_input": row[1], "pet_response": row[2]} for row in fold]
+        new_summary = self.summarize(summary, turns, self.max_summary_chars)[:self.max_summary_chars]
+        state = (new_summary, fold[-1][0], turns_summarized + len(fold))
+
+        self.pool.execute(self.UPSERT_SUMMARY_SQL, (pet_id,) + state)
+        with self._lock:
+            self._summaries[pet_id] = state
+            self.updates += 1
+        logger.info("对话摘要已更新", extra={"pet_id": pet_id, "turns": len(fold), "chars": len(new_summary)})
+        return True
+
+    def close(self):
+        """等待正在进行的摘要更新完成"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "every_n_turns": self.every_n_turns,
+                "recent_turns": self.recent_turns,
+                "max_summary_chars": self.max_summary_chars,
+                "pets": len(self._summaries),
+                "running": len(self._running),
+                "updates": self.updates,
+                "failures": self.failures
+            }
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+API进程内测试脚本（使用TestClient，无需启动服务）
+"""
+
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+
+# 使用临时数据库，避免改动仓库中的pet.db
+_tmp_dir = tempfile.mkdtemp(prefix="pet_api_test_")
+os.environ.setdefault("PET_DB_PATH", os.path.join(_tmp_dir, "pet.db"))
+
+from fastapi.testclient import TestClient
+
+import main
+from fast_path import FastPathResponder
+from node_profiler import NodeProfiler
+from provider_router import ProviderEndpoint, ProviderRouter
+from response_cache import ResponseCache
+from semantic_cache import SemanticCache
+
+def _client() -> TestClient:
+    return TestClient(main.app)
+
+def test_message_stream():
+    """测试SSE流式消息接口"""
+    print("=== 测试SSE流式消息接口 ===")
+
+    client = _client()
+    with client.stream("POST", "/message/stream", json={"message": "你好"}) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        lines = [line for line in response.iter_lines() if line]
+
+    tokens = [json.loads(line[len("data: "):])["token"] for line in lines[:-2]]
+    assert lines[-2] == "event: done"
+    done = json.loads(lines[-1][len("data: "):])
+    print(f"token: {tokens}, 完整响应: {done['response']}")
+    assert "".join(tokens) == done["response"]
+
+    # 流结束后对话已保存
+    history = client.get("/conversations", params={"limit": 1}).json()
+    assert history[0]["user_input"] == "你好"
+    assert history[0]["pet_response"] == done["response"]
+
+    # 对话历史的条数必须是正数
+    assert client.get("/conversations", params={"limit": 0}).status_code == 422
+
+def test_pet_status_reflects_checkpoint():
+    """测试宠物状态接口返回检查点中的真实心情和精力"""
+    print("=== 测试宠物状态接口 ===")
+
+    client = _client()
+    client.post("/message", json={"message": "摸摸头"})
+    status = client.get("/pet/status").json()
+    print(f"宠物状态: {status}")
+
+    checkpoint = main.checkpoint_store.load(status["pet_id"])
+    # 最近几轮对话也计入心情，之前的"你好"同样是正面互动
+    assert status["mood"] == checkpoint["mood"] and status["mood"] in ("content", "happy")
+    assert status["energy"] == checkpoint["energy"]
+    assert status["last_interaction"] == checkpoint["last_interaction"]
+
+def test_metrics_endpoint():
+    """测试指标导出接口"""
+    print("=== 测试指标导出接口 ===")
+
+    client = _client()
+    # 摸摸头这类简单互动走本地模板，用普通对话触发一次LLM回复
+    client.post("/message", json={"message": "给我讲个故事吧"})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE llm_response_duration_seconds histogram" in response.text
+    assert 'llm_responses_total{personality="' in response.text
+    assert 'pet_response_path_total{personality="' in response.text
+
+    snapshot = client.get("/metrics", params={"format": "json"}).json()
+    series = snapshot["llm_response_duration_seconds"]["series"]
+    print(f"回复耗时: {series}")
+    assert sum(item["count"] for item in series) >= 1
+
+def test_message_batch():
+    """测试批量消息接口：结果按请求顺序返回，对话在一个事务中保存"""
+    print("=== 测试批量消息接口 ===")
+
+    client = _client()
+    messages = ["批量一", "批量二", "批量三"]
+    flushes = main.db_manager.conversation_writer.flush_count
+    response = client.post("/message/batch", json={"messages": messages, "max_concurrency": 2})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    print(f"批量结果: {results}")
+    assert len(results) == 3 and all(item["response"] and item["error"] is None for item in results)
+
+    # 返回前已落库（最多先刷新一次队列中的旧记录，再写入这一批）
+    assert main.db_manager.conversation_writer.flush_count - flushes <= 2
+    history = client.get("/conversations", params={"limit": 3}).json()
+    assert [row["user_input"] for row in reversed(history)] == messages
+    assert [row["pet_response"] for row in reversed(history)] == [item["response"] for item in results]
+    assert [row["id"] for row in reversed(history)] == list(range(history[-1]["id"], history[-1]["id"] + 3))
+
+    main.BATCH_MAX_SIZE, limit = 2, main.BATCH_MAX_SIZE
+    try:
+        assert client.post("/message/batch", json={"messages": messages}).status_code == 400
+    finally:
+        main.BATCH_MAX_SIZE = limit
+
+def test_message_profile_in_debug_mode():
+    """测试调试模式下消息响应附带节点剖析，默认不附带"""
+    print("=== 测试调试模式节点剖析 ===")
+
+    client = _client()
+    assert "profile" not in client.post("/message", json={"message": "给我讲个故事吧"}).json()
+    # 其它返回消息的接口没有profile字段
+    assert client.post("/pet/greeting").json().keys() == {"response"}
+
+    agent, debug = main.pet_agent, main.DEBUG
+    workflow, profiler = agent.workflow, agent.profiler
+    agent.profiler = NodeProfiler(enabled=True)
+    agent.workflow = agent._create_workflow()
+    main.DEBUG = True
+    try:
+        profile = client.post("/message", json={"message": "给我讲个故事吧"}).json()["profile"]
+    finally:
+        agent.workflow, agent.profiler, main.DEBUG = workflow, profiler, debug
+    print(f"节点剖析: {profile}")
+    assert set(profile) == {"analyze_input", "tool_execution", "generate_response", "update_mood", "check_energy"}
+    assert all(entry["wall_ms"] >= 0 and entry["cpu_ms"] >= 0 for entry in profile.values())
+
+def test_small_talk_cache_with_history():
+    """测试有对话历史和记忆时，简单互动仍能命中响应缓存，其它对话带着上下文调用LLM"""
+    print("=== 测试带历史的缓存命中率 ===")
+
+    prompts = []
+
+    async def create(messages, **kwargs):
+        prompts.append(messages)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"回复{len(prompts)}"))])
+
+    client = _client()
+    llm, agent = main.llm_client, main.pet_agent
+    saved = llm.router, llm.response_cache, llm.semantic_cache, agent.fast_path
+    llm.router = ProviderRouter([
+        ProviderEndpoint("fake", "fake-model", async_client=SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    ])
+    llm.response_cache = ResponseCache(variants_per_key=3)
+    llm.semantic_cache = SemanticCache(variants_per_prompt=3)
+    # 简单互动全部走LLM，才能看到缓存的效果
+    agent.fast_path = FastPathResponder(llm_sample_rate=1)
+    try:
+        for message in ("给我讲个故事吧", "再讲一个"):
+            client.post("/message", json={"message": message})
+        assert len(prompts) == 2 and len(prompts[1]) > 2  # 带着历史
+        for _ in range(10):
+            client.post("/message", json={"message": "你好"})
+        client.post("/message", json={"message": "再讲一个"})
+        stats = llm.response_cache.stats()
+    finally:
+        llm.router, llm.response_cache, llm.semantic_cache, agent.fast_path = saved
+
+    print(f"LLM调用: {len(prompts)}次, 缓存统计: {stats}")
+    # 简单互动不带历史：凑满3个候选回复后，其余7次都命中缓存
+    assert all(len(prompt) == 2 for prompt in prompts[2:5])
+    assert len(prompts) == 6 and stats["hits"] == 7
+    # 其它对话的上下文变了，不命中缓存
+    assert len(prompts[-1]) > 2 and prompts[-1][-1]["content"] == "再讲一个"
+
+if __name__ == "__main__":
+    print("开始API进程内测试...")
+
+    test_message_stream()
+
+    # 测试宠物状态接口
+    test_pet_status_reflects_checkpoint()
+
+    # 测试指标导出接口
+    test_metrics_endpoint()
+
+    # 测试批量消息接口
+    test_message_batch()
+
+    # 测试调试模式节点剖析
+    test_message_profile_in_debug_mode()
+
+    # 测试带历史的缓存命中率
+    test_small_talk_cache_with_history()
+
+    print("测试完成！")
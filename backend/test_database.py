@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+数据库层测试脚本
+"""
+
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+# 使用临时数据库，避免改动仓库中的pet.db
+_tmp_dir = tempfile.mkdtemp(prefix="pet_db_test_")
+os.environ.setdefault("PET_DB_PATH", os.path.join(_tmp_dir, "pet.db"))
+
+from db_pool import ConnectionPool
+from conversation_writer import ConversationWriter
+from history_cache import HistoryCache
+from main import DatabaseManager, PetType
+
+def _temp_db_path(name: str) -> str:
+    return os.path.join(_tmp_dir, name)
+
+def test_connection_pool():
+    """测试连接池"""
+    print("=== 测试连接池 ===")
+
+    pool = ConnectionPool(_temp_db_path("pool.db"))
+
+    # 同一线程复用同一个连接
+    conn = pool.connection()
+    assert pool.connection() is conn
+
+    # WAL模式已开启
+    journal_mode = pool.fetchone("PRAGMA journal_mode")[0]
+    print(f"日志模式: {journal_mode}")
+    assert journal_mode.lower() == "wal"
+
+    # 不同线程使用不同的连接
+    other = []
+    thread = threading.Thread(target=lambda: other.append(pool.connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+    # 事务失败时回滚
+    pool.execute("CREATE TABLE items (value TEXT)")
+    try:
+        with pool.transaction() as c:
+            c.execute("INSERT INTO items VALUES ('a')")
+            raise RuntimeError("rollback")
+    except RuntimeError:
+        pass
+    assert pool.fetchone("SELECT COUNT(*) FROM items")[0] == 0
+
+    pool.executemany("INSERT INTO items VALUES (?)", [("a",), ("b",)])
+    assert pool.fetchone("SELECT COUNT(*) FROM items")[0] == 2
+
+    pool.close_all()
+    # 关闭后再次访问会重新建立连接
+    assert pool.fetchone("SELECT COUNT(*) FROM items")[0] == 2
+    pool.close_all()
+
+def test_database_manager():
+    """测试数据库管理器"""
+    print("\n=== 测试数据库管理器 ===")
+
+    db = DatabaseManager(_temp_db_path("manager.db"))
+
+    pet = db.get_or_create_pet()
+    print(f"宠物: {pet.name} ({pet.type.value}) - {pet.personality.value}")
+    assert db.get_or_create_pet().id == pet.id
+
+    db.save_conversation(pet.id, "你好", "喵~")
+    db.save_conversation(pet.id, "摸摸头", "呼噜呼噜")
+    history = db.get_conversation_history(pet.id, limit=10)
+    print(f"对话历史: {len(history)} 条记录")
+    assert len(history) == 2
+
+    db.update_pet_type(PetType.DOG)
+    assert db.get_or_create_pet().type == PetType.DOG
+
+    db.close()
+
+def test_pet_cache():
+    """测试宠物缓存"""
+    print("\n=== 测试宠物缓存 ===")
+
+    db = DatabaseManager(_temp_db_path("cache.db"))
+    pet = db.get_or_create_pet()
+
+    # 缓存命中后不再查询pets表
+    real_fetchone = db.pool.fetchone
+    def fail_fetchone(sql, params=()):
+        raise AssertionError(f"不应访问数据库: {sql}")
+    db.pool.fetchone = fail_fetchone
+    cached = db.get_or_create_pet()
+    assert cached.id == pet.id
+
+    # 调用方修改副本不影响缓存
+    cached.currentMessage = "changed"
+    assert db.get_or_create_pet().currentMessage == ""
+
+    # 更改类型后缓存同步更新，数据库也已写入
+    new_type = PetType.HAMSTER if pet.type != PetType.HAMSTER else PetType.CAT
+    db.update_pet_type(new_type)
+    assert db.get_or_create_pet().type == new_type
+
+    db.pool.fetchone = real_fetchone
+    db.invalidate_pet_cache()
+    reloaded = db.get_or_create_pet()
+    print(f"重新加载: {reloaded.name} ({reloaded.type.value})")
+    assert reloaded.id == pet.id and reloaded.type == new_type
+
+    db.close()
+
+def test_conversation_writer():
+    """测试对话记录后写队列"""
+    print("\n=== 测试对话记录后写队列 ===")
+
+    db = DatabaseManager(_temp_db_path("writer.db"))
+    pet = db.get_or_create_pet()
+
+    # 使用较长的刷新间隔，确认写入是批量完成的
+    db.conversation_writer.close()
+    writer = ConversationWriter(db.pool, batch_size=1000, flush_interval=60)
+    db.conversation_writer = writer
+
+    rows = [writer.submit(pet.id, f"消息{i}", f"回复{i}") for i in range(20)]
+    assert writer.pending_count() == 20
+    assert writer.has_pending(pet.id)
+    assert db.pool.fetchone("SELECT COUNT(*) FROM conversations")[0] == 0
+
+    # 读己之写：查询历史时会先刷新该宠物的待写记录
+    history = db.get_conversation_history(pet.id, limit=50)
+    print(f"对话历史: {len(history)} 条记录, 刷新次数: {writer.flush_count}")
+    assert len(history) == 20
+    assert writer.flush_count == 1
+    assert [row["id"] for row in rows] == sorted(row["id"] for row in rows)
+    assert None not in [row["id"] for row in rows]
+
+    # 批量写入：先写完队列中的记录，再在一个事务中写入这一批
+    db.save_conversation(pet.id, "排队中", "好")
+    batch = writer.write_batch(pet.id, [("批量一", "一"), ("批量二", "二")])
+    assert writer.flush_count == 3 and writer.pending_count() == 0
+    assert [row["id"] for row in batch] == [rows[-1]["id"] + 2, rows[-1]["id"] + 3]
+
+    # 关闭时同步写完剩余记录
+    db.save_conversation(pet.id, "再见", "拜拜")
+    db.close()
+    assert db.pool.fetchone("SELECT COUNT(*) FROM conversations")[0] == 24
+    db.pool.close_all()
+
+def test_conversation_writer_thresholds():
+    """测试后写队列的数量和时间阈值"""
+    print("\n=== 测试后写队列阈值 ===")
+
+    pool = ConnectionPool(_temp_db_path("writer_thresholds.db"))
+    DatabaseManager(pool.db_path, pool=pool).conversation_writer.close()
+
+    writer = ConversationWriter(pool, batch_size=5, flush_interval=0.05)
+    for i in range(5):
+        writer.submit(1, f"消息{i}", f"回复{i}")
+    writer.submit(1, "最后一条", "好")
+
+    deadline = time.monotonic() + 2
+    while writer.pending_count() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    print(f"写入行数: {writer.rows_written}, 刷新次数: {writer.flush_count}")
+    assert writer.rows_written == 6
+
+    writer.close()
+    pool.close_all()
+
+def test_conversation_pagination():
+    """测试对话历史游标分页"""
+    print("\n=== 测试对话历史游标分页 ===")
+
+    db = DatabaseManager(_temp_db_path("pagination.db"))
+    pet = db.get_or_create_pet()
+    for i in range(25):
+        db.save_conversation(pet.id, f"消息{i}", f"回复{i}")
+    db.save_conversation(pet.id + 1, "别的宠物", "不应出现")
+
+    # 用before游标向前翻页，直到取完
+    pages = [db.get_conversation_history(pet.id, limit=10)]
+    while pages[-1]:
+        pages.append(db.get_conversation_history(pet.id, limit=10, before=pages[-1][-1]["cursor"]))
+    sizes = [len(page) for page in pages]
+    print(f"分页大小: {sizes}")
+    assert sizes == [10, 10, 5, 0]
+
+    inputs = [row["user_input"] for page in pages for row in page]
+    assert inputs == [f"消息{i}" for i in reversed(range(25))]
+
+    # after游标取更新的记录，结果仍为时间倒序
+    newer = db.get_conversation_history(pet.id, limit=3, after=pages[2][-1]["cursor"])
+    assert [row["user_input"] for row in newer] == ["消息3", "消息2", "消息1"]
+
+    # 查询走复合索引
+    plan = db.pool.fetchall(
+        "EXPLAIN QUERY PLAN " + db.SELECT_HISTORY_BEFORE_SQL,
+        (pet.id, "2100-01-01 00:00:00", 0, 10)
+    )
+    print(f"查询计划: {plan}")
+    assert any("idx_conversations_pet_time" in str(row) for row in plan)
+
+    try:
+        db.get_conversation_history(pet.id, before="bad-cursor")
+        assert False, "无效游标应报错"
+    except ValueError:
+        pass
+
+    db.close()
+
+def test_history_cache():
+    """测试对话历史尾部缓存"""
+    print("\n=== 测试对话历史尾部缓存 ===")
+
+    db = DatabaseManager(_temp_db_path("history_cache.db"), history_cache_turns=5, history_cache_pets=2)
+    pet = db.get_or_create_pet()
+    db.conversation_writer.close()
+    writer = db.conversation_writer = ConversationWriter(db.pool, batch_size=1000, flush_interval=60)
+    for i in range(8):
+        db.save_conversation(pet.id, f"消息{i}", f"回复{i}")
+
+    # 首次访问从数据库预热（先刷新待写记录）
+    recent = db.get_recent_turns(pet.id, 3)
+    assert [row["user_input"] for row in recent] == ["消息7", "消息6", "消息5"]
+    assert writer.flush_count == 1
+
+    # 之后的对话直接追加到缓存，拼提示词时不查库也不刷新队列
+    db.save_conversation(pet.id, "消息8", "回复8")
+    recent = db.get_recent_turns(pet.id, 2)
+    assert [row["user_input"] for row in recent] == ["消息8", "消息7"]
+    assert recent[0]["id"] is None and writer.flush_count == 1
+
+    # 小页数的历史查询走缓存，未落库的记录先刷新以回填id和游标
+    history = db.get_conversation_history(pet.id, limit=5)
+    print(f"缓存统计: {db.history_cache.stats()}")
+    assert history == db.get_conversation_history(pet.id, limit=5, before="2100-01-01 00:00:00|0")
+    assert [row["user_input"] for row in history] == [f"消息{i}" for i in range(8, 3, -1)]
+    assert writer.flush_count == 2
+
+    # 超出缓存容量或不是正数的条数回到数据库，结果与缓存是否预热无关
+    misses = db.history_cache.misses
+    assert len(db.get_conversation_history(pet.id, limit=50)) == 9
+    assert len(db.get_conversation_history(pet.id, limit=-1)) == 9
+    assert db.get_conversation_history(pet.id, limit=0) == []
+    assert db.history_cache.misses == misses
+
+    # 超过宠物数上限时淘汰最久未用的宠物
+    db.get_recent_turns(pet.id + 1, 3)
+    db.get_recent_turns(pet.id, 3)
+    db.get_recent_turns(pet.id + 2, 3)
+    assert db.history_cache.cached(pet.id) and not db.history_cache.cached(pet.id + 1)
+    assert db.history_cache.evictions == 1
+    db.close()
+
+    # 预热期间有新对话保存时不缓存加载结果，避免漏掉这轮对话
+    cache = HistoryCache(lambda pet_id, limit: cache.append(pet_id, {"user_input": "新"}) or [], max_turns=5)
+    assert cache.get(1, 3) == [] and not cache.cached(1)
+
+    # 其它宠物的新对话不影响预热
+    cache = HistoryCache(lambda pet_id, limit: cache.append(2, {"user_input": "新"}) or [], max_turns=5)
+    assert cache.get(1, 3) == [] and cache.cached(1) and not cache.cached(2)
+
+def test_async_database():
+    """测试异步数据库接口"""
+    print("\n=== 测试异步数据库接口 ===")
+
+    db = DatabaseManager(_temp_db_path("async.db"))
+
+    async def scenario():
+        pet = await db.aget_or_create_pet()
+        for i in range(5):
+            await db.asave_conversation(pet.id, f"消息{i}", f"回复{i}")
+
+        # 并发查询在数据库线程中执行，事件循环不被阻塞
+        pages = await asyncio.gather(*[
+            db.aget_conversation_history(pet.id, limit=3) for _ in range(10)
+        ])
+        # 最近几轮命中缓存，包含尚未落库的记录
+        await db.asave_conversation(pet.id, "消息5", "回复5")
+        recent = await db.aget_recent_turns(pet.id, 2)
+        await db.aupdate_pet_type(PetType.RABBIT)
+        return pet, pages, recent, await db.aget_or_create_pet()
+
+    pet, pages, recent, updated = asyncio.run(scenario())
+    assert [row["user_input"] for row in recent] == ["消息5", "消息4"]
+    print(f"并发查询: {len(pages)} 次, 每页 {len(pages[0])} 条")
+    assert all([row["id"] for row in page] == [row["id"] for row in pages[0]] for page in pages)
+    assert updated.id == pet.id and updated.type == PetType.RABBIT
+
+    db.close()
+
+if __name__ == "__main__":
+    print("开始数据库层测试...")
+
+    test_connection_pool()
+    test_database_manager()
+    test_pet_cache()
+    test_conversation_writer()
+    test_conversation_writer_thresholds()
+    test_conversation_pagination()
+    test_history_cache()
+    test_async_database()
+
+    print("测试完成！")
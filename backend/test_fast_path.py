@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+本地快速回复测试脚本
+"""
+
+import json
+import os
+import random
+import tempfile
+import time
+from fast_path import DEFAULT_TEMPLATES, RESPONSE_PATHS, FastPathResponder
+from keyword_matcher import KeywordMatcher
+from llm_client import LLMClient, PersonalityType
+from pet_agent import PetAgent
+
+def test_fast_path_responder():
+    """测试哪些输入走本地模板、抽样比例和模板扩充"""
+    print("\n=== 测试本地快速回复 ===")
+
+    matcher = KeywordMatcher()
+    responder = FastPathResponder(llm_sample_rate=0, rng=random.Random(1))
+
+    def respond(text: str, personality=PersonalityType.COLD):
+        return responder.respond(matcher.match(text), text, personality)
+
+    assert respond("你好") in DEFAULT_TEMPLATES["cold"]["greeting"]
+    assert respond("拜拜") in DEFAULT_TEMPLATES["cold"]["farewell"]
+    assert respond("摸摸头", PersonalityType.CLINGY) in DEFAULT_TEMPLATES["clingy"]["want_physical_contact"]
+    assert respond("抱抱~", PersonalityType.QUIET) in DEFAULT_TEMPLATES["quiet"]["want_hug"]
+
+    # 关键词只是子串、带否定词或有其它内容的输入不算简单互动
+    for text in ("which", "this", "nothing", "shit", "hi there", "你好烦", "不要摸摸我", "别抱抱", "再见不到你了"):
+        assert respond(text) is None, text
+    assert respond("Hi!") in DEFAULT_TEMPLATES["cold"]["greeting"]
+    assert respond("你好呀~") in DEFAULT_TEMPLATES["cold"]["greeting"]
+    assert respond("摸摸头😊") in DEFAULT_TEMPLATES["cold"]["want_physical_contact"]
+
+    # 不依赖上下文的简单互动（与模板和抽样无关），走LLM时按输入缓存
+    assert all(responder.is_small_talk(matcher.match(text), text) for text in ("你好", "拜拜~", "抱抱"))
+    assert not any(responder.is_small_talk(matcher.match(text), text) for text in ("开心", "你好烦", "你好，几点了"))
+
+    # 长输入、需要工具或没有对应模板的输入交给LLM
+    assert respond("你好，我今天上班遇到了一件很烦心的事") is None
+    assert respond("你好，几点了") is None
+    assert respond("今天好开心") is None
+    stats = responder.stats()
+    print(f"统计: {stats}")
+    assert (stats["local"], stats["sampled"], stats["llm"]) == (7, 0, 12)
+
+    # 抽样比例：命中模板的消息按比例走LLM
+    sampler = FastPathResponder(llm_sample_rate=0.3, rng=random.Random(7))
+    replies = [sampler.respond(matcher.match("你好"), "你好", PersonalityType.PLAYFUL) for _ in range(2000)]
+    ratio = replies.count(None) / len(replies)
+    print(f"抽样走LLM的比例: {ratio:.3f}")
+    assert 0.25 < ratio < 0.35 and sampler.stats()["sampled"] == replies.count(None)
+    assert RESPONSE_PATHS.value(personality="playful", intent="greeting", path="sampled") >= replies.count(None)
+
+    # 从JSON文件扩充模板库
+    path = os.path.join(tempfile.mkdtemp(prefix="pet_fast_path_test_"), "templates.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"cold": {"saying_goodbye": ["慢走不送"]}}, f, ensure_ascii=False)
+    responder.load(path)
+    assert respond("再见") == "慢走不送"
+    assert respond("走了") in DEFAULT_TEMPLATES["cold"]["farewell"]
+
+    # 本地回复在微秒级完成
+    match = matcher.match("你好")
+    start = time.perf_counter()
+    for _ in range(10000):
+        responder.respond(match, "你好", PersonalityType.COLD)
+    per_call = (time.perf_counter() - start) / 10000
+    print(f"每次本地回复耗时: {per_call * 1e6:.1f}µs")
+    assert per_call < 0.0001
+
+def test_agent_skips_llm_for_trivial_input():
+    """测试Agent对简单互动不调用LLM，其它消息照常调用"""
+    print("\n=== 测试Agent跳过LLM ===")
+
+    llm_client = LLMClient()
+    calls = []
+
+    def fake_generate(user_input, *args, **kwargs):
+        calls.append(user_input)
+        return "LLM回复"
+
+    llm_client.generate_response = fake_generate
+    pet_agent = PetAgent(llm_client)
+    pet_agent.fast_path = FastPathResponder(llm_sample_rate=0)
+
+    result = pet_agent.invoke("摸摸头", PersonalityType.PLAYFUL)
+    print(f"摸摸头 -> {result['messages'][-1].content}")
+    assert result["messages"][-1].content in DEFAULT_TEMPLATES["playful"]["want_physical_contact"]
+    assert result["mood"] == "content" and calls == []
+
+    result = pet_agent.invoke("给我讲个故事", PersonalityType.PLAYFUL)
+    assert result["messages"][-1].content == "LLM回复" and calls == ["给我讲个故事"]
+
+    # 抽样比例为1时全部走LLM
+    pet_agent.fast_path = FastPathResponder(llm_sample_rate=1)
+    pet_agent.invoke("你好", PersonalityType.PLAYFUL)
+    assert calls[-1] == "你好"
+
+if __name__ == "__main__":
+    print("开始本地快速回复测试...")
+
+    # 测试本地快速回复
+    test_fast_path_responder()
+
+    # 测试Agent跳过LLM
+    test_agent_skips_llm_for_trivial_input()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+关键词匹配测试脚本
+"""
+
+from bench_keyword_matcher import legacy_scan, make_corpus
+from keyword_matcher import KeywordMatcher, KeywordRule
+
+def test_overlapping_keywords():
+    """测试重叠关键词和失败指针（一个关键词是另一个的后缀或前缀）"""
+    print("\n=== 测试重叠关键词 ===")
+
+    matcher = KeywordMatcher([
+        KeywordRule("he", category="a"),
+        KeywordRule("she", category="b"),
+        KeywordRule("his", category="c"),
+        KeywordRule("hers", category="d"),
+    ], category_priority=("a", "b", "c", "d"))
+    match = matcher.match("USHERS")
+    print(f"命中: {match.keywords}")
+    assert match.keywords == ("he", "she", "hers")
+    assert match.input_type == "a"
+    assert matcher.match("ahishers").keywords == ("his", "he", "she", "hers")
+
+def test_agent_keywords():
+    """测试默认关键词表的分类、意图、工具和情感"""
+    print("\n=== 测试默认关键词表 ===")
+
+    matcher = KeywordMatcher()
+    match = matcher.match("你好呀，现在天气怎么样？想玩游戏")
+    print(f"匹配结果: {match}")
+    assert match.input_type == "greeting"
+    assert match.user_intent == "general_chat"
+    assert match.tools == ("get_time", "get_weather", "get_health", "play_with_pet")
+    assert match.positive
+
+    match = matcher.match("摸摸头，抱抱")
+    assert match.input_type == "physical_interaction" and match.user_intent == "want_physical_contact"
+    assert match.keywords == ("摸摸", "摸摸头", "抱抱")
+
+    match = matcher.match("明天见")
+    assert match.input_type == "general" and match.tools == () and not match.positive
+
+    # 不区分大小写
+    assert matcher.match("HELLO").input_type == "greeting"
+
+def test_same_result_as_legacy_checks():
+    """测试与改造前逐个 any(word in content) 判断的结果一致"""
+    print("\n=== 测试与原判断逻辑一致 ===")
+
+    matcher = KeywordMatcher()
+    corpus = make_corpus(5000, seed=1)
+    for text in corpus:
+        match = matcher.match(text)
+        assert (match.input_type, match.user_intent, match.tools, match.positive) == legacy_scan(text), text
+    print(f"{len(corpus)} 条输入结果一致")
+
+if __name__ == "__main__":
+    print("开始关键词匹配测试...")
+
+    # 测试重叠关键词
+    test_overlapping_keywords()
+
+    # 测试默认关键词表
+    test_agent_keywords()
+
+    # 测试与原判断逻辑一致
+    test_same_result_as_legacy_checks()
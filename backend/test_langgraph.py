@@ -4,10 +4,22 @@ LangGraph集成测试脚本
 """
 
 import asyncio
+import os
 import requests
 import json
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from checkpoint_store import CheckpointStore
+from db_pool import ConnectionPool
 from pet_agent import PetAgent
+from langchain_core.messages import AIMessage, HumanMessage
 from llm_client import LLMClient, PersonalityType
+from metrics import registry
+from node_profiler import NodeProfiler
+from tools import ToolResult
 
 def test_pet_agent():
     """测试宠物Agent"""
@@ -98,6 +110,305 @@ def test_workflow_components():
     print(f"心情: {result.get('mood', 'unknown')}")
     print(f"精力: {result.get('energy', 'unknown')}")
     print(f"性格: {result.get('personality', 'unknown')}")
+    
+    # 各节点共用同一个关键词匹配结果
+    context = result["context"]
+    print(f"关键词匹配: {context['keyword_match']}")
+    assert context["input_type"] == context["keyword_match"].input_type == "greeting"
+    assert context["user_intent"] == "general_chat"
+
+def test_async_pet_agent():
+    """测试异步调用宠物Agent"""
+    print("\n=== 测试异步宠物Agent ===")
+    
+    llm_client = LLMClient()
+    pet_agent = PetAgent(llm_client)
+    
+    async def run_concurrent():
+        return await asyncio.gather(*[
+            pet_agent.ainvoke(user_input, PersonalityType.CLINGY)
+            for user_input in ["你好", "现在几点", "摸摸头"]
+        ])
+    
+    for result in asyncio.run(run_concurrent()):
+        ai_messages = [msg for msg in result["messages"] if isinstance(msg, AIMessage)]
+        print(f"宠物: {ai_messages[-1].content if ai_messages else '无响应'}")
+        assert ai_messages
+
+def test_astream_pet_agent():
+    """测试流式调用宠物Agent"""
+    print("\n=== 测试流式宠物Agent ===")
+    
+    llm_client = LLMClient()
+    pet_agent = PetAgent(llm_client)
+    
+    async def collect():
+        return [item async for item in pet_agent.astream("摸摸头", PersonalityType.QUIET)]
+    
+    events = asyncio.run(collect())
+    tokens = [payload for kind, payload in events if kind == "token"]
+    kind, result = events[-1]
+    ai_messages = [msg for msg in result["messages"] if isinstance(msg, AIMessage)]
+    print(f"token数: {len(tokens)}, 完整响应: {ai_messages[-1].content}")
+    assert kind == "result"
+    assert "".join(tokens) == ai_messages[-1].content
+
+def test_conversation_history_excludes_current_input():
+    """测试对话历史不包含当前输入（避免重复发送给LLM）"""
+    print("\n=== 测试对话历史格式化 ===")
+    
+    pet_agent = PetAgent(LLMClient())
+    messages = [
+        HumanMessage(content="你好"),
+        AIMessage(content="哼"),
+        HumanMessage(content="现在几点")
+    ]
+    history = pet_agent._format_conversation_history(messages)
+    print(f"历史: {history}")
+    assert history == [{"role": "user", "content": "你好"}, {"role": "assistant", "content": "哼"}]
+    assert pet_agent._format_conversation_history([HumanMessage(content="你好")]) == []
+
+def test_checkpoint_across_invocations():
+    """测试宠物状态在多次调用之间保持（内存热层 + SQLite持久化）"""
+    print("\n=== 测试状态检查点 ===")
+    
+    db_path = os.path.join(tempfile.mkdtemp(prefix="pet_checkpoint_test_"), "pet.db")
+    pool = ConnectionPool(db_path)
+    store = CheckpointStore(pool)
+    pet_agent = PetAgent(LLMClient(), checkpoint_store=store)
+    
+    # 没有互动过时返回默认状态
+    assert pet_agent.get_status(1)["mood"] == "neutral"
+    
+    # 冷淡性格的普通对话每次精力-2，精力从上次的值继续扣
+    first = pet_agent.invoke("在吗", PersonalityType.COLD, session=1)
+    second = asyncio.run(pet_agent.ainvoke("在吗", PersonalityType.COLD, session=1))
+    print(f"精力: {first['energy']} -> {second['energy']}")
+    assert first["energy"] == 98 and second["energy"] == 96
+    
+    # 没有进入主动问候分支
+    assert isinstance(second["messages"][0], HumanMessage) and len(second["messages"]) == 2
+    
+    # 状态读检查点，不运行工作流；其它宠物互不影响
+    status = pet_agent.get_status(1)
+    print(f"状态: {status}, 统计: {store.stats()}")
+    assert status["energy"] == 96 and status["mood"] == "neutral" and status["personality"] == "cold"
+    assert status["last_interaction"] == second["last_interaction"]
+    assert pet_agent.get_status(2)["energy"] == 100
+    
+    # 进程重启后从SQLite恢复
+    restored = PetAgent(LLMClient(), checkpoint_store=CheckpointStore(pool))
+    assert asyncio.run(restored.aget_status(1))["energy"] == 96
+    third = restored.invoke("摸摸头，抱抱", PersonalityType.COLD, session=1)
+    assert third["mood"] == "content" and third["energy"] == 100
+    pool.close_all()
+
+def test_checkpoint_write_outside_lock():
+    """测试写库期间热层读取不被阻塞，被新状态取代的写入跳过，异步接口使用传入的执行器"""
+    print("\n=== 测试检查点写库不持有热层锁 ===")
+    
+    pool = ConnectionPool(os.path.join(tempfile.mkdtemp(prefix="pet_checkpoint_test_"), "pet.db"))
+    store = CheckpointStore(pool)
+    state = {"personality": "cold", "mood": "neutral", "energy": 100, "last_interaction": None}
+    store.save(1, state)
+    
+    # 第一次写库卡在磁盘上
+    writing, release, written = threading.Event(), threading.Event(), []
+    execute = pool.execute
+    
+    def slow_execute(sql, params=()):
+        if sql == CheckpointStore.UPSERT_SQL:
+            written.append(params[3])
+            if len(written) == 1:
+                writing.set()
+                release.wait(5)
+        return execute(sql, params)
+    
+    pool.execute = slow_execute
+    first = threading.Thread(target=store.save, args=(1, dict(state, energy=90)))
+    first.start()
+    assert writing.wait(5)
+    
+    # 写库期间热层读取立即返回最新状态
+    start = time.perf_counter()
+    assert store.load(1)["energy"] == 90
+    assert time.perf_counter() - start < 0.5
+    
+    # 排队中的写入被更新的状态取代，只写最后一次
+    second = threading.Thread(target=store.save, args=(1, dict(state, energy=80)))
+    third = threading.Thread(target=store.save, args=(1, dict(state, energy=70)))
+    second.start()
+    time.sleep(0.05)
+    third.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in (first, second, third):
+        thread.join(5)
+    print(f"写库的精力值: {written}")
+    assert written == [90, 70]
+    assert CheckpointStore(pool).load(1)["energy"] == 70
+    
+    # 异步接口通过传入的执行器访问数据库
+    calls = []
+    
+    async def run_in_executor(func, *args):
+        calls.append(func.__name__)
+        return func(*args)
+    
+    pool.execute = execute
+    restored = CheckpointStore(pool, run_in_executor=run_in_executor)
+    assert asyncio.run(restored.aload(1))["energy"] == 70
+    asyncio.run(restored.asave(1, dict(state, energy=60)))
+    assert calls == ["load", "save"]
+    pool.close_all()
+
+def test_energy_recovery_and_tired_replies():
+    """测试精力按空闲时间恢复；累了时回复仍由LLM生成，只在提示词中带疲惫提示"""
+    print("\n=== 测试精力恢复和疲惫提示 ===")
+    
+    pool = ConnectionPool(os.path.join(tempfile.mkdtemp(prefix="pet_energy_test_"), "pet.db"))
+    store = CheckpointStore(pool)
+    llm_client = LLMClient()
+    tool_infos = []
+    
+    def fake_generate(user_input, personality, history, tool_info=None, **kwargs):
+        tool_infos.append(tool_info)
+        return f"回复{len(tool_infos)}"
+    
+    llm_client.generate_response = fake_generate
+    pet_agent = PetAgent(llm_client, checkpoint_store=store)
+    
+    # 粘人性格的普通对话每次精力-5，连续20轮后精力见底，回复仍然是LLM生成的
+    for turn in range(1, 21):
+        result = pet_agent.invoke("在干嘛呢", PersonalityType.CLINGY, session=1)
+        assert [msg.content for msg in result["messages"] if isinstance(msg, AIMessage)] == [f"回复{turn}"]
+    print(f"20轮后精力: {result['energy']}, 累了: {result['context']['tired']}")
+    assert result["energy"] == 0 and result["context"]["tired"]
+    assert tool_infos[0] is None
+    assert tool_infos[-1] == "状态：你现在有点累了，但还是想和主人待在一起"
+    
+    # 空闲一段时间后精力恢复：每分钟恢复2点
+    checkpoint = store.load(1)
+    checkpoint["energy"] = 20
+    checkpoint["last_interaction"] = (datetime.now() - timedelta(minutes=30)).isoformat()
+    store.save(1, checkpoint)
+    state = pet_agent._initial_state("在吗", PersonalityType.CLINGY, session=1, checkpoint=store.load(1))
+    assert state["energy"] == 80
+    pool.close_all()
+
+def test_concurrent_tool_execution():
+    """测试匹配到的工具并发执行，超时的工具不影响其它结果"""
+    print("\n=== 测试工具并发执行 ===")
+    
+    # 按工具的超时从环境变量读取，配置无效时忽略
+    os.environ["TOOL_TIMEOUTS"] = "[1, 2]"
+    assert PetAgent(LLMClient()).tool_timeouts == {}
+    os.environ["TOOL_TIMEOUTS"] = '{"get_health": 0.3}'
+    try:
+        pet_agent = PetAgent(LLMClient())
+    finally:
+        del os.environ["TOOL_TIMEOUTS"]
+    assert pet_agent.tool_timeouts == {"get_health": 0.3} and pet_agent.tool_timeout == 2
+    
+    def slow_tool(name: str, delay: float):
+        def run(**kwargs):
+            time.sleep(delay)
+            return ToolResult(success=True, data={}, message=name)
+        return run
+    
+    pet_agent.tool_manager.tools.update({
+        "get_time": slow_tool("十点", 0.2),
+        "get_weather": slow_tool("晴天", 0.2),
+        "get_health": slow_tool("很健康", 1.0)
+    })
+    start = time.perf_counter()
+    result = pet_agent.invoke("现在几点，天气怎么样", PersonalityType.QUIET)
+    elapsed = time.perf_counter() - start
+    async_start = time.perf_counter()
+    async_result = asyncio.run(pet_agent.ainvoke("现在几点，天气怎么样", PersonalityType.QUIET))
+    async_elapsed = time.perf_counter() - async_start
+    pet_agent.close()
+    
+    for context, seconds in ((result["context"], elapsed), (async_result["context"], async_elapsed)):
+        print(f"耗时: {seconds:.2f}s, 工具结果: {context['tool_results']}, 计时: {context['tool_timings']}")
+        # 串行需要1.4秒；并发时由最慢的超时（0.3秒）决定
+        assert seconds < 0.8
+        assert context["tool_results"] == ["时间信息：十点", "天气信息：晴天"]
+        timings = context["tool_timings"]
+        assert list(timings) == ["get_time", "get_weather", "get_health"]
+        assert timings["get_time"]["status"] == "ok" and timings["get_time"]["elapsed_ms"] >= 200
+        assert timings["get_health"]["status"] == "timeout"
+
+def test_batch_invocation():
+    """测试批量调用：并发数受限，结果顺序与输入一致，单条失败不影响其它输入"""
+    print("\n=== 测试批量调用 ===")
+    
+    llm_client = LLMClient()
+    pet_agent = PetAgent(llm_client)
+    lock = threading.Lock()
+    running = {"now": 0, "max": 0}
+    
+    def track(delta: int):
+        with lock:
+            running["now"] += delta
+            running["max"] = max(running["max"], running["now"])
+    
+    async def fake_agenerate(user_input, *args, **kwargs):
+        track(1)
+        # 先到的输入晚返回，检验结果仍按输入顺序排列
+        await asyncio.sleep(0.05 if user_input.endswith("0") else 0.01)
+        track(-1)
+        if user_input == "坏消息":
+            raise RuntimeError("生成失败")
+        return f"回复{user_input}"
+    
+    def fake_generate(user_input, *args, **kwargs):
+        track(1)
+        time.sleep(0.02)
+        track(-1)
+        return f"回复{user_input}"
+    
+    llm_client.agenerate_response = fake_agenerate
+    llm_client.generate_response = fake_generate
+    
+    inputs = [f"消息{i}" for i in range(10)] + ["坏消息"]
+    results = asyncio.run(pet_agent.abatch(inputs, PersonalityType.QUIET, max_concurrency=3))
+    print(f"最大并发: {running['max']}, 结果数: {len(results)}")
+    assert running["max"] == 3
+    assert [result["messages"][-1].content for result in results[:10]] == [f"回复消息{i}" for i in range(10)]
+    assert isinstance(results[10], RuntimeError)
+    
+    running["max"] = 0
+    results = pet_agent.batch(inputs[:6], PersonalityType.QUIET, max_concurrency=2)
+    assert running["max"] == 2
+    assert [result["messages"][-1].content for result in results] == [f"回复消息{i}" for i in range(6)]
+    assert pet_agent.batch([], PersonalityType.QUIET) == []
+
+def test_node_profiling():
+    """测试开启剖析后每个节点的耗时和内存分配写入直方图和上下文"""
+    print("\n=== 测试节点剖析 ===")
+    
+    pet_agent = PetAgent(LLMClient())
+    assert not pet_agent.profiler.enabled  # 默认关闭
+    assert "profile" not in pet_agent.invoke("给我讲个故事", PersonalityType.QUIET)["context"]
+    
+    pet_agent.profiler = NodeProfiler(enabled=True, trace_allocations=True)
+    pet_agent.workflow = pet_agent._create_workflow()
+    before = registry.get("pet_node_wall_seconds").snapshot()
+    
+    result = pet_agent.invoke("现在几点", PersonalityType.QUIET)
+    async_result = asyncio.run(pet_agent.ainvoke("现在几点", PersonalityType.QUIET))
+    for profile in (result["context"]["profile"], async_result["context"]["profile"]):
+        print(f"节点剖析: {profile}")
+        assert list(profile) == ["analyze_input", "tool_execution", "generate_response", "update_mood", "check_energy"]
+        assert all(entry["wall_ms"] >= 0 and entry["cpu_ms"] >= 0 for entry in profile.values())
+        assert all("allocated_bytes" in entry for entry in profile.values())
+    
+    counts = {item["labels"]["node"]: item["count"] for item in registry.get("pet_node_wall_seconds").snapshot()}
+    previous = {item["labels"]["node"]: item["count"] for item in before}
+    assert counts["generate_response"] - previous.get("generate_response", 0) == 2
+    assert registry.get("pet_node_allocated_bytes").quantile(0.5, node="update_mood") is not None
+    tracemalloc.stop()
 
 if __name__ == "__main__":
     print("开始LangGraph集成测试...")
@@ -108,6 +419,33 @@ if __name__ == "__main__":
     # 测试工作流组件
     test_workflow_components()
     
+    # 测试异步调用
+    test_async_pet_agent()
+    
+    # 测试流式调用
+    test_astream_pet_agent()
+    
+    # 测试对话历史格式化
+    test_conversation_history_excludes_current_input()
+    
+    # 测试状态检查点
+    test_checkpoint_across_invocations()
+    
+    # 测试检查点写库不持有热层锁
+    test_checkpoint_write_outside_lock()
+    
+    # 测试精力恢复和疲惫提示
+    test_energy_recovery_and_tired_replies()
+    
+    # 测试工具并发执行
+    test_concurrent_tool_execution()
+    
+    # 测试批量调用
+    test_batch_invocation()
+    
+    # 测试节点剖析
+    test_node_profiling()
+    
     # 测试API端点
     test_api_endpoints()
     
@@ -4,9 +4,21 @@ LLM集成测试脚本
 """
 
 import asyncio
+import os
+import random
 import requests
 import json
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
 from llm_client import LLMClient, PersonalityType
+from mock_llm_server import MockLLMServer, parse_latency
+from prompt_builder import PromptBuilder, TokenCounter
+from provider_router import ProviderEndpoint, ProviderRouter
+from response_cache import ResponseCache
+from semantic_cache import SemanticCache
+from singleflight import SingleFlight
 
 def test_llm_client():
     """测试LLM客户端"""
@@ -36,6 +48,293 @@ def test_llm_client():
             print(f"宠物: {response}")
             print()
 
+def test_async_llm_client():
+    """测试异步LLM客户端"""
+    print("\n=== 测试异步LLM客户端 ===")
+    
+    client = LLMClient()
+    print(f"连接池大小: {client.pool_size}, 超时: {client.timeout}s")
+    
+    async def run_concurrent():
+        # 多个请求同时在途
+        inputs = ["你好", "摸摸头", "今天开心吗", "我想你了"]
+        return await asyncio.gather(*[
+            client.agenerate_response(user_input, PersonalityType.PLAYFUL)
+            for user_input in inputs
+        ])
+    
+    responses = asyncio.run(run_concurrent())
+    for response in responses:
+        print(f"宠物: {response}")
+    assert len(responses) == 4 and all(responses)
+
+def _fake_router(client=None, async_client=None) -> ProviderRouter:
+    """只有一个假提供商的路由"""
+    return ProviderRouter([ProviderEndpoint("fake", "fake-model", client=client, async_client=async_client)])
+
+class _FakeCompletions:
+    """记录调用次数的假LLM接口"""
+    
+    def __init__(self):
+        self.calls = 0
+    
+    def create(self, **kwargs):
+        self.calls += 1
+        message = SimpleNamespace(content=f"回复{self.calls}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+def test_response_cache():
+    """测试LLM响应缓存"""
+    print("\n=== 测试LLM响应缓存 ===")
+    
+    cache = ResponseCache(max_entries=2, ttl=60, variants_per_key=2)
+    
+    # 归一化：空白、大小写、结尾标点不影响键
+    key = cache.make_key(PersonalityType.COLD, " 你好！ ")
+    assert key == cache.make_key(PersonalityType.COLD, "你好")
+    assert key != cache.make_key(PersonalityType.CLINGY, "你好")
+    assert key != cache.make_key(PersonalityType.COLD, "你好", tool_context="现在是12:00")
+    
+    # 候选回复凑满之前都算未命中
+    cache.put(key, "哼")
+    assert cache.get(key) is None
+    cache.put(key, "嗯")
+    assert cache.get(key) in ("哼", "嗯")
+    
+    # LRU淘汰最久未使用的条目
+    cache.put(("a",), "1")
+    cache.put(("b",), "2")
+    assert cache.stats()["size"] == 2 and cache.stats()["evictions"] == 1
+    
+    # TTL过期
+    cache.put(("ttl",), "x", ttl=0)
+    cache.put(("ttl",), "y", ttl=0)
+    assert cache.get(("ttl",)) is None
+    print(f"缓存统计: {cache.stats()}")
+    
+    # 接入LLM客户端后，重复输入不再调用LLM
+    client = LLMClient()
+    client.response_cache = ResponseCache(max_entries=16, ttl=60, variants_per_key=2)
+    fake = _FakeCompletions()
+    client.router = _fake_router(client=SimpleNamespace(chat=SimpleNamespace(completions=fake)))
+    replies = [client.generate_response("摸摸头", PersonalityType.PLAYFUL) for _ in range(10)]
+    print(f"LLM调用次数: {fake.calls}, 回复: {set(replies)}")
+    assert fake.calls == 2
+    assert set(replies) == {"回复1", "回复2"}
+
+def test_semantic_cache():
+    """测试语义近似缓存"""
+    print("\n=== 测试语义近似缓存 ===")
+    
+    cache = SemanticCache(threshold=0.7, max_entries_per_personality=4, variants_per_prompt=1)
+    cache.add(PersonalityType.CLINGY, "摸摸头", "好舒服~")
+    cache.add(PersonalityType.CLINGY, "我想你了", "我也想主人！")
+    
+    # 近似说法命中，不同性格和否定句不命中
+    assert cache.lookup(PersonalityType.CLINGY, "摸摸你") == "好舒服~"
+    assert cache.lookup(PersonalityType.COLD, "摸摸你") is None
+    assert cache.lookup(PersonalityType.CLINGY, "我不想你了") is None
+    assert cache.lookup(PersonalityType.CLINGY, "再见") is None
+    
+    # 环形缓冲：超出容量后覆盖最早的条目
+    for i in range(4):
+        cache.add(PersonalityType.CLINGY, f"第{i}个问题是什么", f"答案{i}")
+    assert cache.lookup(PersonalityType.CLINGY, "摸摸头") is None
+    
+    stats = cache.stats()
+    print(f"语义缓存统计: {stats}")
+    assert stats["hits"] == 1 and stats["size"] == 4
+    assert stats["avg_lookup_ms"] > 0
+    
+    # 接入LLM客户端：换个说法也不再调用LLM
+    client = LLMClient()
+    client.semantic_cache = SemanticCache(variants_per_prompt=1)
+    fake = _FakeCompletions()
+    client.router = _fake_router(client=SimpleNamespace(chat=SimpleNamespace(completions=fake)))
+    first = client.generate_response("摸摸头", PersonalityType.PLAYFUL)
+    second = client.generate_response("摸摸你！", PersonalityType.PLAYFUL)
+    print(f"LLM调用次数: {fake.calls}, 回复: {first} / {second}")
+    assert fake.calls == 1 and first == second
+
+def test_semantic_cache_ttl_variants_and_context():
+    """测试语义缓存的过期时间和候选回复轮换，以及带上下文的输入不走语义缓存"""
+    print("\n=== 测试语义缓存过期和上下文 ===")
+    
+    # 与精确缓存一样，凑满候选回复前不命中
+    cache = SemanticCache(variants_per_prompt=2, ttl=60)
+    cache.add(PersonalityType.QUIET, "摸摸头", "嗯")
+    assert cache.lookup(PersonalityType.QUIET, "摸摸你") is None
+    cache.add(PersonalityType.QUIET, "摸摸头", "好")
+    assert {cache.lookup(PersonalityType.QUIET, "摸摸你") for _ in range(50)} == {"嗯", "好"}
+    
+    # 过期的条目不命中，再次写入时重新积累
+    expired = SemanticCache(variants_per_prompt=1, ttl=0)
+    expired.add(PersonalityType.QUIET, "摸摸头", "嗯")
+    assert expired.lookup(PersonalityType.QUIET, "摸摸你") is None
+    
+    # 对话历史每次不同：每次都调用LLM，不会被语义缓存一直返回同一句
+    client = LLMClient()
+    fake = _FakeCompletions()
+    client.router = _fake_router(client=SimpleNamespace(chat=SimpleNamespace(completions=fake)))
+    replies = [
+        client.generate_response(
+            "你好", PersonalityType.QUIET,
+            [{"role": "user", "content": f"第{i}句"}, {"role": "assistant", "content": f"回{i}"}]
+        )
+        for i in range(6)
+    ]
+    print(f"LLM调用次数: {fake.calls}, 回复: {replies}, 语义缓存: {client.semantic_cache.stats()}")
+    assert fake.calls == 6 and len(set(replies)) == 6
+    assert client.semantic_cache.stats()["hits"] == 0 and client.semantic_cache.stats()["size"] == 0
+    
+    # 长期记忆也计入缓存键
+    assert ResponseCache.make_key(PersonalityType.QUIET, "你好", memory="主人叫小明") != \
+        ResponseCache.make_key(PersonalityType.QUIET, "你好")
+
+class _SlowAsyncCompletions:
+    """带延迟的假异步LLM接口"""
+    
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = 0
+    
+    async def create(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        message = SimpleNamespace(content=f"回复{self.calls}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+def test_singleflight():
+    """测试相同请求合并"""
+    print("\n=== 测试相同请求合并 ===")
+    
+    # 同步：多个线程同时请求同一个键，只执行一次
+    flight = SingleFlight()
+    calls = []
+    def slow_call():
+        calls.append(1)
+        time.sleep(0.2)
+        return "结果"
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        results = list(pool.map(lambda _: flight.do("key", slow_call), range(5)))
+    assert results == ["结果"] * 5 and len(calls) == 1
+    assert flight.stats()["coalesced"] == 4
+    
+    # 异常会传给所有等待方
+    def failing_call():
+        raise RuntimeError("上游错误")
+    try:
+        flight.do("error", failing_call)
+        assert False, "应抛出异常"
+    except RuntimeError:
+        pass
+    
+    # 异步：接入LLM客户端后，相同输入并发请求只调用一次上游
+    client = LLMClient()
+    fake = _SlowAsyncCompletions(delay=0.2)
+    client.router = _fake_router(async_client=SimpleNamespace(chat=SimpleNamespace(completions=fake)))
+    
+    async def burst():
+        return await asyncio.gather(*[
+            client.agenerate_response("你好", PersonalityType.QUIET) for _ in range(8)
+        ])
+    
+    responses = asyncio.run(burst())
+    print(f"上游调用次数: {fake.calls}, 合并统计: {client.singleflight.stats()}")
+    assert fake.calls == 1 and set(responses) == {"回复1"}
+    assert client.singleflight.stats()["coalesced"] == 7
+
+def test_prompt_builder():
+    """测试按token预算组装提示词"""
+    print("\n=== 测试提示词token预算 ===")
+    
+    # 词表没有缓存在本地时不联网下载，使用估算计数
+    cache_dir = os.environ.pop("TIKTOKEN_CACHE_DIR", None)
+    try:
+        assert TokenCounter().backend == "estimate"
+        os.environ["TIKTOKEN_CACHE_DIR"] = tempfile.mkdtemp(prefix="pet_tiktoken_test_")
+        assert TokenCounter("p50k_base").backend == "estimate"
+    finally:
+        os.environ.pop("TIKTOKEN_CACHE_DIR", None)
+        if cache_dir is not None:
+            os.environ["TIKTOKEN_CACHE_DIR"] = cache_dir
+    
+    counter = TokenCounter("estimate")
+    assert counter.count("你好") == 2 and counter.count("hello world") == 4
+    assert counter.count(counter.truncate("一二三四五六七八九十", 4)) <= 4
+    
+    builder = PromptBuilder(counter, token_budget=120)
+    history = [{"user_input": f"第{i}条消息" * 3, "pet_response": f"第{i}条回复" * 3} for i in range(20)]
+    prompt = builder.build("你是一只电子宠物。", "你好", history)
+    print(f"提示词token数: {prompt.prompt_tokens}, 历史消息: {prompt.history_turns}条")
+    
+    # 不超过预算，历史从最近的开始保留，且以用户消息开头
+    assert prompt.prompt_tokens <= 120 and 0 < prompt.history_turns < 40
+    assert prompt.messages[0]["role"] == "system" and prompt.messages[1]["role"] == "user"
+    assert prompt.messages[-2]["content"] == history[-1]["pet_response"]
+    assert prompt.messages[-1] == {"role": "user", "content": "你好"}
+    
+    # 工具信息过长时截断，当前输入必定保留
+    prompt = builder.build("你是一只电子宠物。", "几点了", history, tool_context="时间" * 200)
+    assert prompt.truncated and prompt.history_turns == 0 and prompt.prompt_tokens <= 120
+    assert prompt.messages[-1]["content"].startswith("几点了\n\n工具信息：时间")
+    
+    # LLM客户端使用预算组装，并记录每次调用的token数
+    client = LLMClient()
+    client.prompt_builder = PromptBuilder(counter, token_budget=200)
+    messages = client._build_messages("你好", PersonalityType.QUIET, history)
+    stats = client.prompt_builder.stats()
+    print(f"统计: {stats}")
+    assert stats["calls"] == 1 and stats["max_prompt_tokens"] <= 200
+    assert sum(1 for msg in messages if msg["content"] == "你好") == 1
+
+def test_mock_llm_server():
+    """测试本地模拟LLM服务（通过DEEPSEEK_BASE_URL接入，不需要真实API密钥）"""
+    print("\n=== 测试本地模拟LLM服务 ===")
+    
+    # 延迟分布
+    rng = random.Random(0)
+    assert parse_latency("fixed:0.05")(rng) == 0.05
+    assert all(0.02 <= parse_latency("uniform:0.02,0.08")(rng) <= 0.08 for _ in range(100))
+    spikes = [parse_latency("spike:0.01,0.5,1.0")(rng) for _ in range(200)]
+    assert set(spikes) == {0.01, 1.0}
+    
+    with MockLLMServer(latency="fixed:0.01", tokens_per_second=500, reply="喵~主人好") as server:
+        saved = {name: os.environ.get(name) for name in ("DEEPSEEK_API_KEY", "DEEPSEEK_BASE_URL", "LLM_CACHE_SIZE")}
+        os.environ.update({"DEEPSEEK_API_KEY": "mock", "DEEPSEEK_BASE_URL": server.url, "LLM_CACHE_SIZE": "0"})
+        try:
+            client = LLMClient()
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+        client.semantic_cache = SemanticCache(max_entries_per_personality=0)
+        
+        assert client.is_available() and client.current_provider() == "deepseek"
+        assert client.generate_response("你好", PersonalityType.PLAYFUL) == "喵~主人好"
+        
+        async def run_async():
+            response = await client.agenerate_response("在吗", PersonalityType.QUIET)
+            chunks = [chunk async for chunk in client.astream_response("摸摸头", PersonalityType.CLINGY)]
+            await client.aclose()
+            return response, chunks
+        
+        response, chunks = asyncio.run(run_async())
+        print(f"异步: {response}, 流式片段: {chunks}")
+        assert response == "喵~主人好"
+        assert len(chunks) > 1 and "".join(chunks) == "喵~主人好"
+        assert server.calls == 3
+    
+    # 错误率：失败的请求使用备用回复
+    with MockLLMServer(error_rate=1.0, error_status=429) as server:
+        client = LLMClient()
+        client.router = ProviderRouter([client._create_endpoint("mock", "mock", "mock-model", server.url)])
+        response = client.generate_response("你好", PersonalityType.COLD)
+        print(f"错误时的回复: {response}")
+        assert server.failures == 1 and client.router.status()[0]["failures"] == 1
+
 def test_api_endpoints():
     """测试API端点"""
     print("\n=== 测试API端点 ===")
@@ -76,6 +375,25 @@ if __name__ == "__main__":
     # 测试LLM客户端
     test_llm_client()
     
+    # 测试异步LLM客户端
+    test_async_llm_client()
+    
+    # 测试响应缓存
+    test_response_cache()
+    
+    # 测试语义缓存
+    test_semantic_cache()
+    test_semantic_cache_ttl_variants_and_context()
+    
+    # 测试请求合并
+    test_singleflight()
+    
+    # 测试提示词token预算
+    test_prompt_builder()
+    
+    # 测试本地模拟LLM服务
+    test_mock_llm_server()
+    
     # 测试API端点
     test_api_endpoints()
     
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+LLM请求调度测试脚本
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from llm_scheduler import (
+    LLMScheduler, PRIORITY_GREETING, PRIORITY_INTERACTIVE, PRIORITY_PROACTIVE
+)
+
+def test_max_in_flight():
+    """测试并发上限"""
+    print("\n=== 测试并发上限 ===")
+
+    scheduler = LLMScheduler(max_in_flight=2)
+    lock = threading.Lock()
+    running, peak = 0, 0
+
+    def job(i: int):
+        nonlocal running, peak
+        with scheduler.slot(PRIORITY_INTERACTIVE, session=i % 3):
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.02)
+            with lock:
+                running -= 1
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(job, range(16)))
+
+    stats = scheduler.stats()
+    print(f"最大并发: {peak}, 统计: {stats}")
+    assert peak == 2
+    assert stats["in_flight"] == 0 and stats["queued"] == 0
+    assert stats["classes"][PRIORITY_INTERACTIVE]["admitted"] == 16
+    assert stats["classes"][PRIORITY_INTERACTIVE]["max_queued"] > 0
+
+async def _enqueue_in_order(scheduler: LLMScheduler, requests: list, order: list) -> list:
+    """按顺序入队（每个请求入队后再创建下一个），返回任务列表"""
+    async def job(label: str, priority: str, session):
+        async with scheduler.aslot(priority, session):
+            order.append(label)
+            await asyncio.sleep(0)
+
+    tasks = []
+    for label, priority, session in requests:
+        tasks.append(asyncio.create_task(job(label, priority, session)))
+        await asyncio.sleep(0)
+    return tasks
+
+def test_priority_order():
+    """测试优先级：对话 > 问候 > 后台主动生成"""
+    print("\n=== 测试优先级 ===")
+
+    async def run():
+        scheduler = LLMScheduler(max_in_flight=1)
+        order = []
+        await scheduler.aacquire()  # 占住唯一的名额
+        tasks = await _enqueue_in_order(scheduler, [
+            ("proactive", PRIORITY_PROACTIVE, None),
+            ("greeting", PRIORITY_GREETING, None),
+            ("chat", PRIORITY_INTERACTIVE, None),
+        ], order)
+        depth = scheduler.stats()["queued"]
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order, depth, scheduler.stats()
+
+    order, depth, stats = asyncio.run(run())
+    print(f"执行顺序: {order}, 队列深度: {depth}")
+    assert order == ["chat", "greeting", "proactive"]
+    assert depth == 3
+    assert stats["classes"][PRIORITY_PROACTIVE]["avg_wait_ms"] > 0
+
+def test_session_fairness():
+    """测试同一优先级内各会话轮流执行"""
+    print("\n=== 测试会话公平 ===")
+
+    async def run():
+        scheduler = LLMScheduler(max_in_flight=1)
+        order = []
+        await scheduler.aacquire()
+        # 宠物1连续发了3条，宠物2随后发了1条
+        tasks = await _enqueue_in_order(scheduler, [
+            ("pet1-a", PRIORITY_INTERACTIVE, 1),
+            ("pet1-b", PRIORITY_INTERACTIVE, 1),
+            ("pet1-c", PRIORITY_INTERACTIVE, 1),
+            ("pet2-a", PRIORITY_INTERACTIVE, 2),
+        ], order)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    order = asyncio.run(run())
+    print(f"执行顺序: {order}")
+    assert order == ["pet1-a", "pet2-a", "pet1-b", "pet1-c"]
+
+def test_cancelled_waiter():
+    """测试排队中被取消的请求不占用名额"""
+    print("\n=== 测试取消排队 ===")
+
+    async def run():
+        scheduler = LLMScheduler(max_in_flight=1)
+        order = []
+        await scheduler.aacquire()
+        tasks = await _enqueue_in_order(scheduler, [
+            ("cancelled", PRIORITY_INTERACTIVE, None),
+            ("next", PRIORITY_GREETING, None),
+        ], order)
+        tasks[0].cancel()
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        # 名额空出后，新请求可以直接执行
+        await asyncio.wait_for(scheduler.aacquire(), timeout=1)
+        scheduler.release()
+        return order, scheduler.stats()
+
+    order, stats = asyncio.run(run())
+    print(f"执行顺序: {order}, 统计: {stats}")
+    assert order == ["next"]
+    assert stats["in_flight"] == 0 and stats["queued"] == 0
+
+if __name__ == "__main__":
+    print("开始LLM调度测试...")
+
+    # 测试并发上限
+    test_max_in_flight()
+
+    # 测试优先级
+    test_priority_order()
+
+    # 测试会话公平
+    test_session_fairness()
+
+    # 测试取消排队
+    test_cancelled_waiter()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+日志配置测试脚本
+"""
+
+import io
+import json
+import logging
+import random
+from log_config import DebugSampler, JsonFormatter, setup_logging, shutdown_logging
+
+def test_json_logging_via_queue():
+    """测试日志经队列由后台线程以JSON格式输出"""
+    print("\n=== 测试JSON日志 ===")
+
+    stream = io.StringIO()
+    root = logging.getLogger()
+    saved_level = root.level
+    listener = setup_logging(level="INFO", json_format=True, debug_sample_rate=1.0, stream=stream)
+    try:
+        logger = logging.getLogger("test_log_config")
+        logger.info("工具执行完成", extra={"tool": "get_time", "elapsed_ms": 1.5})
+        logger.debug("低于LOG_LEVEL，不输出")
+        try:
+            raise ValueError("出错了")
+        except ValueError:
+            logger.exception("处理失败")
+    finally:
+        # 停止时写完队列中剩余的日志
+        shutdown_logging()
+        root.setLevel(saved_level)
+
+    assert listener._thread is None
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    print(f"日志: {records}")
+    assert [record["message"] for record in records] == ["工具执行完成", "处理失败"]
+    assert records[0]["level"] == "INFO" and records[0]["logger"] == "test_log_config"
+    assert records[0]["tool"] == "get_time" and records[0]["elapsed_ms"] == 1.5
+    assert "ValueError: 出错了" in records[1]["exc_info"]
+
+def test_debug_sampling():
+    """测试DEBUG日志采样，INFO及以上不采样"""
+    print("\n=== 测试DEBUG日志采样 ===")
+
+    sampler = DebugSampler(rate=0.1, rng=random.Random(0))
+    debug = logging.LogRecord("t", logging.DEBUG, __file__, 0, "debug", (), None)
+    info = logging.LogRecord("t", logging.INFO, __file__, 0, "info", (), None)
+
+    kept = sum(sampler.filter(debug) for _ in range(10000))
+    print(f"DEBUG保留: {kept}/10000")
+    assert 800 < kept < 1200
+    assert all(sampler.filter(info) for _ in range(100))
+    assert all(DebugSampler(rate=1.0).filter(debug) for _ in range(100))
+
+    # 非ASCII字符原样输出
+    assert json.loads(JsonFormatter().format(info))["message"] == "info"
+
+if __name__ == "__main__":
+    print("开始日志配置测试...")
+
+    # 测试JSON日志
+    test_json_logging_via_queue()
+
+    # 测试DEBUG日志采样
+    test_debug_sampling()
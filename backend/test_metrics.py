@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+LLM调用指标测试脚本（使用本地模拟LLM服务，不需要API密钥）
+"""
+
+import asyncio
+import llm_client
+from llm_client import LLMClient, PersonalityType
+from metrics import MetricsRegistry
+from mock_llm_server import MockLLMServer
+from provider_router import ProviderRouter
+from response_cache import ResponseCache
+from semantic_cache import SemanticCache
+
+def _mock_client(server: MockLLMServer, name: str) -> LLMClient:
+    """路由到模拟服务的LLM客户端（关闭缓存）"""
+    client = LLMClient()
+    client.response_cache = ResponseCache(max_entries=0)
+    client.semantic_cache = SemanticCache(max_entries_per_personality=0)
+    client.router = ProviderRouter([client._create_endpoint(name, "mock", "mock-model", server.url)])
+    return client
+
+def test_registry():
+    """测试计数器、直方图和Prometheus文本格式"""
+    print("\n=== 测试指标注册表 ===")
+
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "请求数", ("outcome",))
+    latency = registry.histogram("latency_seconds", "耗时", ("outcome",), buckets=(0.1, 0.5, 1.0))
+
+    # 同名重复注册返回同一个实例，类型不同则报错
+    assert registry.counter("requests_total", "请求数", ("outcome",)) is requests
+    try:
+        registry.histogram("requests_total", "请求数")
+        assert False, "类型冲突应报错"
+    except ValueError:
+        pass
+
+    requests.inc(outcome="success")
+    requests.inc(2, outcome="success")
+    for value in (0.05, 0.2, 0.3, 0.4, 2.0):
+        latency.observe(value, outcome="success")
+    assert requests.value(outcome="success") == 3
+
+    # 缺少标签时报错
+    try:
+        latency.observe(0.1)
+        assert False, "缺少标签应报错"
+    except ValueError:
+        pass
+
+    # 分位数按桶内线性插值估算
+    assert 0.1 < latency.quantile(0.5, outcome="success") <= 0.5
+    assert latency.quantile(0.99, outcome="success") == 1.0  # 落在+Inf桶，取下界
+    assert latency.quantile(0.5, outcome="error") is None
+
+    text = registry.render()
+    print(text)
+    assert 'requests_total{outcome="success"} 3' in text
+    assert 'latency_seconds_bucket{outcome="success",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{outcome="success",le="0.5"} 4' in text
+    assert 'latency_seconds_bucket{outcome="success",le="+Inf"} 5' in text
+    assert 'latency_seconds_count{outcome="success"} 5' in text
+
+    snapshot = registry.snapshot()["latency_seconds"]
+    assert snapshot["type"] == "histogram" and snapshot["series"][0]["count"] == 5
+
+def test_llm_call_metrics():
+    """测试LLM调用记录耗时、token用量、提供商、性格和结果"""
+    print("\n=== 测试LLM调用指标 ===")
+
+    call_duration = llm_client.LLM_CALL_DURATION
+    responses = llm_client.LLM_RESPONSES
+
+    with MockLLMServer(latency="fixed:0.02", reply="喵~主人好") as server:
+        client = _mock_client(server, "metrics-ok")
+        client.generate_response("你好", PersonalityType.PLAYFUL)
+
+        async def run_async():
+            await client.agenerate_response("在吗", PersonalityType.PLAYFUL)
+            chunks = [chunk async for chunk in client.astream_response("摸摸头", PersonalityType.PLAYFUL)]
+            await client.aclose()
+            return chunks
+
+        asyncio.run(run_async())
+
+    labels = {"provider": "metrics-ok", "purpose": "reply", "personality": PersonalityType.PLAYFUL}
+    durations = {item["labels"]["outcome"]: item for item in call_duration.snapshot()
+                 if item["labels"]["provider"] == "metrics-ok"}
+    print(f"调用耗时: {durations}")
+    assert durations["success"]["count"] == 3
+    assert durations["success"]["avg"] >= 0.02
+
+    # 非流式使用服务端返回的usage，流式按提示词和输出估算
+    prompt_tokens = llm_client.LLM_PROMPT_TOKENS.snapshot()
+    completion = [item for item in llm_client.LLM_COMPLETION_TOKENS.snapshot() if item["labels"] == labels]
+    assert any(item["labels"] == labels and item["count"] == 3 for item in prompt_tokens)
+    assert completion[0]["count"] == 3 and completion[0]["sum"] > 0
+
+    # 所有提供商都失败时记录为fallback
+    before = responses.value(personality=PersonalityType.COLD, outcome="fallback")
+    with MockLLMServer(error_rate=1.0) as server:
+        client = _mock_client(server, "metrics-down")
+        client.generate_response("你好", PersonalityType.COLD)
+    assert responses.value(personality=PersonalityType.COLD, outcome="fallback") == before + 1
+    errors = [item for item in call_duration.snapshot() if item["labels"]["provider"] == "metrics-down"]
+    assert errors[0]["labels"]["outcome"] == "error" and errors[0]["count"] == 1
+
+    # 超时单独统计
+    before = responses.value(personality=PersonalityType.QUIET, outcome="timeout")
+    with MockLLMServer(latency="fixed:0.5") as server:
+        client = _mock_client(server, "metrics-slow")
+        endpoint = client.router.providers[0]
+        endpoint.client = endpoint.client.with_options(timeout=0.05)
+        client.generate_response("你好", PersonalityType.QUIET)
+    assert responses.value(personality=PersonalityType.QUIET, outcome="timeout") == before + 1
+    timeouts = [item for item in call_duration.snapshot() if item["labels"]["provider"] == "metrics-slow"]
+    assert timeouts[0]["labels"]["outcome"] == "timeout"
+
+    # 摘要调用按用途单独统计，不冒充某个性格
+    with MockLLMServer(reply="主人喜欢猫") as server:
+        client = _mock_client(server, "metrics-summary")
+        assert client.summarize_conversation(None, [{"user_input": "我喜欢猫", "pet_response": "喵"}], 50) == "主人喜欢猫"
+    summaries = [item for item in call_duration.snapshot() if item["labels"]["provider"] == "metrics-summary"]
+    assert [item["labels"] for item in summaries] == [
+        {"provider": "metrics-summary", "purpose": "summary", "personality": "", "outcome": "success"}
+    ]
+
+if __name__ == "__main__":
+    print("开始LLM指标测试...")
+
+    # 测试指标注册表
+    test_registry()
+
+    # 测试LLM调用指标
+    test_llm_call_metrics()
+
+    print("测试完成！")
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+LLM提供商路由和熔断测试脚本（使用本地模拟LLM服务，不需要API密钥）
+"""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+from llm_client import LLMClient, PersonalityType
+from mock_llm_server import MockLLMServer
+from provider_router import CircuitBreaker, ProviderEndpoint, ProviderRouter
+from response_cache import ResponseCache
+from retry_budget import RetryBudget
+from semantic_cache import SemanticCache
+
+def _routed_client(*servers, failure_threshold: int = 3, reset_timeout: float = 30) -> LLMClient:
+    """路由到本地模拟LLM服务的LLM客户端（关闭缓存，每次都真正发请求）"""
+    client = LLMClient()
+    client.response_cache = ResponseCache(max_entries=0)
+    client.semantic_cache = SemanticCache(max_entries_per_personality=0)
+    client.router = ProviderRouter(
+        [
+            client._create_endpoint(f"stub{i}", "test-key", "stub-model", server.url)
+            for i, server in enumerate(servers)
+        ],
+        failure_threshold=failure_threshold,
+        reset_timeout=reset_timeout
+    )
+    return client
+
+def test_circuit_breaker():
+    """测试熔断器状态转换"""
+    print("\n=== 测试熔断器 ===")
+
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow_request()
+
+    # 冷却后半开，试探失败立即重新打开
+    time.sleep(0.15)
+    assert breaker.state == CircuitBreaker.HALF_OPEN and breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # 再次冷却后只放行一个试探请求，试探成功则关闭
+    time.sleep(0.15)
+    assert breaker.available() and breaker.allow_request()
+    assert not breaker.available() and not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    print("熔断器状态转换正确")
+
+def test_half_open_single_probe():
+    """测试半开状态下并发请求只有一个试探发往恢复中的提供商，其余被拒绝（使用备用回复）"""
+    print("\n=== 测试半开单一试探 ===")
+
+    recovering = MockLLMServer(reply="恢复了", error_rate=1.0, latency=0.3).start()
+    try:
+        client = _routed_client(recovering, failure_threshold=1, reset_timeout=0.2)
+        assert client.generate_response("你好", PersonalityType.QUIET) != "恢复了"
+        assert client.router.status()[0]["circuit"] == CircuitBreaker.OPEN
+
+        # 冷却后半开，服务已恢复；试探请求较慢，期间的并发请求不应再发往它
+        recovering.error_rate = 0.0
+        time.sleep(0.25)
+        calls_before = recovering.calls
+        responses = []
+
+        def send(i):
+            responses.append(client.generate_response(f"在吗{i}", PersonalityType.QUIET))
+
+        threads = [threading.Thread(target=send, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f"回复: {responses}")
+        assert recovering.calls - calls_before == 1
+        assert len(responses) == 8 and responses.count("恢复了") == 1
+
+        # 试探成功后关闭，之后的请求正常发往它
+        assert client.router.status()[0]["circuit"] == CircuitBreaker.CLOSED
+        assert client.generate_response("你好", PersonalityType.QUIET) == "恢复了"
+    finally:
+        recovering.stop()
+
+class _FakeStream:
+    """逐段产出文本的假流式响应，记录是否被关闭"""
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for part in self.parts:
+            await asyncio.sleep(0)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=part))])
+
+    async def close(self):
+        self.closed = True
+
+def test_stream_disconnect_releases_probe():
+    """测试流式输出中途客户端断开：关闭上游流，归还半开试探名额，不记录成功或失败"""
+    print("\n=== 测试流式断开 ===")
+
+    streams = []
+
+    async def create(**kwargs):
+        streams.append(_FakeStream(["喵", "喵", "喵"]))
+        return streams[-1]
+
+    client = LLMClient()
+    client.response_cache = ResponseCache(max_entries=0)
+    client.semantic_cache = SemanticCache(max_entries_per_personality=0)
+    provider = ProviderEndpoint(
+        "fake", "fake-model", async_client=SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    )
+    client.router = ProviderRouter([provider], failure_threshold=1, reset_timeout=30)
+
+    # 熔断后进入半开状态
+    client.router.record(provider, 0.1, ok=False)
+    breaker = client.router._breakers["fake"]
+    breaker.opened_at -= 30
+
+    async def disconnect_after_first_chunk():
+        generator = client.astream_response("你好", PersonalityType.PLAYFUL)
+        first = await generator.__anext__()
+        await generator.aclose()
+        return first
+
+    async def cancel_while_streaming():
+        async def consume():
+            async for _ in client.astream_response("你好", PersonalityType.PLAYFUL):
+                await asyncio.sleep(10)
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    assert asyncio.run(disconnect_after_first_chunk()) == "喵"
+    assert asyncio.run(cancel_while_streaming()) is None
+    print(f"上游流: {[stream.closed for stream in streams]}, 熔断器: {breaker.state}")
+    assert len(streams) == 2 and all(stream.closed for stream in streams)
+    # 两次断开都归还了试探名额，也没有记录结果
+    assert breaker.state == CircuitBreaker.HALF_OPEN and breaker.available()
+    assert client.router.status()[0]["calls"] == 1
+
+def test_latency_routing():
+    """测试按延迟选择提供商"""
+    print("\n=== 测试按延迟路由 ===")
+
+    slow, fast = ProviderEndpoint("slow", "m"), ProviderEndpoint("fast", "m")
+    router = ProviderRouter([slow, fast])
+
+    # 没有样本时保持配置顺序
+    assert [p.name for p in router.candidates()] == ["slow", "fast"]
+
+    for _ in range(5):
+        router.record(slow, 0.2, ok=True)
+        router.record(fast, 0.1, ok=True)
+    assert [p.name for p in router.candidates()] == ["fast", "slow"]
+
+    # 错误率上升后，快但不稳定的提供商排到后面
+    for _ in range(2):
+        router.record(fast, 0.1, ok=False)
+    print(f"状态: {router.status()}")
+    assert [p.name for p in router.candidates()] == ["slow", "fast"]
+
+def test_failover_with_stub_servers():
+    """测试故障切换：主提供商返回500时切到备用，之后优先使用健康的提供商"""
+    print("\n=== 测试故障切换（本地模拟LLM服务）===")
+
+    broken = MockLLMServer(reply="坏掉的", error_rate=1.0).start()
+    healthy = MockLLMServer(reply="备用回复").start()
+    try:
+        client = _routed_client(broken, healthy, failure_threshold=1)
+
+        responses = [client.generate_response(f"你好{i}", PersonalityType.PLAYFUL) for i in range(5)]
+        status = {item["name"]: item for item in client.router.status()}
+        print(f"回复: {responses}")
+        print(f"状态: {status}")
+
+        assert responses == ["备用回复"] * 5
+        # 失败后熔断，之后的请求不再发往主提供商
+        assert broken.calls == 1
+        assert status["stub0"]["circuit"] == CircuitBreaker.OPEN
+        assert status["stub1"]["circuit"] == CircuitBreaker.CLOSED and status["stub1"]["p50_ms"] is not None
+        assert client.current_provider() == "stub1" and client.is_available()
+
+        # 异步和流式路径同样走路由（异步连接池绑定事件循环，在同一个循环里完成）
+        async def run_async():
+            response = await client.agenerate_response("在吗", PersonalityType.QUIET)
+            chunks = [chunk async for chunk in client.astream_response("在吗", PersonalityType.QUIET)]
+            await client.aclose()
+            return response, "".join(chunks)
+
+        assert asyncio.run(run_async()) == ("备用回复", "备用回复")
+        assert broken.calls == 1
+    finally:
+        broken.stop()
+        healthy.stop()
+
+def test_all_providers_down():
+    """测试所有提供商都熔断时使用备用回复"""
+    print("\n=== 测试全部不可用 ===")
+
+    broken = MockLLMServer(reply="坏掉的", error_rate=1.0).start()
+    try:
+        client = _routed_client(broken, failure_threshold=1, reset_timeout=0.2)
+        response = client.generate_response("你好", PersonalityType.COLD)
+        print(f"备用回复: {response}")
+        assert response != "坏掉的" and broken.calls == 1
+        assert not client.is_available() and client.current_provider() == "none"
+
+        # 冷却后半开，服务恢复则重新可用
+        broken.error_rate = 0.0
+        time.sleep(0.25)
+        assert client.is_available()
+        assert client.generate_response("你好", PersonalityType.COLD) == "坏掉的"
+        assert client.router.status()[0]["circuit"] == CircuitBreaker.CLOSED
+    finally:
+        broken.stop()
+
+def test_retry_budget():
+    """测试重试预算耗尽后拒绝重试"""
+    print("\n=== 测试重试预算 ===")
+
+    budget = RetryBudget(ratio=0.5, max_tokens=1, backoff_base=0.1, backoff_max=0.3)
+    assert budget.acquire_retry()
+    assert not budget.acquire_hedge()
+
+    # 每两个正常请求攒够一次重试
+    budget.deposit()
+    assert not budget.acquire_retry()
+    budget.deposit()
+    assert budget.acquire_retry()
+    print(f"预算统计: {budget.stats()}")
+    assert budget.stats()["rejected"] == 2
+
+    # 退避时间有上限且带随机抖动
+    delays = [budget.backoff(attempt) for attempt in range(1, 10) for _ in range(20)]
+    assert all(0 <= delay <= 0.3 for delay in delays) and len(set(delays)) > 1
+
+    # 故障期间只有预算内的请求会重试到备用提供商
+    broken = MockLLMServer(reply="坏掉的", error_rate=1.0).start()
+    backup = MockLLMServer(reply="备用回复", error_rate=1.0).start()
+    try:
+        client = _routed_client(broken, backup, failure_threshold=100)
+        client.retry_budget = RetryBudget(ratio=0.1, max_tokens=2, backoff_base=0.01)
+        for i in range(10):
+            client.generate_response(f"你好{i}", PersonalityType.PLAYFUL)
+        print(f"主/备调用次数: {broken.calls}/{backup.calls}, 预算: {client.retry_budget.stats()}")
+        assert broken.calls + backup.calls == 10 + client.retry_budget.retries
+        assert client.retry_budget.retries == 2
+    finally:
+        broken.stop()
+        backup.stop()
+
+def test_hedged_request():
+    """测试对冲请求：主请求卡住时由对冲请求先返回"""
+    print("\n=== 测试对冲请求 ===")
+
+    server = MockLLMServer(reply="回复").start()
+    try:
+        client = _routed_client(server)
+        client.hedge_enabled = True
+        provider = client.router.providers[0]
+        for _ in range(20):
+            client.router.record(provider, 0.1, ok=True)
+        assert client._hedge_delay(provider) == 0.1
+
+        # 同步：第一个请求卡住1秒，对冲请求立即返回
+        server.delays = [1.0]
+        start = time.perf_counter()
+        assert client.generate_response("你好", PersonalityType.QUIET) == "回复"
+        sync_elapsed = time.perf_counter() - start
+
+        # 请求足够快时不会触发对冲
+        assert client.generate_response("晚安", PersonalityType.QUIET) == "回复"
+        assert client.retry_budget.hedges == 1
+
+        # 异步：同上，落后的请求被取消
+        async def run_async():
+            server.delays = [1.0]
+            start = time.perf_counter()
+            response = await client.agenerate_response("在吗", PersonalityType.QUIET)
+            elapsed = time.perf_counter() - start
+            await client.aclose()
+            return response, elapsed
+
+        response, async_elapsed = asyncio.run(run_async())
+        assert response == "回复"
+
+        print(f"耗时: 同步{sync_elapsed * 1000:.0f}ms, 异步{async_elapsed * 1000:.0f}ms, "
+              f"预算: {client.retry_budget.stats()}")
+        assert sync_elapsed < 0.5 and async_elapsed < 0.5
+        assert client.retry_budget.hedges == 2 and client.retry_budget.hedge_wins == 2
+
+    finally:
+        server.stop()
+
+def test_retry_skips_hedged_provider():
+    """测试主请求和对冲请求都失败后，重试不再发往对冲已经试过的提供商"""
+    print("\n=== 测试对冲后重试 ===")
+
+    primary = MockLLMServer(error_rate=1.0, latency=0.2).start()
+    backup = MockLLMServer(error_rate=1.0, latency=0.2).start()
+    try:
+        client = _routed_client(primary, backup)
+        client.hedge_enabled = True
+        client.hedge_default_delay = 0.05
+        client.retry_budget = RetryBudget(max_tokens=100, backoff_base=0)
+
+        client.generate_response("你好", PersonalityType.QUIET)
+
+        async def run_async():
+            await client.agenerate_response("在吗", PersonalityType.QUIET)
+            await client.aclose()
+
+        asyncio.run(run_async())
+        print(f"调用次数: 主{primary.calls}, 备用{backup.calls}, 预算: {client.retry_budget.stats()}")
+        # 同步和异步各一次：主请求和对冲请求各发一次，没有重复重试
+        assert primary.calls == 2 and backup.calls == 2
+        assert client.retry_budget.stats()["retries"] == 0
+    finally:
+        primary.stop()
+        backup.stop()
+
+if __name__ == "__main__":
+    print("开始提供商路由测试...")
+
+    # 测试熔断器
+    test_circuit_breaker()
+
+    # 测试半开单一试探
+    test_half_open_single_probe()
+
+    # 测试流式断开
+    test_stream_disconnect_releases_probe()
+
+    # 测试按延迟路由
+    test_latency_routing()
+
+    # 测试故障切换
+    test_failover_with_stub_servers()
+
+    # 测试全部不可用
+    test_all_providers_down()
+
+    # 测试重试预算
+    test_retry_budget()
+
+    # 测试对冲请求
+    test_hedged_request()
+
+    # 测试对冲后重试
+    test_retry_skips_hedged_provider()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+长期记忆（滚动摘要）测试脚本
+"""
+
+import asyncio
+import os
+import tempfile
+from conversation_writer import ConversationWriter
+from db_pool import ConnectionPool
+from langchain_core.messages import AIMessage, HumanMessage
+from llm_client import LLMClient, PersonalityType
+from pet_agent import PetAgent
+from prompt_builder import PromptBuilder, TokenCounter
+from summary_memory import SummaryMemory
+
+def _pool_with_conversations(turns: int) -> ConnectionPool:
+    """临时数据库，宠物1已有若干轮对话"""
+    pool = ConnectionPool(os.path.join(tempfile.mkdtemp(prefix="pet_memory_test_"), "pet.db"))
+    with pool.transaction() as conn:
+        conn.execute('''
+            CREATE TABLE conversations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                pet_id INTEGER,
+                user_input TEXT,
+                pet_response TEXT,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+    _add_turns(pool, range(turns))
+    return pool
+
+def _add_turns(pool: ConnectionPool, indexes):
+    pool.executemany(
+        "INSERT INTO conversations (pet_id, user_input, pet_response) VALUES (1, ?, ?)",
+        [(f"消息{i}", f"回复{i}") for i in indexes]
+    )
+
+def test_rolling_summary():
+    """测试每N轮在后台把较早的对话折叠进摘要，最近几轮保留原文"""
+    print("\n=== 测试滚动摘要 ===")
+
+    pool = _pool_with_conversations(10)
+    calls = []
+
+    def summarize(previous, turns, max_chars):
+        calls.append((previous, [turn["user_input"] for turn in turns]))
+        return ((previous or "") + "|" + ",".join(turn["user_input"] for turn in turns)) * 10
+
+    memory = SummaryMemory(pool, summarize, every_n_turns=5, recent_turns=3, max_summary_chars=40)
+
+    # 不满N轮不触发
+    assert all(memory.record_turn(1) is None for _ in range(4))
+    memory.record_turn(1).result()
+    print(f"摘要: {memory.summary(1)}, 统计: {memory.stats()}")
+    assert calls[0] == (None, [f"消息{i}" for i in range(7)])
+    assert len(memory.summary(1)) == 40  # 截断到字数上限
+
+    # 最近3轮原文（按时间正序）
+    context = memory.context(1)
+    assert [turn["user_input"] for turn in context.recent_turns] == ["消息7", "消息8", "消息9"]
+
+    # 再来5轮：只折叠新增且不在最近3轮内的对话，并带上旧摘要
+    first_summary = memory.summary(1)
+    _add_turns(pool, range(10, 15))
+    for _ in range(5):
+        future = memory.record_turn(1)
+    future.result()
+    assert calls[1][0] == first_summary
+    assert calls[1][1] == [f"消息{i}" for i in range(7, 12)]
+
+    # 重启后从数据库恢复
+    restored = SummaryMemory(pool, summarize, every_n_turns=5, recent_turns=3, max_summary_chars=40)
+    assert restored.summary(1) == memory.summary(1)
+    assert restored.stats()["pets"] == 1
+    memory.close()
+    pool.close_all()
+
+def test_flush_pending_before_summary():
+    """测试摘要前先写入后写队列中的对话，最近几轮的窗口包含尚未落库的记录"""
+    print("\n=== 测试摘要前刷新后写队列 ===")
+
+    pool = _pool_with_conversations(5)
+    writer = ConversationWriter(pool, batch_size=1000, flush_interval=60)
+    for i in range(5, 8):
+        writer.submit(1, f"消息{i}", f"回复{i}")
+    folded = []
+
+    def summarize(previous, turns, max_chars):
+        folded.extend(turn["user_input"] for turn in turns)
+        return "摘要"
+
+    flushed = []
+
+    def flush(pet_id):
+        flushed.append(pet_id)
+        writer.flush()
+
+    memory = SummaryMemory(pool, summarize, every_n_turns=1, recent_turns=3, flush=flush)
+    assert memory.update(1)
+    print(f"折叠: {folded}")
+    assert flushed == [1] and writer.pending_count() == 0
+    # 消息5~7是最近3轮，不折叠；之前的全部折叠
+    assert folded == [f"消息{i}" for i in range(5)]
+    writer.close()
+    pool.close_all()
+
+def test_acontext_reads_memory_first():
+    """测试异步读取记忆时摘要命中内存不查数据库，未命中时通过传入的执行器查询"""
+    print("\n=== 测试异步读取记忆 ===")
+
+    pool = _pool_with_conversations(4)
+    calls = []
+
+    async def run_in_executor(func, *args):
+        calls.append(func.__name__)
+        return func(*args)
+
+    async def ahistory(pet_id, limit):
+        calls.append("ahistory")
+        return [{"user_input": f"缓存{i}"} for i in range(limit)]
+
+    memory = SummaryMemory(
+        pool, lambda previous, turns, max_chars: "主人叫小明", recent_turns=2,
+        run_in_executor=run_in_executor, ahistory=ahistory
+    )
+
+    # 第一次从数据库加载摘要
+    context = asyncio.run(memory.acontext(1))
+    assert context.summary is None and calls == ["_load_summary", "ahistory"]
+    assert [turn["user_input"] for turn in context.recent_turns] == ["缓存1", "缓存0"]
+
+    # 摘要已在内存中，不再查数据库
+    memory.update(1)
+    calls.clear()
+    context = asyncio.run(memory.acontext(1))
+    assert context.summary == "主人叫小明" and calls == ["ahistory"]
+
+    # 没有异步history时把history放到执行器中执行
+    memory.ahistory = None
+    context = asyncio.run(memory.acontext(1))
+    assert calls[-1] == "_select_recent"
+    assert [turn["user_input"] for turn in context.recent_turns] == ["消息2", "消息3"]
+    pool.close_all()
+
+def test_memory_in_prompt():
+    """测试摘要按固定上限放进系统提示词，最近几轮作为历史消息"""
+    print("\n=== 测试记忆注入提示词 ===")
+
+    builder = PromptBuilder(TokenCounter("estimate"), token_budget=1024, memory_token_budget=20)
+    prompt = builder.build("你是一只猫", "还记得我吗", memory="主人喜欢吃鱼" * 20)
+    system = prompt.messages[0]["content"]
+    print(f"系统提示词: {system}")
+    assert system.startswith("你是一只猫") and "主人喜欢吃鱼" in system
+    assert builder.counter.count(system) <= builder.counter.count("你是一只猫\n\n你记得和主人之前的事：") + 20
+
+    # 没有LLM时摘要直接摘录原文
+    llm_client = LLMClient()
+    llm_client.router.providers.clear()
+    summary = llm_client.summarize_conversation("主人叫小明", [{"user_input": "我喜欢猫", "pet_response": "喵"}], 30)
+    assert summary == "主人叫小明；主人说“我喜欢猫”"
+
+    # Agent把最近几轮放进消息列表，摘要放进上下文
+    pool = _pool_with_conversations(3)
+    memory = SummaryMemory(pool, lambda previous, turns, max_chars: "主人叫小明", recent_turns=2)
+    memory.update(1)
+    agent = PetAgent(llm_client, memory=memory)
+    result = agent.invoke("还记得我吗", PersonalityType.QUIET, session=1)
+    print(f"消息: {[msg.content for msg in result['messages']]}")
+    assert result["context"]["memory"] == "主人叫小明"
+    assert isinstance(result["messages"][0], HumanMessage) and result["messages"][0].content == "消息1"
+    assert isinstance(result["messages"][3], AIMessage) and result["messages"][3].content == "回复2"
+    assert result["messages"][4].content == "还记得我吗"
+    pool.close_all()
+
+if __name__ == "__main__":
+    print("开始长期记忆测试...")
+
+    # 测试滚动摘要
+    test_rolling_summary()
+
+    # 测试摘要前刷新后写队列
+    test_flush_pending_before_summary()
+
+    # 测试异步读取记忆
+    test_acontext_reads_memory_first()
+
+    # 测试记忆注入提示词
+    test_memory_in_prompt()
@@ -34,6 +34,9 @@ def test_tools():
     health_result = tool_manager.execute_tool("get_health")
     print(f"健康工具: {health_result.message}")
     print(f"数据: {health_result.data}")
+    # 返回的是状态快照，修改它不影响工具内部状态
+    health_result.data["hunger"] = 0
+    assert tool_manager.execute_tool("get_health").data["hunger"] != 0
     
     # 测试喂食工具
     print("\n--- 测试喂食工具 ---")
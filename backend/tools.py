@@ -4,6 +4,7 @@
 
 import requests
 import json
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 from dataclasses import dataclass
@@ -143,6 +144,8 @@ class HealthTool:
     """健康工具"""
     
     def __init__(self):
+        # 工具可能被并发调用（例如同时喂食和玩耍），修改状态时加锁
+        self._lock = threading.Lock()
         self.health_status = {
             "hunger": 100,
             "thirst": 100,
@@ -154,55 +157,62 @@ class HealthTool:
     
     def get_health_status(self) -> ToolResult:
         """获取健康状态"""
+        with self._lock:
+            status = dict(self.health_status)
+        
         return ToolResult(
             success=True,
-            data=self.health_status,
-            message=f"健康状态：饥饿{self.health_status['hunger']}%，口渴{self.health_status['thirst']}%，快乐{self.health_status['happiness']}%，精力{self.health_status['energy']}%"
+            data=status,
+            message=f"健康状态：饥饿{status['hunger']}%，口渴{status['thirst']}%，快乐{status['happiness']}%，精力{status['energy']}%"
         )
     
     def feed_pet(self) -> ToolResult:
         """喂食宠物"""
-        self.health_status["hunger"] = min(100, self.health_status["hunger"] + 30)
-        self.health_status["happiness"] = min(100, self.health_status["happiness"] + 10)
-        self.health_status["last_feed"] = datetime.now().isoformat()
+        with self._lock:
+            self.health_status["hunger"] = min(100, self.health_status["hunger"] + 30)
+            self.health_status["happiness"] = min(100, self.health_status["happiness"] + 10)
+            self.health_status["last_feed"] = datetime.now().isoformat()
+            status = dict(self.health_status)
         
         return ToolResult(
             success=True,
-            data=self.health_status,
+            data=status,
             message="宠物吃饱了，很开心！"
         )
     
     def play_with_pet(self) -> ToolResult:
         """和宠物玩耍"""
-        self.health_status["happiness"] = min(100, self.health_status["happiness"] + 20)
-        self.health_status["energy"] = max(0, self.health_status["energy"] - 10)
-        self.health_status["last_play"] = datetime.now().isoformat()
+        with self._lock:
+            self.health_status["happiness"] = min(100, self.health_status["happiness"] + 20)
+            self.health_status["energy"] = max(0, self.health_status["energy"] - 10)
+            self.health_status["last_play"] = datetime.now().isoformat()
+            status = dict(self.health_status)
         
         return ToolResult(
             success=True,
-            data=self.health_status,
+            data=status,
             message="和宠物玩耍很开心！"
         )
     
     def update_health(self):
         """更新健康状态（随时间衰减）"""
         now = datetime.now()
-        
-        # 饥饿度随时间增加
-        if self.health_status["hunger"] < 100:
-            self.health_status["hunger"] = min(100, self.health_status["hunger"] + 1)
-        
-        # 口渴度随时间增加
-        if self.health_status["thirst"] < 100:
-            self.health_status["thirst"] = min(100, self.health_status["thirst"] + 1)
-        
-        # 快乐度随时间减少
-        if self.health_status["happiness"] > 0:
-            self.health_status["happiness"] = max(0, self.health_status["happiness"] - 0.5)
-        
-        # 精力随时间恢复
-        if self.health_status["energy"] < 100:
-            self.health_status["energy"] = min(100, self.health_status["energy"] + 0.5)
+        with self._lock:
+            # 饥饿度随时间增加
+            if self.health_status["hunger"] < 100:
+                self.health_status["hunger"] = min(100, self.health_status["hunger"] + 1)
+            
+            # 口渴度随时间增加
+            if self.health_status["thirst"] < 100:
+                self.health_status["thirst"] = min(100, self.health_status["thirst"] + 1)
+            
+            # 快乐度随时间减少
+            if self.health_status["happiness"] > 0:
+                self.health_status["happiness"] = max(0, self.health_status["happiness"] - 0.5)
+            
+            # 精力随时间恢复
+            if self.health_status["energy"] < 100:
+                self.health_status["energy"] = min(100, self.health_status["energy"] + 0.5)
 
 class ToolManager:
     """工具管理器"""